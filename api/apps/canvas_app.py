@@ -43,7 +43,7 @@ from api.db.db_models import APIToken, Task
 import time
 
 from api.utils.file_utils import filename_type, read_potential_broken_pdf
-from rag.flow.pipeline import Pipeline
+from rag.flow.pipeline import Pipeline, fetch_pipeline_logs
 from rag.nlp import search
 from rag.utils.redis_conn import REDIS_CONN
 
@@ -548,7 +548,8 @@ def trace():
     try:
         bin = REDIS_CONN.get(f"{cvs_id}-{msg_id}-logs")
         if not bin:
-            return get_json_result(data={})
+            # the trace of a dataflow run
+            return get_json_result(data=fetch_pipeline_logs(cvs_id, msg_id) or {})
 
         return get_json_result(data=json.loads(bin.encode("utf-8")))
     except Exception as e:
@@ -212,6 +212,46 @@ class CommonService:
                 data["update_date"] = datetime_format(datetime.now())
                 cls.model.update(data).where(cls.model.id == data["id"]).execute()
 
+    @classmethod
+    @DB.connection_context()
+    def bulk_update_by_id(cls, data_list, batch_size=100, condition=None):
+        """Update multiple records by their IDs, in one statement per batch.
+
+        Unlike update_many_by_id, all the records are set the same fields, each to its own value,
+        by a single UPDATE ... CASE statement for each batch of records.
+
+        Args:
+            data_list (list): List of dictionaries containing record data to update.
+                             Each dictionary must include an 'id' field, and the same fields as the others.
+            batch_size (int, optional): Number of records to update in each statement. Defaults to 100.
+            condition (optional): Expression the records must also match to be updated, e.g. the value
+                                  a field was read with.
+
+        Returns:
+            Number of records updated
+        """
+        if not data_list:
+            return 0
+        update_time = current_timestamp()
+        update_date = datetime_format(datetime.now())
+        for data in data_list:
+            data["update_time"] = update_time
+            data["update_date"] = update_date
+        fields = [k for k in data_list[0].keys() if k != "id"]
+        num = 0
+        with DB.atomic():
+            for i in range(0, len(data_list), batch_size):
+                batch = data_list[i : i + batch_size]
+                values = {}
+                for k in fields:
+                    field = getattr(cls.model, k)
+                    values[field] = peewee.Case(cls.model.id, [(data["id"], field.to_value(data[k])) for data in batch])
+                query = cls.model.update(values).where(cls.model.id.in_([data["id"] for data in batch]))
+                if condition is not None:
+                    query = query.where(condition)
+                num += query.execute()
+        return num
+
     @classmethod
     @DB.connection_context()
     @retry_db_operation
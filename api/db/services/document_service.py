@@ -17,6 +17,7 @@ import json
 import logging
 import random
 import re
+from collections import defaultdict
 from concurrent.futures import ThreadPoolExecutor
 from copy import deepcopy
 from datetime import datetime
@@ -35,6 +36,7 @@ from api.db.db_utils import bulk_insert_into_db
 from api.db.services.common_service import CommonService
 from api.db.services.knowledgebase_service import KnowledgebaseService
 from api.utils import current_timestamp, get_format_time, get_uuid
+from graphrag.entity_cache import invalidate_kb_graph
 from rag.nlp import rag_tokenizer, search
 from rag.settings import get_svr_queue_name, SVR_CONSUMER_GROUP_NAME
 from rag.utils.redis_conn import REDIS_CONN
@@ -335,6 +337,7 @@ class DocumentService(CommonService):
                                              search.index_name(tenant_id), doc.kb_id)
                 settings.docStoreConn.delete({"kb_id": doc.kb_id, "knowledge_graph_kwd": ["entity", "relation", "graph", "subgraph", "community_report"], "must_not": {"exists": "source_id"}},
                                              search.index_name(tenant_id), doc.kb_id)
+                invalidate_kb_graph(doc.kb_id)
         except Exception:
             pass
         return cls.delete_by_id(doc.id)
@@ -371,8 +374,8 @@ class DocumentService(CommonService):
     @classmethod
     @DB.connection_context()
     def get_unfinished_docs(cls):
-        fields = [cls.model.id, cls.model.process_begin_at, cls.model.parser_config, cls.model.progress_msg,
-                  cls.model.run, cls.model.parser_id]
+        fields = [cls.model.id, cls.model.process_begin_at, cls.model.parser_config, cls.model.progress,
+                  cls.model.progress_msg, cls.model.run, cls.model.parser_id]
         docs = cls.model.select(*fields) \
             .where(
             cls.model.status == StatusEnum.VALID.value,
@@ -673,27 +676,43 @@ class DocumentService(CommonService):
     def _sync_progress(cls, docs:list[dict]):
         from api.db.services.task_service import TaskService
 
+        if not docs:
+            return
+        try:
+            doc_tasks = TaskService.get_progress_by_doc_ids([d["id"] for d in docs])
+        except Exception:
+            logging.exception("fetch task exception")
+            return
+
+        queue_lengths = {}
+
+        def queue_length(priority):
+            if priority not in queue_lengths:
+                queue_lengths[priority] = get_queue_length(priority)
+            return queue_lengths[priority]
+
+        # by the run status the documents were read with, and whether their progress is set
+        updates = defaultdict(list)
         for d in docs:
             try:
-                tsks = TaskService.query(doc_id=d["id"], order_by=Task.create_time)
+                tsks = doc_tasks.get(d["id"])
                 if not tsks:
                     continue
                 msg = []
                 prg = 0
                 finished = True
                 bad = 0
-                e, doc = DocumentService.get_by_id(d["id"])
-                status = doc.run  # TaskStatus.RUNNING.value
+                status = d["run"]  # TaskStatus.RUNNING.value
                 priority = 0
                 for t in tsks:
-                    if 0 <= t.progress < 1:
+                    if 0 <= t["progress"] < 1:
                         finished = False
-                    if t.progress == -1:
+                    if t["progress"] == -1:
                         bad += 1
-                    prg += t.progress if t.progress >= 0 else 0
-                    if t.progress_msg.strip():
-                        msg.append(t.progress_msg)
-                    priority = max(priority, t.priority)
+                    prg += t["progress"] if t["progress"] >= 0 else 0
+                    if t["progress_msg"].strip():
+                        msg.append(t["progress_msg"])
+                    priority = max(priority, t["priority"])
                 prg /= len(tsks)
                 if finished and bad:
                     prg = -1
@@ -704,6 +723,7 @@ class DocumentService(CommonService):
 
                 msg = "\n".join(sorted(msg))
                 info = {
+                    "id": d["id"],
                     "process_duration": datetime.timestamp(
                         datetime.now()) -
                                        d["process_begin_at"].timestamp(),
@@ -713,13 +733,22 @@ class DocumentService(CommonService):
                 if msg:
                     info["progress_msg"] = msg
                     if msg.endswith("created task graphrag") or msg.endswith("created task raptor") or msg.endswith("created task mindmap"):
-                        info["progress_msg"] += "\n%d tasks are ahead in the queue..."%get_queue_length(priority)
+                        info["progress_msg"] += "\n%d tasks are ahead in the queue..."%queue_length(priority)
                 else:
-                    info["progress_msg"] = "%d tasks are ahead in the queue..."%get_queue_length(priority)
-                cls.update_by_id(d["id"], info)
+                    info["progress_msg"] = "%d tasks are ahead in the queue..."%queue_length(priority)
+                # only the documents whose progress moved are written, the progress is stored as a single precision float
+                if info["run"] == d["run"] and info["progress_msg"] == d["progress_msg"] and abs(info.get("progress", d["progress"]) - d["progress"]) < 1e-6:
+                    continue
+                updates[(d["run"], "progress" in info)].append(info)
             except Exception as e:
                 if str(e).find("'0'") < 0:
                     logging.exception("fetch task exception")
+        for (run, _), infos in updates.items():
+            try:
+                # a document canceled or rerun meanwhile is left as it is
+                cls.bulk_update_by_id(infos, condition=(cls.model.run == run))
+            except Exception:
+                logging.exception("update document progress exception")
 
     @classmethod
     @DB.connection_context()
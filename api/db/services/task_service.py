@@ -104,6 +104,7 @@ class TaskService(CommonService):
             Document.type,
             Document.location,
             Document.size,
+            Document.process_begin_at,
             Knowledgebase.tenant_id,
             Knowledgebase.language,
             Knowledgebase.embd_id,
@@ -140,6 +141,9 @@ class TaskService(CommonService):
         if docs[0]["retry_count"] >= 3:
             return None
 
+        # as a timestamp, the task is logged as JSON
+        if docs[0]["process_begin_at"]:
+            docs[0]["process_begin_at"] = docs[0]["process_begin_at"].timestamp()
         return docs[0]
 
     @classmethod
@@ -173,6 +177,35 @@ class TaskService(CommonService):
             return None
         return tasks
 
+    @classmethod
+    @DB.connection_context()
+    def get_progress_by_doc_ids(cls, doc_ids: list[str], batch_size: int = 1000):
+        """Retrieve the progress of the tasks of many documents at once.
+
+        Args:
+            doc_ids (list[str]): The unique identifiers of the documents.
+            batch_size (int, optional): Number of documents queried at a time. Defaults to 1000.
+
+        Returns:
+            dict: The tasks of each document having some, by document id, ordered by creation time.
+                  Each task is a dictionary of its progress, progress_msg and priority.
+        """
+        fields = [
+            cls.model.doc_id,
+            cls.model.progress,
+            cls.model.progress_msg,
+            cls.model.priority,
+        ]
+        res = {}
+        for i in range(0, len(doc_ids), batch_size):
+            tasks = (
+                cls.model.select(*fields).order_by(cls.model.create_time.asc())
+                .where(cls.model.doc_id.in_(doc_ids[i:i + batch_size]))
+            )
+            for t in tasks.dicts():
+                res.setdefault(t["doc_id"], []).append(t)
+        return res
+
     @classmethod
     @DB.connection_context()
     def update_chunk_ids(cls, id: str, chunk_ids: str):
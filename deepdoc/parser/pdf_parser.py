@@ -19,9 +19,13 @@ import math
 import os
 import random
 import re
+import shutil
 import sys
+import tempfile
 import threading
-from collections import Counter, defaultdict
+import weakref
+from collections import Counter, OrderedDict, defaultdict, deque
+from concurrent.futures.process import BrokenProcessPool
 from copy import deepcopy
 from io import BytesIO
 from timeit import default_timer as timer
@@ -36,6 +40,7 @@ from pypdf import PdfReader as pdf2_read
 
 from api import settings
 from api.utils.file_utils import get_project_base_directory
+from deepdoc.pdf_render import PDF_RENDER_PAGES_PER_TASK, PDF_RENDER_WORKERS, get_render_pool, has_color, render_pages, reset_render_pool
 from deepdoc.vision import OCR, AscendLayoutRecognizer, LayoutRecognizer, Recognizer, TableStructureRecognizer
 from rag.app.picture import vision_llm_chunk as picture_vision_llm_chunk
 from rag.nlp import rag_tokenizer
@@ -46,6 +51,155 @@ LOCK_KEY_pdfplumber = "global_shared_lock_pdfplumber"
 if LOCK_KEY_pdfplumber not in sys.modules:
     sys.modules[LOCK_KEY_pdfplumber] = threading.Lock()
 
+# Page ranges longer than PDF_PAGE_WINDOW pages have their page bitmaps spilled to disk,
+# only the PDF_PAGE_IMAGE_CACHE most recently used ones are kept decoded in memory.
+PDF_PAGE_WINDOW = int(os.environ.get("PDF_PAGE_WINDOW", 32))
+PDF_PAGE_IMAGE_CACHE = max(1, int(os.environ.get("PDF_PAGE_IMAGE_CACHE", 4)))
+
+
+class SpilledPageImage:
+    """
+    Stand-in for a page bitmap of a PageImageStore. `size` is known without decoding,
+    everything else (crop, np.array, save ...) decodes the page through the store cache.
+    """
+
+    def __init__(self, store, index, size):
+        self._store = store
+        self._index = index
+        self.size = size
+
+    def load(self):
+        return self._store.load(self._index)
+
+    def __array__(self, dtype=None, copy=None):
+        return np.asarray(self.load(), dtype=dtype)
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self.load(), name)
+
+
+class PageImageStore:
+    """
+    List-like container of page bitmaps which spills them to a temporary directory as they are added,
+    so the memory held by a long page range stays bounded by the decode cache.
+    """
+
+    def __init__(self, cache_size=PDF_PAGE_IMAGE_CACHE):
+        self._dir = tempfile.mkdtemp(prefix="ragflow_pages_")
+        self._pages = []
+        self._cache = OrderedDict()
+        self._cache_size = cache_size
+        self._lock = threading.Lock()
+        self._finalizer = weakref.finalize(self, shutil.rmtree, self._dir, True)
+
+    def _path(self, index):
+        return os.path.join(self._dir, f"{index}.png")
+
+    def append(self, img):
+        index = len(self._pages)
+        # lossless and fast to encode, OCR must see the same pixels
+        img.save(self._path(index), format="PNG", compress_level=1)
+        self._pages.append(SpilledPageImage(self, index, img.size))
+
+    def extend(self, imgs):
+        for img in imgs:
+            self.append(img)
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+        self._pages = []
+
+    def load(self, index):
+        with self._lock:
+            if index in self._cache:
+                self._cache.move_to_end(index)
+                return self._cache[index]
+        img = Image.open(self._path(index))
+        img.load()
+        with self._lock:
+            self._cache[index] = img
+            while len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+        return img
+
+    def close(self):
+        self.clear()
+        self._finalizer()
+
+    def __len__(self):
+        return len(self._pages)
+
+    def __getitem__(self, index):
+        return self._pages[index]
+
+    def __iter__(self):
+        return iter(self._pages)
+
+
+def render_pdf_pages(fnm, zoomin=3, page_from=0, page_to=299, with_chars=True, streaming=False):
+    """
+    Return (page_images, page_chars, total_page) of the page range, rendered page-parallel by the render pool.
+    With streaming, a range longer than PDF_PAGE_WINDOW pages is returned as a PageImageStore: the slices
+    are spilled to disk as they come, and only a bounded number of them is rendered ahead.
+    """
+    total_page = RAGFlowPdfParser.total_page_number(fnm, fnm if not isinstance(fnm, str) else None)
+    ranges = []
+    if total_page:
+        end = min(page_to, total_page)
+        ranges = [(f, min(f + PDF_RENDER_PAGES_PER_TASK, end)) for f in range(max(0, page_from), end, PDF_RENDER_PAGES_PER_TASK)]
+    spill = streaming and total_page and min(page_to, total_page) - max(0, page_from) > PDF_PAGE_WINDOW
+    page_images = PageImageStore() if spill else []
+    page_chars = []
+
+    pool = get_render_pool() if len(ranges) > 1 else None
+    if pool:
+        tmp_path = None
+        try:
+            if not isinstance(fnm, str):
+                # the workers read the binary from a file, rather than each slice carrying a copy of it
+                with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as f:
+                    f.write(fnm)
+                    tmp_path = f.name
+            pending = deque()
+            for f, t in ranges:
+                try:
+                    pending.append(pool.submit(render_pages, tmp_path or fnm, zoomin, f, t, with_chars))
+                except RuntimeError as e:
+                    # shut down after breaking, for another document
+                    raise BrokenProcessPool(str(e)) from e
+                # don't let finished slices pile up in memory ahead of the consumer
+                while len(pending) > PDF_RENDER_WORKERS * 2:
+                    imgs, chars, total_page = pending.popleft().result()
+                    page_images.extend(imgs)
+                    page_chars.extend(chars)
+            while pending:
+                imgs, chars, total_page = pending.popleft().result()
+                page_images.extend(imgs)
+                page_chars.extend(chars)
+            return page_images, page_chars, total_page
+        except BrokenProcessPool:
+            # a worker died, e.g. killed by the OOM killer: the errors of the document itself are raised
+            logging.exception("render_pdf_pages: render pool broken, falling back to in-process rendering")
+            reset_render_pool(pool)
+            page_images.clear()
+            page_chars = []
+        finally:
+            if tmp_path:
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+
+    for f, t in ranges if spill else [(page_from, page_to)]:
+        with sys.modules[LOCK_KEY_pdfplumber]:
+            imgs, chars, total_page = render_pages(fnm, zoomin, f, t, with_chars)
+        page_images.extend(imgs)
+        page_chars.extend(chars)
+    return page_images, page_chars, total_page
+
 
 class RAGFlowPdfParser:
     def __init__(self, **kwargs):
@@ -186,11 +340,7 @@ class RAGFlowPdfParser:
         return arr
 
     def _has_color(self, o):
-        if o.get("ncs", "") == "DeviceGray":
-            if o["stroking_color"] and o["stroking_color"][0] == 1 and o["non_stroking_color"] and o["non_stroking_color"][0] == 1:
-                if re.match(r"[a-zT_\[\]\(\)-]+", o.get("text", "")):
-                    return False
-        return True
+        return has_color(o)
 
     def _table_transformer_job(self, ZM):
         logging.debug("Table processing...")
@@ -1011,6 +1161,12 @@ class RAGFlowPdfParser:
 
     @staticmethod
     def total_page_number(fnm, binary=None):
+        try:
+            # pypdf only reads the page tree, and keeps no state shared between handles
+            with pdf2_read(fnm if not binary else BytesIO(binary)) as pdf:
+                return len(pdf.pages)
+        except Exception:
+            logging.warning("total_page_number: pypdf failed, falling back to pdfplumber")
         try:
             with sys.modules[LOCK_KEY_pdfplumber]:
                 pdf = pdfplumber.open(fnm) if not binary else pdfplumber.open(BytesIO(binary))
@@ -1031,19 +1187,7 @@ class RAGFlowPdfParser:
         self.page_from = page_from
         start = timer()
         try:
-            with sys.modules[LOCK_KEY_pdfplumber]:
-                with pdfplumber.open(fnm) if isinstance(fnm, str) else pdfplumber.open(BytesIO(fnm)) as pdf:
-                    self.pdf = pdf
-                    self.page_images = [p.to_image(resolution=72 * zoomin, antialias=True).annotated for i, p in enumerate(self.pdf.pages[page_from:page_to])]
-
-                    try:
-                        self.page_chars = [[c for c in page.dedupe_chars().chars if self._has_color(c)] for page in self.pdf.pages[page_from:page_to]]
-                    except Exception as e:
-                        logging.warning(f"Failed to extract characters for pages {page_from}-{page_to}: {str(e)}")
-                        self.page_chars = [[] for _ in range(page_to - page_from)]  # If failed to extract, using empty list instead.
-
-                    self.total_page = len(self.pdf.pages)
-
+            self.page_images, self.page_chars, self.total_page = render_pdf_pages(fnm, zoomin, page_from, page_to, streaming=True)
         except Exception:
             logging.exception("RAGFlowPdfParser __images__")
         logging.info(f"__images__ dedupe_chars cost {timer() - start}s")
@@ -1355,10 +1499,7 @@ class VisionParser(RAGFlowPdfParser):
 
     def __images__(self, fnm, zoomin=3, page_from=0, page_to=299, callback=None):
         try:
-            with sys.modules[LOCK_KEY_pdfplumber]:
-                self.pdf = pdfplumber.open(fnm) if isinstance(fnm, str) else pdfplumber.open(BytesIO(fnm))
-                self.page_images = [p.to_image(resolution=72 * zoomin).annotated for i, p in enumerate(self.pdf.pages[page_from:page_to])]
-                self.total_page = len(self.pdf.pages)
+            self.page_images, _, self.total_page = render_pdf_pages(fnm, zoomin, page_from, page_to, with_chars=False)
         except Exception:
             self.page_images = None
             self.total_page = 0
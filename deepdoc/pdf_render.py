@@ -0,0 +1,147 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+"""
+Rasterization of PDF pages by a pool of worker processes.
+
+The workers are forked from a forkserver that preloads this module, their entry point. It is out of deepdoc.parser,
+whose package imports all the parsers and their models: keep the imports of this module light.
+
+A forkserver child still imports the `__main__` of the caller again, as `__mp_main__`, before running anything, e.g. the
+task executor, whose imports load the OCR models. On the CPython versions of _MAIN_SKIPPING_VERSIONS, the pool starts
+its workers without that import, see _RenderPopen; on the others it uses a plain forkserver context.
+"""
+
+import io
+import logging
+import multiprocessing
+import os
+import re
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+from multiprocessing import context, forkserver, popen_forkserver, reduction, spawn, util
+
+import pdfplumber
+
+# Pages are rasterized by a pool of worker processes, each opening its own pdfplumber handle,
+# so that concurrent documents are not serialized on the in-process pdfplumber lock.
+PDF_RENDER_WORKERS = int(os.environ.get("PDF_RENDER_WORKERS", min(4, os.cpu_count() or 1)))
+PDF_RENDER_PAGES_PER_TASK = max(1, int(os.environ.get("PDF_RENDER_PAGES_PER_TASK", 8)))
+
+_render_pool = None
+_render_pool_lock = threading.Lock()
+
+# the CPython versions whose popen_forkserver.Popen._launch is mirrored by _RenderPopen._launch,
+# checked by deepdoc/tests/test_pdf_render.py
+_MAIN_SKIPPING_VERSIONS = [(3, 10), (3, 11), (3, 12), (3, 13)]
+
+
+def has_color(o):
+    if o.get("ncs", "") == "DeviceGray":
+        if o["stroking_color"] and o["stroking_color"][0] == 1 and o["non_stroking_color"] and o["non_stroking_color"][0] == 1:
+            if re.match(r"[a-zT_\[\]\(\)-]+", o.get("text", "")):
+                return False
+    return True
+
+
+def render_pages(fnm, zoomin, page_from, page_to, with_chars=True):
+    """
+    Rasterize the pages [page_from, page_to) of the PDF file path or binary, and extract their chars,
+    with a pdfplumber handle of its own.
+    """
+    with pdfplumber.open(fnm) if isinstance(fnm, str) else pdfplumber.open(BytesIO(fnm)) as pdf:
+        pages = pdf.pages[page_from:page_to]
+        images = [p.to_image(resolution=72 * zoomin, antialias=True).annotated for p in pages]
+        page_chars = []
+        if with_chars:
+            try:
+                # pattern colors refer to the pdf document objects, which can't cross the process boundary
+                page_chars = [
+                    [{k: v for k, v in c.items() if k not in ("stroking_pattern", "non_stroking_pattern")} for c in p.dedupe_chars().chars if has_color(c)]
+                    for p in pages
+                ]
+            except Exception as e:
+                logging.warning(f"Failed to extract characters for pages {page_from}-{page_to}: {str(e)}")
+                page_chars = [[] for _ in pages]  # If failed to extract, using empty list instead.
+        return images, page_chars, len(pdf.pages)
+
+
+class _RenderPopen(popen_forkserver.Popen):
+    """
+    popen_forkserver.Popen, less the main module in the preparation data sent to the child: the worker only needs
+    this module, preloaded by the forkserver. It relies on CPython internals, hence _MAIN_SKIPPING_VERSIONS.
+    """
+
+    def _launch(self, process_obj):
+        prep_data = spawn.get_preparation_data(process_obj._name)
+        prep_data.pop("init_main_from_name", None)
+        prep_data.pop("init_main_from_path", None)
+        buf = io.BytesIO()
+        context.set_spawning_popen(self)
+        try:
+            reduction.dump(prep_data, buf)
+            reduction.dump(process_obj, buf)
+        finally:
+            context.set_spawning_popen(None)
+
+        self.sentinel, w = forkserver.connect_to_new_process(self._fds)
+        _parent_w = os.dup(w)
+        self.finalizer = util.Finalize(self, util.close_fds, (_parent_w, self.sentinel))
+        with open(w, "wb", closefd=True) as f:
+            f.write(buf.getbuffer())
+        self.pid = forkserver.read_signed(self.sentinel)
+
+
+class _RenderProcess(context.ForkServerProcess):
+    @staticmethod
+    def _Popen(process_obj):
+        return _RenderPopen(process_obj)
+
+
+class _RenderContext(context.ForkServerContext):
+    Process = _RenderProcess
+
+
+def _render_context():
+    if sys.version_info[:2] in _MAIN_SKIPPING_VERSIONS:
+        return _RenderContext()
+    logging.info(f"PDF render workers import the main module again on Python {sys.version_info[0]}.{sys.version_info[1]}")
+    return multiprocessing.get_context("forkserver")
+
+
+def get_render_pool():
+    global _render_pool
+    if PDF_RENDER_WORKERS <= 1:
+        return None
+    with _render_pool_lock:
+        if _render_pool is None:
+            # not fork: the task executor is multi-threaded, forking it could inherit held locks
+            multiprocessing.set_forkserver_preload([__name__])
+            _render_pool = ProcessPoolExecutor(max_workers=PDF_RENDER_WORKERS, mp_context=_render_context())
+        return _render_pool
+
+
+def reset_render_pool(pool):
+    """
+    Replace the pool, if it is still the given broken one. The slices in flight in it fail on their own,
+    the documents rendered by a new pool are left alone.
+    """
+    global _render_pool
+    with _render_pool_lock:
+        if _render_pool is pool:
+            _render_pool.shutdown(wait=False)
+            _render_pool = None
@@ -0,0 +1,58 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+import os
+import subprocess
+import sys
+
+import pytest
+
+pytest.importorskip("pdfplumber")
+
+from deepdoc import pdf_render  # noqa: E402
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# the caller of the pool, which records each import of itself
+MAIN = """
+import os
+import sys
+
+with open(sys.argv[1], "a") as f:
+    f.write(f"{os.getpid()}\\n")
+
+from deepdoc import pdf_render
+
+if __name__ == "__main__":
+    pool = pdf_render.get_render_pool()
+    pids = {pool.submit(os.getpid).result() for _ in range(16)}
+    assert os.getpid() not in pids
+    print(len(pids))
+"""
+
+
+@pytest.mark.skipif(sys.version_info[:2] not in pdf_render._MAIN_SKIPPING_VERSIONS,
+                    reason="the render workers import the main module on this Python")
+def test_render_pool_skips_main(tmp_path):
+    main = tmp_path / "main.py"
+    main.write_text(MAIN)
+    log = tmp_path / "imports.log"
+    env = dict(os.environ, PDF_RENDER_WORKERS="2",
+               PYTHONPATH=os.pathsep.join([REPO_DIR] + [p for p in [os.environ.get("PYTHONPATH")] if p]))
+    res = subprocess.run([sys.executable, str(main), str(log)], env=env, capture_output=True, text=True, timeout=120)
+    assert res.returncode == 0, res.stderr
+    assert 1 <= int(res.stdout.strip()) <= 2
+    # imported by the caller only, not by the workers
+    assert len(log.read_text().split()) == 1
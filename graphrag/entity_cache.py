@@ -0,0 +1,192 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+"""
+In-process cache of the entity metadata of the knowledge graphs, for the retrieval.
+
+The entity types and pageranks of a knowledge base, and optionally its edges, are read once from its graph chunk,
+instead of searching thousands of entity rows for each question. The graph is written by the task executors, so a write
+bumps a version of the knowledge base in Redis, which the cache checks on each lookup.
+"""
+
+import heapq
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from itertools import islice
+
+from api import settings
+from rag.utils.redis_conn import REDIS_CONN
+
+# knowledge bases kept per process, 0 disables the cache
+KG_ENTITY_CACHE_SIZE = int(os.environ.get("KG_ENTITY_CACHE_SIZE", 32))
+# entities and edges kept per process, over all the knowledge bases; a larger graph is searched in the doc store
+KG_ENTITY_CACHE_MAX_ELEMENTS = int(os.environ.get("KG_ENTITY_CACHE_MAX_ELEMENTS", 2_000_000))
+# a cached graph is read again after this, even if no write was seen
+KG_ENTITY_CACHE_TTL = int(os.environ.get("KG_ENTITY_CACHE_TTL", 600))
+# the pagerank and the n-hop paths missing from the entity rows retrieved by keywords are taken from the cached graph,
+# which changes the ranking of the retrieval as they are otherwise left at 0 and out, and keeps the edges in memory
+KG_FILL_ENTS_FROM_GRAPH = os.environ.get("KG_FILL_ENTS_FROM_GRAPH", "false").lower() in ["true", "1", "yes", "y"]
+# neighbours followed from each entity, by edge weight, for the n-hop paths
+KG_N_HOP_NEIGHBORS = int(os.environ.get("KG_N_HOP_NEIGHBORS", 8))
+
+
+def _version_key(kb_id: str) -> str:
+    return f"kg_graph_version:{kb_id}"
+
+
+class KBGraph:
+    """The entities of the graph of one knowledge base, with their type, pagerank and, if asked, weighted edges."""
+
+    def __init__(self, graph_data: dict, with_edges: bool = KG_FILL_ENTS_FROM_GRAPH):
+        self.entities = {}
+        self._by_type = defaultdict(list)
+        self._edges = defaultdict(list)
+        for node in graph_data.get("nodes", []):
+            name = node["id"]
+            pagerank = float(node.get("pagerank") or 0)
+            self.entities[name] = pagerank
+            self._by_type[node.get("entity_type", "")].append((pagerank, name))
+        for ty in self._by_type:
+            self._by_type[ty].sort(reverse=True)
+        for edge in graph_data.get("edges", []) if with_edges else []:
+            weight = float(edge.get("weight") or 0)
+            self._edges[edge["source"]].append((weight, edge["target"]))
+            self._edges[edge["target"]].append((weight, edge["source"]))
+        for name in self._edges:
+            self._edges[name].sort(key=lambda x: x[0], reverse=True)
+        # both ends of an edge are kept
+        self.size = len(self.entities) + sum(len(nbrs) for nbrs in self._edges.values()) // 2
+
+    def __contains__(self, name) -> bool:
+        return name in self.entities
+
+    def pagerank(self, name) -> float:
+        return self.entities.get(name, 0)
+
+    def ents_by_types(self, types: list[str], n: int) -> list[tuple[float, str]]:
+        """The n entities of highest pagerank among the given types, as (pagerank, name)."""
+        return list(islice(heapq.merge(*(self._by_type.get(ty, []) for ty in types), reverse=True), n))
+
+    def n_hop_ents(self, name, hops: int = 2) -> list[dict]:
+        """The paths of up to `hops` edges from the entity, as stored in n_hop_with_weight."""
+        paths = []
+
+        def walk(path, weights):
+            for weight, nbr in self._edges.get(path[-1], [])[:KG_N_HOP_NEIGHBORS]:
+                if nbr in path:
+                    continue
+                paths.append({"path": path + [nbr], "weights": weights + [weight]})
+                if len(weights) + 1 < hops:
+                    walk(path + [nbr], weights + [weight])
+
+        walk([name], [])
+        return paths
+
+
+class KBGraphCache:
+    """
+    The KBGraph of the recently searched knowledge bases, the least recently used ones are dropped beyond `capacity`
+    knowledge bases or `max_elements` entities and edges.
+    A knowledge base without an up to date graph, e.g. to be rebuilt after a document removal, or with a graph larger
+    than `max_elements`, is cached as None: its entities are then searched in the doc store.
+    """
+
+    def __init__(self, capacity: int = KG_ENTITY_CACHE_SIZE, ttl: int = KG_ENTITY_CACHE_TTL,
+                 max_elements: int = KG_ENTITY_CACHE_MAX_ELEMENTS):
+        self.capacity = capacity
+        self.ttl = ttl
+        self.max_elements = max_elements
+        self.elements = 0
+        self._graphs = OrderedDict()
+        self._lock = threading.Lock()
+        self._loading = defaultdict(threading.Lock)
+
+    def _cached(self, kb_id, version):
+        with self._lock:
+            entry = self._graphs.get(kb_id)
+            if entry is None:
+                return False, None
+            cached_version, loaded_at, graph = entry
+            if cached_version != version or time.time() - loaded_at > self.ttl:
+                return False, None
+            self._graphs.move_to_end(kb_id)
+            return True, graph
+
+    def get(self, idxnms, kb_id: str) -> KBGraph | None:
+        if self.capacity <= 0:
+            return None
+        version = REDIS_CONN.get(_version_key(kb_id))
+        found, graph = self._cached(kb_id, version)
+        if found:
+            return graph
+        with self._lock:
+            loading = self._loading[kb_id]
+        with loading:
+            # another thread may have loaded it meanwhile
+            found, graph = self._cached(kb_id, version)
+            if found:
+                return graph
+            graph = self._load(idxnms, kb_id)
+            if graph is not None and graph.size > self.max_elements:
+                logging.info(f"KBGraphCache leaves the graph of {kb_id} to the doc store, {graph.size} entities and edges")
+                graph = None
+            with self._lock:
+                self._pop(kb_id)
+                self._graphs[kb_id] = (version, time.time(), graph)
+                self.elements += graph.size if graph else 0
+                while len(self._graphs) > self.capacity or self.elements > self.max_elements:
+                    self._pop(next(iter(self._graphs)))
+            return graph
+
+    def _pop(self, kb_id):
+        entry = self._graphs.pop(kb_id, None)
+        if entry and entry[2]:
+            self.elements -= entry[2].size
+
+    @staticmethod
+    def _load(idxnms, kb_id: str) -> KBGraph | None:
+        conds = {"fields": ["content_with_weight", "removed_kwd"], "size": 1, "knowledge_graph_kwd": ["graph"]}
+        try:
+            res = settings.retriever.search(conds, idxnms, [kb_id])
+        except Exception:
+            logging.exception(f"KBGraphCache failed to read the graph of {kb_id}")
+            return None
+        if res.total == 0:
+            return KBGraph({})
+        for id in res.ids:
+            if res.field[id].get("removed_kwd", "N") != "N":
+                return None
+            try:
+                return KBGraph(json.loads(res.field[id]["content_with_weight"]))
+            except Exception:
+                logging.exception(f"KBGraphCache failed to parse the graph of {kb_id}")
+        return None
+
+    def discard(self, kb_id: str):
+        with self._lock:
+            self._pop(kb_id)
+
+
+KB_GRAPH_CACHE = KBGraphCache()
+
+
+def invalidate_kb_graph(kb_id: str):
+    """Mark the cached graph of kb_id stale in all the processes, to be called once its graph chunks are written."""
+    REDIS_CONN.set(_version_key(kb_id), str(time.time_ns()), 30 * 24 * 3600)
+    KB_GRAPH_CACHE.discard(kb_id)
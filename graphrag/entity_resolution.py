@@ -14,13 +14,14 @@
 #  limitations under the License.
 #
 import logging
-import itertools
 import os
 import re
+from collections import Counter, defaultdict
 from dataclasses import dataclass
 from typing import Any, Callable
 
 import networkx as nx
+import numpy as np
 import trio
 
 from graphrag.general.extractor import Extractor
@@ -28,7 +29,7 @@ from rag.nlp import is_english
 import editdistance
 from graphrag.entity_resolution_prompt import ENTITY_RESOLUTION_PROMPT
 from rag.llm.chat_model import Base as CompletionLLM
-from graphrag.utils import perform_variable_replacements, chat_limiter, GraphChange
+from graphrag.utils import perform_variable_replacements, chat_limiter, GraphChange, update_pagerank
 
 DEFAULT_RECORD_DELIMITER = "##"
 DEFAULT_ENTITY_INDEX_DELIMITER = "<|>"
@@ -42,6 +43,167 @@ class EntityResolutionResult:
     change: GraphChange
 
 
+def has_digit_in_2gram_diff(a, b):
+    def to_2gram_set(s):
+        return {s[i:i+2] for i in range(len(s) - 1)}
+
+    set_a = to_2gram_set(a)
+    set_b = to_2gram_set(b)
+    diff = set_a ^ set_b
+
+    return any(any(c.isdigit() for c in pair) for pair in diff)
+
+
+def is_similar_entity(a, b, english=None):
+    if english is None:
+        english = is_english(a) and is_english(b)
+    if english:
+        similar = editdistance.eval(a, b) <= min(len(a), len(b)) // 2
+    else:
+        set_a, set_b = set(a), set(b)
+        max_l = max(len(set_a), len(set_b))
+        if max_l < 4:
+            similar = len(set_a & set_b) > 1
+        else:
+            similar = len(set_a & set_b)*1./max_l >= 0.8
+    # the cheap test first, most of the pairs are not similar
+    return similar and not has_digit_in_2gram_diff(a, b)
+
+
+# Candidate pairs are blocked by bounds that similar names can't exceed, so that only the plausible ones are
+# compared. Two English names are similar if their edit distance is at most half the length of the shorter one:
+# their lengths differ by as much at most, and so do their character counts, since the edit distance is at least
+# the number of characters one has more than the other. The other names are similar if they share most of their
+# distinct characters: they are found with prefix filtering, ordered from the rarest to the most common, two sets
+# sharing t characters have a common one among the first (size - t + 1) of each.
+
+ENGLISH_CHAR_BUCKETS = 64
+
+
+def _chars_overlap(sa: int, sb: int) -> int:
+    max_l = max(sa, sb)
+    if max_l < 4:
+        return 2
+    t = int(max_l * 0.8)
+    while t * 1. / max_l < 0.8:
+        t += 1
+    return t
+
+
+class _CharsIndex:
+    """
+    Names by the characters of the prefix of their character set, and by the size of the set. A name is
+    indexed with the prefix for the smallest overlap any partner needs, the longest one.
+    """
+
+    def __init__(self, chars: dict):
+        self.freq = Counter(c for cs in chars.values() for c in cs)
+        self.postings = defaultdict(list)
+        min_overlaps = {}
+        for name, cs in chars.items():
+            size = len(cs)
+            if size not in min_overlaps:
+                min_overlaps[size] = min((_chars_overlap(size, other) for other in range(1, 2 * size + 2) if min(size, other) >= _chars_overlap(size, other)),
+                                         default=size + 1)
+            for c in self.order(cs)[:size - min_overlaps[size] + 1]:
+                self.postings[(c, size)].append(name)
+        self.sizes = sorted({size for _, size in self.postings})
+
+    def order(self, chars) -> list:
+        # from the rarest to the most common, ties broken by the character
+        return sorted(chars, key=lambda c: (self.freq.get(c, 0), c))
+
+    def probe(self, chars) -> set:
+        """The indexed names that may share enough characters with chars."""
+        chars = self.order(chars)
+        size = len(chars)
+        found = set()
+        for other in self.sizes:
+            t = _chars_overlap(size, other)
+            if min(size, other) < t:
+                continue
+            for c in chars[:size - t + 1]:
+                found.update(self.postings.get((c, other), ()))
+        return found
+
+
+class _EnglishIndex:
+    """
+    English names by length, with their character counts, the characters hashed to ENGLISH_CHAR_BUCKETS, and
+    whether they are probed: the pairs of two probed names are only looked up from the first one.
+    """
+
+    def __init__(self, names: list[str], position: dict, probes: set):
+        self.names = sorted(names, key=len)
+        self.lengths = np.array([len(n) for n in self.names], dtype=np.int32)
+        self.positions = np.array([position[n] for n in self.names], dtype=np.int64)
+        self.probed = np.array([n in probes for n in self.names], dtype=bool)
+        self.counts = np.zeros((len(self.names), ENGLISH_CHAR_BUCKETS), dtype=np.int16)
+        for i, name in enumerate(self.names):
+            self.counts[i] = self.char_counts(name)
+
+    @staticmethod
+    def char_counts(name: str) -> np.ndarray:
+        # merging characters into a bucket can only lower the difference of the counts, it remains a bound
+        counts = np.zeros(ENGLISH_CHAR_BUCKETS, dtype=np.int16)
+        for c in name:
+            counts[ord(c) % ENGLISH_CHAR_BUCKETS] += 1
+        return counts
+
+    def probe(self, name: str, position: int) -> list[str]:
+        """The other indexed names within the length and character count bounds of an edit distance to name."""
+        n = len(name)
+        # |n - m| <= min(n, m) // 2
+        lo = np.searchsorted(self.lengths, (2 * n + 2) // 3, side="left")
+        hi = np.searchsorted(self.lengths, n + n // 2, side="right")
+        if lo >= hi:
+            return []
+        diff = self.counts[lo:hi] - self.char_counts(name)
+        lack = np.maximum(diff, 0).sum(axis=1)
+        excess = np.maximum(-diff, 0).sum(axis=1)
+        max_dist = np.minimum(self.lengths[lo:hi], n) // 2
+        positions = self.positions[lo:hi]
+        keep = (np.maximum(lack, excess) <= max_dist) & (~self.probed[lo:hi] | (positions > position))
+        return [self.names[lo + i] for i in np.nonzero(keep)[0]]
+
+
+def candidate_pairs(names: list[str], probes: set[str]) -> list[tuple[str, str]]:
+    """
+    The pairs of similar names with one of them among probes, in the order and the same as
+    `[(a, b) for a, b in itertools.combinations(names, 2) if (a in probes or b in probes) and is_similar_entity(a, b)]`,
+    without comparing all of the pairs.
+    """
+    position = {name: i for i, name in enumerate(names)}
+    english = {name: is_english(name) for name in names}
+    chars = {name: set(name) for name in names}
+    english_index = _EnglishIndex([n for n in names if english[n]], position, probes)
+    chars_index = _CharsIndex(chars)
+    # two English names are compared by edit distance, an English one with the other names by characters
+    other_chars_index = _CharsIndex({n: chars[n] for n in names if not english[n]})
+
+    pairs = set()
+    for name in probes:
+        if name not in position:
+            continue
+        i = position[name]
+        if english[name]:
+            for other in english_index.probe(name, i):
+                pair = (name, other) if i < position[other] else (other, name)
+                if pair not in pairs and is_similar_entity(pair[0], pair[1], english=True):
+                    pairs.add(pair)
+            found = other_chars_index.probe(chars[name])
+        else:
+            found = chars_index.probe(chars[name])
+        for other in found:
+            if other == name or (other in probes and position[other] < i):
+                # the pair was tried when probing the other name
+                continue
+            pair = (name, other) if i < position[other] else (other, name)
+            if pair not in pairs and is_similar_entity(pair[0], pair[1], english=False):
+                pairs.add(pair)
+    return sorted(pairs, key=lambda p: (position[p[0]], position[p[1]]))
+
+
 class EntityResolution(Extractor):
     """Entity resolution class definition."""
 
@@ -92,7 +254,7 @@ class EntityResolution(Extractor):
 
         candidate_resolution = {entity_type: [] for entity_type in entity_types}
         for k, v in node_clusters.items():
-            candidate_resolution[k] = [(a, b) for a, b in itertools.combinations(v, 2) if (a in subgraph_nodes or b in subgraph_nodes) and self.is_similarity(a, b)]
+            candidate_resolution[k] = candidate_pairs(v, subgraph_nodes)
         num_candidates = sum([len(candidates) for _, candidates in candidate_resolution.items()])
         callback(msg=f"Identified {num_candidates} candidate pairs")
         remain_candidates_to_resolve = num_candidates
@@ -143,10 +305,7 @@ class EntityResolution(Extractor):
                 merging_nodes = list(sub_connect_graph)
                 nursery.start_soon(limited_merge_nodes, graph, merging_nodes, change)
 
-        # Update pagerank
-        pr = nx.pagerank(graph)
-        for node_name, pagerank in pr.items():
-            graph.nodes[node_name]["pagerank"] = pagerank
+        update_pagerank(graph)
 
         return EntityResolutionResult(
             graph=graph,
@@ -220,29 +379,6 @@ class EntityResolution(Extractor):
 
         return ans_list
 
-    def _has_digit_in_2gram_diff(self, a, b):
-        def to_2gram_set(s):
-            return {s[i:i+2] for i in range(len(s) - 1)}
-
-        set_a = to_2gram_set(a)
-        set_b = to_2gram_set(b)
-        diff = set_a ^ set_b
-
-        return any(any(c.isdigit() for c in pair) for pair in diff)
-
     def is_similarity(self, a, b):
-        if self._has_digit_in_2gram_diff(a, b):
-            return False
-
-        if is_english(a) and is_english(b):
-            if editdistance.eval(a, b) <= min(len(a), len(b)) // 2:
-                return True
-            return False
-
-        a, b = set(a), set(b)
-        max_l = max(len(a), len(b))
-        if max_l < 4:
-            return len(a & b) > 1
-
-        return len(a & b)*1./max_l >= 0.8
+        return is_similar_entity(a, b)
 
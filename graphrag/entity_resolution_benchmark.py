@@ -0,0 +1,109 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+"""
+Benchmark of the candidate generation of the entity resolution on a synthetic graph:
+
+    python -m graphrag.entity_resolution_benchmark --entities 100000 --verify 3000
+
+The names are English and Chinese ones, some of them variants of others. With --verify, the candidates of a
+sample are compared with the ones of all the pairs, and the time of all the pairs of the graph is extrapolated.
+"""
+
+import argparse
+import itertools
+import random
+import time
+
+from graphrag.entity_resolution import candidate_pairs, is_similar_entity
+
+ONSETS = ["B", "C", "D", "F", "G", "H", "J", "K", "L", "M", "N", "P", "R", "S", "T", "V", "W", "Z", "CH", "SH", "TH",
+          "ST", "BR", "TR", "GR", "PL"]
+VOWELS = ["A", "E", "I", "O", "U", "AI", "EA", "OU", "Y"]
+CODAS = ["", "N", "R", "S", "L", "T"]
+SYLLABLES = [o + v + c for o in ONSETS for v in VOWELS for c in CODAS]
+WORDS = ["GROUP", "BANK", "UNIVERSITY", "COMPANY", "INSTITUTE", "RIVER", "CITY", "PROJECT", "2020", "II"]
+CJK = [chr(c) for c in range(0x4E00, 0x4E00 + 2000)]
+
+
+def synthetic_names(n: int, seed: int = 0) -> list[str]:
+    rnd = random.Random(seed)
+    names = set()
+    ordered = []
+    while len(names) < n:
+        r = rnd.random()
+        if r < 0.5:
+            words = ["".join(rnd.choice(SYLLABLES) for _ in range(rnd.randint(1, 4))) for _ in range(rnd.randint(1, 3))]
+            if rnd.random() < 0.2:
+                words.append(rnd.choice(WORDS))
+            name = " ".join(words)
+        elif r < 0.9:
+            name = "".join(rnd.choice(CJK) for _ in range(rnd.randint(2, 8)))
+        elif ordered:
+            # a variant of a name: a character dropped, replaced or added
+            name = list(rnd.choice(ordered))
+            i = rnd.randrange(len(name))
+            op = rnd.random()
+            if op < 0.3 and len(name) > 1:
+                del name[i]
+            elif op < 0.6:
+                name[i] = rnd.choice(CJK) if ord(name[i]) > 127 else rnd.choice("ABCDEFGHIJKLMNOPQRSTUVWXYZ")
+            else:
+                name.insert(i, rnd.choice("ABCDEFGHIJKLMNOPQRSTUVWXYZ"))
+            name = "".join(name)
+        else:
+            continue
+        if name not in names:
+            names.add(name)
+            ordered.append(name)
+    return sorted(names)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Entity resolution candidate generation benchmark")
+    parser.add_argument("--entities", type=int, default=100000, help="number of entities of the graph")
+    parser.add_argument("--types", type=int, default=5, help="number of entity types")
+    parser.add_argument("--probes", type=float, default=1.0, help="share of the entities that are new, i.e. probed")
+    parser.add_argument("--verify", type=int, default=0, help="size of the sample compared with all the pairs")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rnd = random.Random(args.seed)
+    names = synthetic_names(args.entities, args.seed)
+    clusters = [sorted(names[i::args.types]) for i in range(args.types)]
+    total = 0
+    start = time.perf_counter()
+    for v in clusters:
+        probes = set(v) if args.probes >= 1 else set(rnd.sample(v, int(len(v) * args.probes)))
+        total += len(candidate_pairs(v, probes))
+    elapsed = time.perf_counter() - start
+    print(f"{args.entities} entities, {args.types} types: {total} candidate pairs in {elapsed:.2f}s")
+
+    if args.verify:
+        sample = sorted(rnd.sample(clusters[0], min(args.verify, len(clusters[0]))))
+        start = time.perf_counter()
+        expected = [(a, b) for a, b in itertools.combinations(sample, 2) if is_similar_entity(a, b)]
+        pairwise = time.perf_counter() - start
+        start = time.perf_counter()
+        found = candidate_pairs(sample, set(sample))
+        blocked = time.perf_counter() - start
+        assert found == expected, f"{len(found)} candidate pairs, expected {len(expected)}"
+        n_pairs = sum(len(v) * (len(v) - 1) // 2 for v in clusters)
+        print(f"sample of {len(sample)}: same {len(found)} pairs, all pairs {pairwise:.2f}s, blocked {blocked:.2f}s; "
+              f"all the pairs of the graph would take ~{pairwise * n_pairs / max(1, len(sample) * (len(sample) - 1) // 2):.0f}s")
+
+
+if __name__ == "__main__":
+    main()
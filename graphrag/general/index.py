@@ -37,6 +37,7 @@ from graphrag.utils import (
     graph_merge,
     set_graph,
     tidy_graph,
+    update_pagerank,
 )
 from rag.nlp import rag_tokenizer, search
 from rag.utils.redis_conn import distributed_lock
@@ -258,23 +259,13 @@ async def run_graphrag_for_kb(
     callback(msg=f"[GraphRAG] kb:{kb_id} merge lock acquired")
 
     try:
-        union_nodes: set = set()
-        final_graph = None
-
-        for doc_id in ok_docs:
-            sg = subgraphs[doc_id]
-            union_nodes.update(set(sg.nodes()))
-
-            new_graph = await merge_subgraph(
-                tenant_id,
-                kb_id,
-                doc_id,
-                sg,
-                embedding_model,
-                callback,
-            )
-            if new_graph is not None:
-                final_graph = new_graph
+        final_graph = await merge_subgraphs(
+            tenant_id,
+            kb_id,
+            {doc_id: subgraphs[doc_id] for doc_id in ok_docs},
+            embedding_model,
+            callback,
+        )
 
         if final_graph is None:
             callback(msg=f"[GraphRAG] kb:{kb_id} merge finished (no in-memory graph returned).")
@@ -403,24 +394,40 @@ async def merge_subgraph(
     embedding_model,
     callback,
 ):
+    return await merge_subgraphs(tenant_id, kb_id, {doc_id: subgraph}, embedding_model, callback)
+
+
+@timeout(60 * 30, 1)
+async def merge_subgraphs(
+    tenant_id: str,
+    kb_id: str,
+    subgraphs: dict[str, nx.Graph],
+    embedding_model,
+    callback,
+):
+    """
+    Merge the subgraphs of documents, {doc_id: subgraph}, into the global graph. The graph is loaded, ranked
+    and stored once for all of them, and only the entities, relations and subgraphs they change are written.
+    """
     start = trio.current_time()
     change = GraphChange()
-    old_graph = await get_graph(tenant_id, kb_id, subgraph.graph["source_id"])
-    if old_graph is not None:
+    source_ids = [source for subgraph in subgraphs.values() for source in subgraph.graph["source_id"]]
+    new_graph = await get_graph(tenant_id, kb_id, source_ids)
+    if new_graph is not None:
         logging.info("Merge with an exiting graph...................")
-        tidy_graph(old_graph, callback)
-        new_graph = graph_merge(old_graph, subgraph, change)
-    else:
-        new_graph = subgraph
-        change.added_updated_nodes = set(new_graph.nodes())
-        change.added_updated_edges = set(new_graph.edges())
-    pr = nx.pagerank(new_graph)
-    for node_name, pagerank in pr.items():
-        new_graph.nodes[node_name]["pagerank"] = pagerank
+        tidy_graph(new_graph, callback)
+    for subgraph in subgraphs.values():
+        if new_graph is None:
+            new_graph = subgraph
+            change.added_updated_nodes = set(new_graph.nodes())
+            change.added_updated_edges = set(new_graph.edges())
+        else:
+            new_graph = graph_merge(new_graph, subgraph, change)
+    update_pagerank(new_graph)
 
     await set_graph(tenant_id, kb_id, embedding_model, new_graph, change, callback)
     now = trio.current_time()
-    callback(msg=f"merging subgraph for doc {doc_id} into the global graph done in {now - start:.2f} seconds.")
+    callback(msg=f"merging subgraph for doc {', '.join(subgraphs.keys())} into the global graph done in {now - start:.2f} seconds.")
     return new_graph
 
 
@@ -13,15 +13,19 @@
 #  See the License for the specific language governing permissions and
 #  limitations under the License.
 #
+import heapq
 import json
 import logging
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from copy import deepcopy
+from itertools import chain
 import json_repair
 import pandas as pd
 import trio
 
 from api.utils import get_uuid
+from graphrag.entity_cache import KB_GRAPH_CACHE, KG_FILL_ENTS_FROM_GRAPH
 from graphrag.query_analyze_prompt import PROMPTS
 from graphrag.utils import get_entity_type2samples, get_llm_cache, set_llm_cache, get_relation
 from rag.utils import num_tokens_from_string, get_float
@@ -103,6 +107,16 @@ class KGSearch(Dealer):
             }
         return res
 
+    def _kb_graphs(self, idxnms, kb_ids):
+        """The cached graphs of kb_ids, or None if one of them is to be searched in the doc store."""
+        graphs = []
+        for kb_id in kb_ids:
+            graph = KB_GRAPH_CACHE.get(idxnms, kb_id)
+            if graph is None:
+                return None
+            graphs.append(graph)
+        return graphs
+
     def get_relevant_ents_by_keywords(self, keywords, filters, idxnms, kb_ids, emb_mdl, sim_thr=0.3, N=56):
         if not keywords:
             return {}
@@ -112,7 +126,21 @@ class KGSearch(Dealer):
         es_res = self.dataStore.search(["content_with_weight", "entity_kwd", "rank_flt"], [], filters, [matchDense],
                                        OrderByExpr(), 0, N,
                                        idxnms, kb_ids)
-        return self._ent_info_from_(es_res, sim_thr)
+        res = self._ent_info_from_(es_res, sim_thr)
+        if not KG_FILL_ENTS_FROM_GRAPH:
+            return res
+        # the pagerank and the neighbours missing from the rows are taken from the graph
+        graphs = self._kb_graphs(idxnms, kb_ids)
+        for name, ent in res.items():
+            for graph in graphs or []:
+                if name not in graph:
+                    continue
+                if not ent["pagerank"]:
+                    ent["pagerank"] = graph.pagerank(name)
+                if not ent["n_hop_ents"]:
+                    ent["n_hop_ents"] = graph.n_hop_ents(name)
+                break
+        return res
 
     def get_relevant_relations_by_txt(self, txt, filters, idxnms, kb_ids, emb_mdl, sim_thr=0.3, N=56):
         if not txt:
@@ -128,6 +156,10 @@ class KGSearch(Dealer):
     def get_relevant_ents_by_types(self, types, filters, idxnms, kb_ids, N=56):
         if not types:
             return {}
+        graphs = self._kb_graphs(idxnms, kb_ids)
+        if graphs is not None:
+            ents = heapq.nlargest(N, chain(*(graph.ents_by_types(types, N) for graph in graphs)))
+            return {name: {"sim": 0., "pagerank": pagerank, "n_hop_ents": [], "description": "{}"} for pagerank, name in ents}
         filters = deepcopy(filters)
         filters["knowledge_graph_kwd"] = "entity"
         filters["entity_type_kwd"] = types
@@ -156,17 +188,21 @@ class KGSearch(Dealer):
             tenant_ids = tenant_ids.split(",")
         idxnms = [index_name(tid) for tid in tenant_ids]
         ty_kwds = []
-        try:
-            ty_kwds, ents = self.query_rewrite(llm, qst, [index_name(tid) for tid in tenant_ids], kb_ids)
-            logging.info(f"Q: {qst}, Types: {ty_kwds}, Entities: {ents}")
-        except Exception as e:
-            logging.exception(e)
-            ents = [qst]
-            pass
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            # the relations are searched by the question itself, and the graphs loaded, while the LLM rewrites it
+            rels_from_txt = executor.submit(self.get_relevant_relations_by_txt, qst, filters, idxnms, kb_ids, emb_mdl, rel_sim_threshold)
+            executor.submit(self._kb_graphs, idxnms, kb_ids)
+            try:
+                ty_kwds, ents = self.query_rewrite(llm, qst, [index_name(tid) for tid in tenant_ids], kb_ids)
+                logging.info(f"Q: {qst}, Types: {ty_kwds}, Entities: {ents}")
+            except Exception as e:
+                logging.exception(e)
+                ents = [qst]
+                pass
 
-        ents_from_query = self.get_relevant_ents_by_keywords(ents, filters, idxnms, kb_ids, emb_mdl, ent_sim_threshold)
-        ents_from_types = self.get_relevant_ents_by_types(ty_kwds, filters, idxnms, kb_ids, 10000)
-        rels_from_txt = self.get_relevant_relations_by_txt(qst, filters, idxnms, kb_ids, emb_mdl, rel_sim_threshold)
+            ents_from_query = executor.submit(self.get_relevant_ents_by_keywords, ents, filters, idxnms, kb_ids, emb_mdl, ent_sim_threshold)
+            ents_from_types = executor.submit(self.get_relevant_ents_by_types, ty_kwds, filters, idxnms, kb_ids, 10000)
+            ents_from_query, ents_from_types, rels_from_txt = ents_from_query.result(), ents_from_types.result(), rels_from_txt.result()
         nhop_pathes = defaultdict(dict)
         for _, ent in ents_from_query.items():
             nhops = ent.get("n_hop_ents", [])
@@ -26,7 +26,9 @@ from networkx.readwrite import json_graph
 from api import settings
 from api.utils import get_uuid
 from api.utils.api_utils import timeout
+from graphrag.entity_cache import invalidate_kb_graph
 from rag.nlp import rag_tokenizer, search
+from rag.settings import EMBEDDING_BATCH_SIZE
 from rag.utils.doc_store_conn import OrderByExpr
 from rag.utils.redis_conn import REDIS_CONN
 
@@ -35,6 +37,8 @@ GRAPH_FIELD_SEP = "<SEP>"
 ErrorHandlerFn = Callable[[BaseException | None, str | None, dict | None], None]
 
 chat_limiter = trio.CapacityLimiter(int(os.environ.get("MAX_CONCURRENT_CHATS", 10)))
+# chunks per insert of the graph write-back
+GRAPH_INSERT_BATCH_SIZE = int(os.environ.get("GRAPH_INSERT_BATCH_SIZE", 64))
 
 
 @dataclasses.dataclass
@@ -108,26 +112,36 @@ def set_llm_cache(llmnm, txt, v, history, genconf):
     REDIS_CONN.set(k, v.encode("utf-8"), 24 * 3600)
 
 
-def get_embed_cache(llmnm, txt):
+def _embed_cache_key(llmnm, txt):
     hasher = xxhash.xxh64()
     hasher.update(str(llmnm).encode("utf-8"))
     hasher.update(str(txt).encode("utf-8"))
+    return hasher.hexdigest()
 
-    k = hasher.hexdigest()
-    bin = REDIS_CONN.get(k)
+
+def get_embed_cache(llmnm, txt):
+    bin = REDIS_CONN.get(_embed_cache_key(llmnm, txt))
     if not bin:
         return
     return np.array(json.loads(bin))
 
 
 def set_embed_cache(llmnm, txt, arr):
-    hasher = xxhash.xxh64()
-    hasher.update(str(llmnm).encode("utf-8"))
-    hasher.update(str(txt).encode("utf-8"))
-
-    k = hasher.hexdigest()
     arr = json.dumps(arr.tolist() if isinstance(arr, np.ndarray) else arr)
-    REDIS_CONN.set(k, arr.encode("utf-8"), 24 * 3600)
+    REDIS_CONN.set(_embed_cache_key(llmnm, txt), arr.encode("utf-8"), 24 * 3600)
+
+
+def get_embed_caches(llmnm, txts: list) -> list:
+    """The cached embeddings of txts in one round-trip, None for the missing ones."""
+    bins = REDIS_CONN.mget([_embed_cache_key(llmnm, txt) for txt in txts])
+    return [np.array(json.loads(bin)) if bin else None for bin in bins]
+
+
+def set_embed_caches(llmnm, txts: list, arrs):
+    REDIS_CONN.mset(
+        {_embed_cache_key(llmnm, txt): json.dumps(arr.tolist() if isinstance(arr, np.ndarray) else arr).encode("utf-8") for txt, arr in zip(txts, arrs)},
+        24 * 3600,
+    )
 
 
 def get_tags_from_cache(kb_ids):
@@ -294,9 +308,7 @@ def chunk_id(chunk):
     return xxhash.xxh64((chunk["content_with_weight"] + chunk["kb_id"]).encode("utf-8")).hexdigest()
 
 
-async def graph_node_to_chunk(kb_id, embd_mdl, ent_name, meta, chunks):
-    global chat_limiter
-    enable_timeout_assertion = os.environ.get("ENABLE_TIMEOUT_ASSERTION")
+def graph_node_chunk(kb_id, ent_name, meta) -> dict:
     chunk = {
         "id": get_uuid(),
         "important_kwd": [ent_name],
@@ -311,16 +323,41 @@ async def graph_node_to_chunk(kb_id, embd_mdl, ent_name, meta, chunks):
         "available_int": 0,
     }
     chunk["content_sm_ltks"] = rag_tokenizer.fine_grained_tokenize(chunk["content_ltks"])
-    ebd = get_embed_cache(embd_mdl.llm_name, ent_name)
-    if ebd is None:
+    return chunk
+
+
+async def embed_graph_chunks(embd_mdl, chunks: list[dict], cache_txts: list[str], txts: list[str], callback=None, kind: str = "nodes"):
+    """
+    Set the vectors of the entity or relation chunks, the embeddings of txts. The embed cache is read at once by
+    cache_txts, and the misses are encoded in full batches.
+    """
+    global chat_limiter
+    enable_timeout_assertion = os.environ.get("ENABLE_TIMEOUT_ASSERTION")
+    if not chunks:
+        return
+    ebds = await trio.to_thread.run_sync(get_embed_caches, embd_mdl.llm_name, cache_txts)
+    misses = [i for i, ebd in enumerate(ebds) if ebd is None]
+    done = len(chunks) - len(misses)
+
+    async def encode(batch):
+        nonlocal done
         async with chat_limiter:
-            with trio.fail_after(3 if enable_timeout_assertion else 30000000):
-                ebd, _ = await trio.to_thread.run_sync(lambda: embd_mdl.encode([ent_name]))
-        ebd = ebd[0]
-        set_embed_cache(embd_mdl.llm_name, ent_name, ebd)
-    assert ebd is not None
-    chunk["q_%d_vec" % len(ebd)] = ebd
-    chunks.append(chunk)
+            with trio.fail_after(30 if enable_timeout_assertion else 30000000):
+                vts, _ = await trio.to_thread.run_sync(lambda: embd_mdl.encode([txts[i] for i in batch]))
+        for i, ebd in zip(batch, vts):
+            ebds[i] = ebd
+        await trio.to_thread.run_sync(set_embed_caches, embd_mdl.llm_name, [cache_txts[i] for i in batch], vts)
+        done += len(batch)
+        if callback:
+            callback(msg=f"Get embedding of {kind}: {done}/{len(chunks)}")
+
+    async with trio.open_nursery() as nursery:
+        for b in range(0, len(misses), EMBEDDING_BATCH_SIZE):
+            nursery.start_soon(encode, misses[b: b + EMBEDDING_BATCH_SIZE])
+
+    for chunk, ebd in zip(chunks, ebds):
+        assert ebd is not None
+        chunk["q_%d_vec" % len(ebd)] = ebd
 
 
 @timeout(3, 3)
@@ -345,8 +382,7 @@ def get_relation(tenant_id, kb_id, from_ent_name, to_ent_name, size=1):
     return res
 
 
-async def graph_edge_to_chunk(kb_id, embd_mdl, from_ent_name, to_ent_name, meta, chunks):
-    enable_timeout_assertion = os.environ.get("ENABLE_TIMEOUT_ASSERTION")
+def graph_edge_chunk(kb_id, from_ent_name, to_ent_name, meta) -> dict:
     chunk = {
         "id": get_uuid(),
         "from_entity_kwd": from_ent_name,
@@ -361,17 +397,13 @@ async def graph_edge_to_chunk(kb_id, embd_mdl, from_ent_name, to_ent_name, meta,
         "available_int": 0,
     }
     chunk["content_sm_ltks"] = rag_tokenizer.fine_grained_tokenize(chunk["content_ltks"])
+    return chunk
+
+
+def graph_edge_texts(from_ent_name, to_ent_name, meta):
+    # the embedding is cached by the relation, whatever its description
     txt = f"{from_ent_name}->{to_ent_name}"
-    ebd = get_embed_cache(embd_mdl.llm_name, txt)
-    if ebd is None:
-        async with chat_limiter:
-            with trio.fail_after(3 if enable_timeout_assertion else 300000000):
-                ebd, _ = await trio.to_thread.run_sync(lambda: embd_mdl.encode([txt + f": {meta['description']}"]))
-        ebd = ebd[0]
-        set_embed_cache(embd_mdl.llm_name, txt, ebd)
-    assert ebd is not None
-    chunk["q_%d_vec" % len(ebd)] = ebd
-    chunks.append(chunk)
+    return txt, txt + f": {meta['description']}"
 
 
 async def does_graph_contains(tenant_id, kb_id, doc_id):
@@ -419,11 +451,44 @@ async def get_graph(tenant_id, kb_id, exclude_rebuild=None):
     return result
 
 
+def changed_sources(graph: nx.Graph, change: GraphChange) -> list[str]:
+    """
+    The documents whose subgraph the change alters, the sources of the added or updated nodes and edges.
+    A removed node was merged into an updated one, which carries its sources.
+    """
+    sources = set()
+    for n in change.added_updated_nodes:
+        if graph.has_node(n):
+            sources.update(graph.nodes[n]["source_id"])
+    for from_node, to_node in change.added_updated_edges:
+        edge_attrs = graph.get_edge_data(from_node, to_node)
+        if edge_attrs:
+            sources.update(edge_attrs.get("source_id", []))
+    return sorted(sources)
+
+
+def update_pagerank(graph: nx.Graph):
+    """
+    PageRank of the nodes, started from the ranks they were stored with: a change that only shifts the ranks
+    of a few nodes converges in a few iterations instead of as many as from scratch.
+    """
+    if graph.number_of_nodes() == 0:
+        return
+    uniform = 1.0 / graph.number_of_nodes()
+    nstart = {n: attrs.get("pagerank") or uniform for n, attrs in graph.nodes(data=True)}
+    try:
+        pr = nx.pagerank(graph, nstart=nstart)
+    except nx.PowerIterationFailedConvergence:
+        pr = nx.pagerank(graph)
+    for node_name, pagerank in pr.items():
+        graph.nodes[node_name]["pagerank"] = pagerank
+
+
 async def set_graph(tenant_id: str, kb_id: str, embd_mdl, graph: nx.Graph, change: GraphChange, callback):
     global chat_limiter
     start = trio.current_time()
 
-    await trio.to_thread.run_sync(settings.docStoreConn.delete, {"knowledge_graph_kwd": ["graph", "subgraph"]}, search.index_name(tenant_id), kb_id)
+    await trio.to_thread.run_sync(settings.docStoreConn.delete, {"knowledge_graph_kwd": ["graph"]}, search.index_name(tenant_id), kb_id)
 
     if change.removed_nodes:
         await trio.to_thread.run_sync(settings.docStoreConn.delete, {"knowledge_graph_kwd": ["entity"], "entity_kwd": sorted(change.removed_nodes)}, search.index_name(tenant_id), kb_id)
@@ -457,9 +522,16 @@ async def set_graph(tenant_id: str, kb_id: str, embd_mdl, graph: nx.Graph, chang
         }
     ]
 
-    # generate updated subgraphs
-    for source in graph.graph["source_id"]:
-        subgraph = graph.subgraph([n for n in graph.nodes if source in graph.nodes[n]["source_id"]]).copy()
+    # only the subgraphs of the documents the change touches are regenerated
+    source_nodes = defaultdict(list)
+    for n, attrs in graph.nodes(data=True):
+        for source in attrs["source_id"]:
+            source_nodes[source].append(n)
+    sources = changed_sources(graph, change)
+    for i in range(0, len(sources), 256):
+        await trio.to_thread.run_sync(settings.docStoreConn.delete, {"knowledge_graph_kwd": ["subgraph"], "source_id": sources[i: i + 256]}, search.index_name(tenant_id), kb_id)
+    for source in sources:
+        subgraph = graph.subgraph(source_nodes.get(source, [])).copy()
         subgraph.graph["source_id"] = [source]
         for n in subgraph.nodes:
             subgraph.nodes[n]["source_id"] = [source]
@@ -475,22 +547,23 @@ async def set_graph(tenant_id: str, kb_id: str, embd_mdl, graph: nx.Graph, chang
             }
         )
 
-    async with trio.open_nursery() as nursery:
-        for ii, node in enumerate(change.added_updated_nodes):
-            node_attrs = graph.nodes[node]
-            nursery.start_soon(graph_node_to_chunk, kb_id, embd_mdl, node, node_attrs, chunks)
-            if ii % 100 == 9 and callback:
-                callback(msg=f"Get embedding of nodes: {ii}/{len(change.added_updated_nodes)}")
+    nodes = sorted(change.added_updated_nodes)
+    node_chunks = [graph_node_chunk(kb_id, node, graph.nodes[node]) for node in nodes]
+    await embed_graph_chunks(embd_mdl, node_chunks, nodes, nodes, callback, "nodes")
+    chunks.extend(node_chunks)
 
-    async with trio.open_nursery() as nursery:
-        for ii, (from_node, to_node) in enumerate(change.added_updated_edges):
-            edge_attrs = graph.get_edge_data(from_node, to_node)
-            if not edge_attrs:
-                # added_updated_edges could record a non-existing edge if both from_node and to_node participate in nodes merging.
-                continue
-            nursery.start_soon(graph_edge_to_chunk, kb_id, embd_mdl, from_node, to_node, edge_attrs, chunks)
-            if ii % 100 == 9 and callback:
-                callback(msg=f"Get embedding of edges: {ii}/{len(change.added_updated_edges)}")
+    edge_chunks, edge_cache_txts, edge_txts = [], [], []
+    for from_node, to_node in sorted(change.added_updated_edges):
+        edge_attrs = graph.get_edge_data(from_node, to_node)
+        if not edge_attrs:
+            # added_updated_edges could record a non-existing edge if both from_node and to_node participate in nodes merging.
+            continue
+        edge_chunks.append(graph_edge_chunk(kb_id, from_node, to_node, edge_attrs))
+        cache_txt, txt = graph_edge_texts(from_node, to_node, edge_attrs)
+        edge_cache_txts.append(cache_txt)
+        edge_txts.append(txt)
+    await embed_graph_chunks(embd_mdl, edge_chunks, edge_cache_txts, edge_txts, callback, "edges")
+    chunks.extend(edge_chunks)
 
     now = trio.current_time()
     if callback:
@@ -498,15 +571,15 @@ async def set_graph(tenant_id: str, kb_id: str, embd_mdl, graph: nx.Graph, chang
     start = now
 
     enable_timeout_assertion = os.environ.get("ENABLE_TIMEOUT_ASSERTION")
-    es_bulk_size = 4
-    for b in range(0, len(chunks), es_bulk_size):
-        with trio.fail_after(3 if enable_timeout_assertion else 30000000):
-            doc_store_result = await trio.to_thread.run_sync(lambda: settings.docStoreConn.insert(chunks[b : b + es_bulk_size], search.index_name(tenant_id), kb_id))
-        if b % 100 == es_bulk_size and callback:
-            callback(msg=f"Insert chunks: {b}/{len(chunks)}")
+    for b in range(0, len(chunks), GRAPH_INSERT_BATCH_SIZE):
+        with trio.fail_after(30 if enable_timeout_assertion else 30000000):
+            doc_store_result = await trio.to_thread.run_sync(lambda: settings.docStoreConn.insert(chunks[b : b + GRAPH_INSERT_BATCH_SIZE], search.index_name(tenant_id), kb_id))
+        if callback:
+            callback(msg=f"Insert chunks: {min(b + GRAPH_INSERT_BATCH_SIZE, len(chunks))}/{len(chunks)}")
         if doc_store_result:
             error_message = f"Insert chunk error: {doc_store_result}, please check log file and Elasticsearch/Infinity status!"
             raise Exception(error_message)
+    await trio.to_thread.run_sync(invalidate_kb_graph, kb_id)
     now = trio.current_time()
     if callback:
         callback(msg=f"set_graph added/updated {len(change.added_updated_nodes)} nodes and {len(change.added_updated_edges)} edges from index in {now - start:.2f}s.")
@@ -29,7 +29,7 @@ from io import BytesIO
 import pdfplumber
 from typing import Union, Dict, TypedDict, Tuple, Optional
 from api.utils.configs import get_base_config
-from rag.utils.storage_factory import STORAGE_IMPL
+from powerrag.utils.image_utils import store_images as store_parsed_images
 from PIL import Image
 import io
 import numpy as np
@@ -367,11 +367,11 @@ class MinerUPdfParser:
 
     def store_images(self, md_content: str, images: ImageDict, output_dir: str) -> str:
         """
-        Store images from MinerU response to OceanBase storage and update markdown content
+        Store images from MinerU response to storage and update markdown content
 
         Args:
             md_content: The markdown content containing image references
-            images: Dictionary of image data from MinerU response
+            images: Dictionary of image data
             output_dir: Base directory for storing images
 
         Returns:
@@ -380,69 +380,21 @@ class MinerUPdfParser:
         if not images:
             return md_content
 
-        image_info = []
-        updated_content = md_content
-
         # Handle both formats: direct dict and nested dict with "images" key
         images_data = images.get("images", images) if isinstance(images, dict) else images
 
-        for img_name, img_base64 in images_data.items():
-            try:
-                # Remove data URL prefix if present
-                if "," in img_base64:
-                    img_base64 = img_base64.split(",", 1)[1]
-
-                # Decode base64 to bytes
-                img_bytes = base64.b64decode(img_base64)
-
-                # Store image in OceanBase
-                STORAGE_IMPL.put(output_dir, img_name, img_bytes)
+        # Generate URL for the image using PowerRAG image access endpoint
+        server_url = os.environ.get("PUBLIC_SERVER_URL", "http://localhost:6000")
+        # Ensure server_url has protocol prefix
+        if not server_url.startswith("http://") and not server_url.startswith("https://"):
+            server_url = f"http://{server_url}"
+        kb_id = output_dir.split('/')[0] if '/' in output_dir else output_dir
 
-                # Generate URL for the image using PowerRAG image access endpoint
-                # Get PowerRAG server configuration
-                powerrag_config = get_base_config("powerrag", {}) or {}
-                server_url = os.environ.get("PUBLIC_SERVER_URL", "http://localhost:6000")
-                
-                # Ensure server_url has protocol prefix
-                if not server_url.startswith("http://") and not server_url.startswith("https://"):
-                    server_url = f"http://{server_url}"
-                
-                # Construct the image URL using PowerRAG chunk image endpoint
-                kb_id = output_dir.split('/')[0] if '/' in output_dir else output_dir
-                image_url = f"{server_url}/api/v1/powerrag/chunk/image/{kb_id}/{img_name}"
-
-                # Add to result list
-                image_info.append((img_name, image_url))
-
-                # Update markdown content to use new image URL
-                # Match both standard markdown image syntax and HTML img tags
-                # 改进的模式：支持路径匹配
-                md_pattern = f"!\\[([^\\]]*)\\]\\([^)]*{re.escape(img_name)}\\)"
-                html_pattern = f"<img[^>]*src=[\"']?[^\"']*{re.escape(img_name)}[^\"']*[\"']?[^>]*>"
-
-                # Replace markdown image syntax with HTML img tags
-                def replace_md_with_html(match):
-                    alt_text = "$$00$$"
-                    return f'<img src="{image_url}" alt="{alt_text}" style="max-width: 60%; height: auto;">'
-
-                updated_content = re.sub(md_pattern, replace_md_with_html, updated_content)
-
-                # Replace existing HTML img tags
-                def replace_html_img(match):
-                    img_tag = match.group(0)
-                    # 提取src属性中的图片路径并替换
-                    src_pattern = f"([\"']?)([^\"']*{re.escape(img_name)}[^\"']*)([\"']?)"
-                    return re.sub(src_pattern, f"\\1{image_url}\\3", img_tag)
-
-                updated_content = re.sub(html_pattern, replace_html_img, updated_content)
-                # if self.enable_ocr:
-                #     image_description = self.ocr_images(img_bytes)
-                #     updated_content = updated_content.replace("$$00$$", image_description)
-            except Exception as e:
-                logging.error(f"Failed to store image {img_name}: {str(e)}")
-                continue
+        def image_url(img_name):
+            return f"{server_url}/api/v1/powerrag/chunk/image/{kb_id}/{img_name}"
 
-        return updated_content
+        # the images are uploaded concurrently, and all their references rewritten in one pass
+        return store_parsed_images(md_content, images_data, output_dir, image_url)
 
     def crop(self, ck, need_position=False):
         """
@@ -20,11 +20,14 @@ import base64
 import re
 import json
 import sys
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from io import BytesIO
 import pdfplumber
 from typing import Union, Dict, TypedDict, Tuple, List, Optional
 from api.utils.configs import get_base_config
+from rag.llm.http_client import pooled_client
 from rag.utils.storage_factory import STORAGE_IMPL
+from powerrag.utils.image_utils import store_images as store_parsed_images
 from openai import OpenAI
 from PIL import Image
 import io
@@ -34,6 +37,13 @@ import io
 MIN_PIXELS = 3136
 MAX_PIXELS = 11289600
 
+# Pipelining and encoding of the page images sent to the vLLM server, overridable in the parser config section
+VLLM_PARSER_CONCURRENCY = int(os.environ.get("VLLM_PARSER_CONCURRENCY", 4))
+VLLM_IMAGE_FORMAT = os.environ.get("VLLM_IMAGE_FORMAT", "PNG")
+VLLM_IMAGE_QUALITY = int(os.environ.get("VLLM_IMAGE_QUALITY", 90))
+VLLM_IMAGE_MAX_PIXELS = int(os.environ.get("VLLM_IMAGE_MAX_PIXELS", MAX_PIXELS))
+VLLM_RENDER_DPI = int(os.environ.get("VLLM_RENDER_DPI", 200))
+
 
 # Default prompt for layout recognition
 DEFAULT_LAYOUT_PROMPT = """Please output the layout information from the PDF image, including each layout element's bbox, its category, and the corresponding text content within the bbox.
@@ -76,6 +86,10 @@ class VllmParser:
         config_key: Configuration key for reading vLLM URL (default: "vllm" or "dots_ocr")
         prompt: Custom prompt for the model (default: DEFAULT_LAYOUT_PROMPT)
         enable_ocr: Whether to enable OCR processing (for backward compatibility)
+
+    Pages are rendered while the previous ones are being inferred, `concurrency` pages are in flight against the
+    vLLM server. The config section may set `concurrency`, `image_format` (PNG, JPEG or WEBP), `image_quality`,
+    `image_max_pixels` and `render_dpi`.
     """
     
     def __init__(
@@ -97,6 +111,13 @@ class VllmParser:
         # Set vllm_url if provided, otherwise will be read from config in __call__
         self.vllm_url = vllm_url
 
+        config = get_base_config(config_key, {}) or {}
+        self.concurrency = max(1, int(config.get("concurrency", VLLM_PARSER_CONCURRENCY)))
+        self.image_format = str(config.get("image_format", VLLM_IMAGE_FORMAT)).upper()
+        self.image_quality = int(config.get("image_quality", VLLM_IMAGE_QUALITY))
+        self.image_max_pixels = int(config.get("image_max_pixels", VLLM_IMAGE_MAX_PIXELS))
+        self.render_dpi = int(config.get("render_dpi", VLLM_RENDER_DPI))
+
     def __call__(self, binary=None, from_page=0, to_page=100000, callback=None, kb_id: str = "default"):
         if callback:
             callback(msg=f"start to parse by vLLM model: {self.model_name}")
@@ -191,42 +212,38 @@ class VllmParser:
             else:
                 return 400, f"Unable to process document: {filename}"
 
-            # Convert PDF to images for processing
-            images = self._pdf_to_images(input_data, from_page, to_page)
-            
-            # Process each image with vLLM
             # Use kb_id as output_dir if provided, otherwise use a temporary directory
             output_dir = kb_id
-            
-            all_md_content = []
-            for i, image_pil in enumerate(images):
+
+            page_results = {}
+            failed = None
+            # the executor queue holds the rendered pages waiting for a free slot, bounded to as many as are in flight
+            with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="vllm_parser") as executor:
+                futures = {}
+                pages = self._iter_pdf_images(input_data, from_page, to_page)
                 try:
-                    # Run vLLM inference
-                    response_text = self._inference_with_vllm(image_pil, vllm_url=vllm_url)
-                    cells, filtered = self.post_process_output(
-                        response_text,
-                        image_pil,
-                        image_pil,
-                        min_pixels=MIN_PIXELS,
-                        max_pixels=MAX_PIXELS,
-                    )
-                    if not filtered:
-                        # Pass output_dir and page_index to layoutjson2md for image storage
-                        page_md_content = self.layoutjson2md(
-                            image_pil, 
-                            cells, 
-                            text_key='text',
-                            output_dir=output_dir,
-                            page_index=i
-                        )
-                        all_md_content.append(page_md_content)
-                    else:
-                        # Fallback: use cleaned response as text
-                        all_md_content.append(str(cells))
-                except Exception as e:
-                    logging.error(f"vLLM inference failed on page {i}: {str(e)}")
-                    return 500, f"vLLM inference failed on page {i}: {str(e)}"
-            
+                    for i, image_pil in enumerate(pages):
+                        while len(futures) >= 2 * self.concurrency and failed is None:
+                            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                            failed = self._collect_pages(done, futures, page_results)
+                        if failed is not None:
+                            break
+                        futures[executor.submit(self._parse_page, image_pil, i, vllm_url, output_dir)] = i
+                finally:
+                    pages.close()
+                if failed is None and futures:
+                    done, _ = wait(futures)
+                    failed = self._collect_pages(done, futures, page_results)
+                for future in futures:
+                    future.cancel()
+
+            if failed is not None:
+                i, e = failed
+                logging.error(f"vLLM inference failed on page {i}: {str(e)}")
+                return 500, f"vLLM inference failed on page {i}: {str(e)}"
+
+            all_md_content = [page_results[i] for i in sorted(page_results)]
+
             # Combine results into markdown format
             md_content = "\n\n".join(all_md_content)
             
@@ -241,13 +258,55 @@ class VllmParser:
                 }
             }
             
-            logging.info(f"[vLLM] Successfully parsed document with {len(images)} pages using model: {self.model_name}")
+            logging.info(f"[vLLM] Successfully parsed document with {len(all_md_content)} pages using model: {self.model_name}")
             return 200, result
             
         except Exception as e:
             logging.error(f"[vLLM] Unexpected error: {e}")
             return 500, f"vLLM parsing failed: {str(e)}"
 
+    @staticmethod
+    def _collect_pages(done, futures, page_results):
+        """Move the finished pages into page_results, return (page index, error) of the first failed one."""
+        failed = None
+        for future in sorted(done, key=lambda f: futures[f]):
+            i = futures.pop(future)
+            try:
+                page_results[i] = future.result()
+            except Exception as e:
+                if failed is None:
+                    failed = (i, e)
+        return failed
+
+    def _parse_page(self, image_pil, page_index, vllm_url, output_dir):
+        input_image = self._resize_for_inference(image_pil)
+        response_text = self._inference_with_vllm(input_image, vllm_url=vllm_url)
+        cells, filtered = self.post_process_output(
+            response_text,
+            image_pil,
+            input_image,
+            min_pixels=MIN_PIXELS,
+            max_pixels=MAX_PIXELS,
+        )
+        if filtered:
+            # Fallback: use cleaned response as text
+            return str(cells)
+        # Pass output_dir and page_index to layoutjson2md for image storage
+        return self.layoutjson2md(
+            image_pil,
+            cells,
+            text_key='text',
+            output_dir=output_dir,
+            page_index=page_index
+        )
+
+    def _resize_for_inference(self, image):
+        # the bboxes returned for a downscaled image are mapped back to the rendered page in post_process_cells
+        if image.width * image.height <= self.image_max_pixels:
+            return image
+        height, width = smart_resize(image.height, image.width, max_pixels=self.image_max_pixels)
+        return image.resize((max(1, width), max(1, height)), Image.LANCZOS)
+
     def post_process_output(self, response, origin_image, input_image, min_pixels=None, max_pixels=None):
         json_load_failed = False
         cells = response
@@ -336,8 +395,8 @@ class VllmParser:
             Inference result text
         """
         try:
-            # Use vLLM API (standard OpenAI-compatible interface)
-            client = OpenAI(api_key=os.environ.get("API_KEY", "0"), base_url=vllm_url)
+            # Use vLLM API (standard OpenAI-compatible interface), the client and its connections are shared
+            client = pooled_client(OpenAI, api_key=os.environ.get("API_KEY", "0"), base_url=vllm_url)
             
             # Convert PIL image to base64
             image_base64 = self._pil_image_to_base64(image)
@@ -416,7 +475,6 @@ class VllmParser:
                         STORAGE_IMPL.put(output_dir, img_filename, img_bytes)
                         
                         # Generate URL for the image
-                        powerrag_config = get_base_config("powerrag", {}) or {}
                         api_url = os.environ.get("PUBLIC_SERVER_URL", "http://localhost:6000")
                         image_url = f"http://{api_url}/v1/chunk/image/{output_dir}/{img_filename}"
                         
@@ -579,7 +637,7 @@ class VllmParser:
 
     def _pil_image_to_base64(self, image):
         """
-        Convert PIL image to base64 string
+        Convert PIL image to base64 string, in the configured image format
         
         Args:
             image: PIL Image object
@@ -588,46 +646,70 @@ class VllmParser:
             Base64 encoded image string
         """
         buffered = io.BytesIO()
-        image.save(buffered, format="PNG")
+        if self.image_format in ("JPEG", "JPG"):
+            image.convert("RGB").save(buffered, format="JPEG", quality=self.image_quality)
+            mime = "jpeg"
+        elif self.image_format == "WEBP":
+            image.save(buffered, format="WEBP", quality=self.image_quality)
+            mime = "webp"
+        else:
+            image.save(buffered, format="PNG")
+            mime = "png"
         img_str = base64.b64encode(buffered.getvalue()).decode()
-        return f"data:image/png;base64,{img_str}"
+        return f"data:image/{mime};base64,{img_str}"
 
-    def _pdf_to_images(self, pdf_data: bytes, from_page: int = 0, to_page: int = 100000) -> list:
+    def _iter_pdf_images(self, pdf_data: bytes, from_page: int = 0, to_page: int = 100000):
         """
-        Convert PDF pages to images for processing
+        Render PDF pages to images one at a time, so that inference starts with the first page
         
         Args:
             pdf_data: PDF file data as bytes
             from_page: Starting page (0-indexed)
             to_page: Ending page (0-indexed, exclusive)
             
-        Returns:
-            List of PIL Image objects
+        Yields:
+            PIL Image objects
         """
-        images = []
-        
         try:
             with sys.modules["global_shared_lock_pdfplumber"]:
                 pdf = pdfplumber.open(BytesIO(pdf_data))
-                
+        except Exception as e:
+            logging.error(f"Failed to convert PDF to images: {str(e)}")
+            raise
+
+        try:
             # Adjust page range
             start_page = max(0, from_page)
             end_page = min(len(pdf.pages), to_page) if to_page != 100000 else len(pdf.pages)
-            
+
             # Convert specified pages to images
             for i in range(start_page, end_page):
                 page = pdf.pages[i]
-                # Convert page to image
-                img = page.to_image(resolution=200)  # Adjust resolution as needed
-                images.append(img.original)  # Store PIL Image object directly
-                
+                try:
+                    img = page.to_image(resolution=self.render_dpi).original
+                except Exception as e:
+                    logging.error(f"Failed to convert PDF to images: {str(e)}")
+                    raise
+                finally:
+                    # the parsed objects of a rendered page are no longer needed
+                    page.flush_cache()
+                yield img
+        finally:
             pdf.close()
+
+    def _pdf_to_images(self, pdf_data: bytes, from_page: int = 0, to_page: int = 100000) -> list:
+        """
+        Convert PDF pages to images for processing
+        
+        Args:
+            pdf_data: PDF file data as bytes
+            from_page: Starting page (0-indexed)
+            to_page: Ending page (0-indexed, exclusive)
             
-        except Exception as e:
-            logging.error(f"Failed to convert PDF to images: {str(e)}")
-            raise
-            
-        return images
+        Returns:
+            List of PIL Image objects
+        """
+        return list(self._iter_pdf_images(pdf_data, from_page, to_page))
 
     def store_images(self, md_content: str, images: ImageDict, output_dir: str) -> str:
         """
@@ -644,60 +726,17 @@ class VllmParser:
         if not images:
             return md_content
 
-        image_info = []
-        updated_content = md_content
-
         # Handle both formats: direct dict and nested dict with "images" key
         images_data = images.get("images", images) if isinstance(images, dict) else images
 
-        for img_name, img_base64 in images_data.items():
-            try:
-                # Remove data URL prefix if present
-                if "," in img_base64:
-                    img_base64 = img_base64.split(",", 1)[1]
-
-                # Decode base64 to bytes
-                img_bytes = base64.b64decode(img_base64)
-
-                # Store image in storage
-                STORAGE_IMPL.put(output_dir, img_name, img_bytes)
-
-                # Generate URL for the image using RAGFlow image access endpoint
-                # Get RAGFlow server configuration
-                powerrag_config = get_base_config("powerrag", {}) or {}
-                api_url = os.environ.get("PUBLIC_SERVER_URL", "http://localhost:6000")
-
-                # Construct the image URL using the auth_image endpoint
-                image_url = f"http://{api_url}/v1/chunk/image/{output_dir}/{img_name}"
+        # Generate URL for the image using RAGFlow image access endpoint
+        api_url = os.environ.get("PUBLIC_SERVER_URL", "http://localhost:6000")
 
-                # Add to result list
-                image_info.append((img_name, image_url))
-
-                # Update markdown content to use new image URL
-                # Match both standard markdown image syntax and HTML img tags
-                md_pattern = f"!\\[([^\\]]*)\\]\\([^)]*{re.escape(img_name)}\\)"
-                html_pattern = f"<img[^>]*src=[\"']?[^\"']*{re.escape(img_name)}[^\"']*[\"']?[^>]*>"
-
-                # Replace markdown image syntax with HTML img tags
-                def replace_md_with_html(match):
-                    alt_text = "$$00$$"
-                    return f'<img src="{image_url}" alt="{alt_text}" style="max-width: 60%; height: auto;">'
-
-                updated_content = re.sub(md_pattern, replace_md_with_html, updated_content)
-
-                # Replace existing HTML img tags
-                def replace_html_img(match):
-                    img_tag = match.group(0)
-                    # 提取src属性中的图片路径并替换
-                    src_pattern = f"([\"']?)([^\"']*{re.escape(img_name)}[^\"']*)([\"']?)"
-                    return re.sub(src_pattern, f"\\1{image_url}\\3", img_tag)
-
-                updated_content = re.sub(html_pattern, replace_html_img, updated_content)
-            except Exception as e:
-                logging.error(f"Failed to store image {img_name}: {str(e)}")
-                continue
+        def image_url(img_name):
+            return f"http://{api_url}/v1/chunk/image/{output_dir}/{img_name}"
 
-        return updated_content
+        # the images are uploaded concurrently, and all their references rewritten in one pass
+        return store_parsed_images(md_content, images_data, output_dir, image_url)
 
     def crop(self, ck, need_position=False):
         """
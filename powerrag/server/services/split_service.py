@@ -22,6 +22,7 @@ It does NOT handle document parsing - only takes text strings as input.
 Uses powerrag/app chunking methods based on parser_id.
 """
 
+import bisect
 import re
 import logging
 from typing import Dict, Any, List, Tuple
@@ -255,9 +256,12 @@ def regex_based_chunking(
         if chunk_tokens <= chunk_token_num:
             return [chunk_text]
         
+        protected_regions = None
         # 尝试使用每个delimiter进行拆分
         for delim in delimiter:
             if delim in chunk_text:
+                if protected_regions is None:
+                    protected_regions = ProtectedRegionIndex(chunk_text)
                 # 找到所有不在保护区域内的分隔符位置
                 delimiter_positions = []
                 start = 0
@@ -265,36 +269,39 @@ def regex_based_chunking(
                     pos = chunk_text.find(delim, start)
                     if pos == -1:
                         break
-                    if not is_in_protected_region(chunk_text, pos):
+                    if not protected_regions.is_protected(pos):
                         delimiter_positions.append(pos)
                     start = pos + 1
                 
                 if not delimiter_positions:
                     continue
                 
-                # 按分隔符位置拆分
+                # 按分隔符位置拆分, 逐段累加token数, 不重复计算已累积的文本
                 result = []
                 current_sub_chunk = ""
+                current_sub_tokens = 0
                 last_pos = 0
                 
                 for pos in delimiter_positions:
                     segment = chunk_text[last_pos:pos + len(delim)]
-                    test_chunk = current_sub_chunk + segment if current_sub_chunk else segment
+                    segment_tokens = num_tokens_from_string(segment)
                     
-                    if num_tokens_from_string(test_chunk) <= chunk_token_num:
-                        current_sub_chunk = test_chunk
+                    if current_sub_tokens + segment_tokens <= chunk_token_num:
+                        current_sub_chunk += segment
+                        current_sub_tokens += segment_tokens
                     else:
                         if current_sub_chunk:
                             result.append(current_sub_chunk)
                         current_sub_chunk = segment
+                        current_sub_tokens = segment_tokens
                     last_pos = pos + len(delim)
                 
                 # 处理剩余文本
                 if last_pos < len(chunk_text):
                     remaining = chunk_text[last_pos:]
-                    test_chunk = current_sub_chunk + remaining if current_sub_chunk else remaining
-                    if num_tokens_from_string(test_chunk) <= chunk_token_num:
-                        current_sub_chunk = test_chunk
+                    remaining_tokens = num_tokens_from_string(remaining)
+                    if current_sub_tokens + remaining_tokens <= chunk_token_num:
+                        current_sub_chunk += remaining
                     else:
                         if current_sub_chunk:
                             result.append(current_sub_chunk)
@@ -359,7 +366,7 @@ def regex_based_chunking(
     # 处理剩余内容
     if current_chunk:
         combined_text = ''.join(current_chunk)
-        combined_tokens = num_tokens_from_string(combined_text)
+        combined_tokens = current_token_count
         
         # 如果剩余内容过大，尝试拆分
         if combined_tokens > chunk_token_num * 1.5:
@@ -486,9 +493,12 @@ def split_with_title_chunks(sections, chunk_token_num=512, delimiter="\n。；
         if num_tokens_from_string(text) <= target_size:
             return [(text, original_title)]
 
+        protected_regions = None
         # Try to split by each delimiter
         for delim in delimiter:
             if delim in text:
+                if protected_regions is None:
+                    protected_regions = ProtectedRegionIndex(text)
                 # Find all delimiter positions that are not in protected regions
                 delimiter_positions = []
                 start = 0
@@ -496,30 +506,28 @@ def split_with_title_chunks(sections, chunk_token_num=512, delimiter="\n。；
                     pos = text.find(delim, start)
                     if pos == -1:
                         break
-                    if not is_in_protected_region(text, pos):
+                    if not protected_regions.is_protected(pos):
                         delimiter_positions.append(pos)
                     start = pos + 1
 
                 if not delimiter_positions:
                     continue
 
-                # Split text at safe delimiter positions
+                # Split text at safe delimiter positions, summing up the tokens segment by segment
                 result = []
                 current_chunk = ""
+                current_tokens = 0
                 last_pos = 0
 
                 for pos in delimiter_positions:
                     # Get the text segment including the delimiter
                     segment = text[last_pos:pos + len(delim)]
+                    segment_tokens = num_tokens_from_string(segment)
 
                     # When merging chunks, ensure we preserve delimiters between segments
-                    if current_chunk:
-                        test_chunk = current_chunk + segment
-                    else:
-                        test_chunk = segment
-
-                    if num_tokens_from_string(test_chunk) <= target_size:
-                        current_chunk = test_chunk
+                    if current_tokens + segment_tokens <= target_size:
+                        current_chunk += segment
+                        current_tokens += segment_tokens
                     else:
                         if current_chunk:
                             # 检查分块是否已经包含该标题，如果包含则不重复插入
@@ -533,6 +541,7 @@ def split_with_title_chunks(sections, chunk_token_num=512, delimiter="\n。；
                             if not _is_title_only_chunk(chunk_with_title, original_title):
                                 result.append((chunk_with_title, original_title))
                         current_chunk = segment
+                        current_tokens = segment_tokens
                     last_pos = pos + len(delim)
 
                 # Handle the remaining text
@@ -540,13 +549,8 @@ def split_with_title_chunks(sections, chunk_token_num=512, delimiter="\n。；
                     remaining = text[last_pos:]
 
                     # When merging with remaining text, preserve delimiters
-                    if current_chunk:
-                        test_chunk = current_chunk + remaining
-                    else:
-                        test_chunk = remaining
-
-                    if num_tokens_from_string(test_chunk) <= target_size:
-                        current_chunk = test_chunk
+                    if current_tokens + num_tokens_from_string(remaining) <= target_size:
+                        current_chunk += remaining
                     else:
                         if current_chunk:
                             # 保留分隔符，不使用rstrip()
@@ -697,50 +701,81 @@ def extract_title_from_markdown(markdown_text, title_level=3):
     return '\n'.join(titles)
 
 
-def is_in_protected_region(text, position):
-    """Check if a position is within a protected region (formulas, HTML tables, etc.)"""
-    # Check for LaTeX math formulas
-    # Inline math: $...$
-    dollar_count = 0
-    for i in range(position):
-        if text[i] == '$':
-            dollar_count += 1
-    if dollar_count % 2 == 1:
-        return True
-
-    # Display math: $$...$$
-    if position >= 1 and text[position - 1:position + 1] == '$$':
-        return True
-    if position < len(text) - 1 and text[position:position + 2] == '$$':
-        return True
-
-    # LaTeX delimiters: \(...\) and \[...\]
-    if position >= 1 and text[position - 1:position + 1] in [r'\(', r'\[']:
-        return True
-    if position < len(text) - 1 and text[position:position + 2] in [r'\)', r'\]']:
-        return True
-
-    # Check for HTML tables
-    # Find the last unclosed <table> tag before position
-    table_start = text.rfind('<table', 0, position)
-    if table_start != -1:
-        table_end = text.find('</table>', table_start)
-        if table_end == -1 or table_end > position:
+def _find_all(text, sub):
+    """Start positions of all (possibly overlapping) occurrences of sub in text"""
+    positions = []
+    pos = text.find(sub)
+    while pos != -1:
+        positions.append(pos)
+        pos = text.find(sub, pos + 1)
+    return positions
+
+
+class ProtectedRegionIndex:
+    """Index of the protected regions (formulas, HTML tables, etc.) of a text.
+
+    All the regions are located in one pass over the text, so that each
+    `is_protected` query costs O(log n) instead of rescanning the text.
+    """
+
+    BLOCK_TAGS = ['<table', '<div', '<p', '<pre', '<code', '<blockquote']
+    LATEX_DELIMITERS = [(r'\(', r'\)'), (r'\[', r'\]')]
+
+    def __init__(self, text):
+        self.text = text
+        # Inline math $...$: a position is inside when an odd number of '$' precede it
+        self.dollar_positions = _find_all(text, '$')
+        # (open tag, start positions, closing tag positions) of the HTML block elements and LaTeX delimiters
+        self.spans = []
+        for tag in self.BLOCK_TAGS:
+            starts = _find_all(text, tag)
+            if starts:
+                self.spans.append((tag, starts, _find_all(text, f'</{tag[1:]}>'), False))
+        for open_delim, close_delim in self.LATEX_DELIMITERS:
+            starts = _find_all(text, open_delim)
+            if starts:
+                self.spans.append((open_delim, starts, _find_all(text, close_delim), True))
+
+    def is_protected(self, position):
+        text = self.text
+        if bisect.bisect_left(self.dollar_positions, position) % 2 == 1:
             return True
 
-    # Check for other HTML block elements that should not be split
-    block_tags = ['<div', '<p', '<pre', '<code', '<blockquote']
-    for tag in block_tags:
-        tag_start = text.rfind(tag, 0, position)
-        if tag_start != -1:
-            # Find the corresponding closing tag
-            tag_name = tag[1:]  # Remove '<'
-            closing_tag = f'</{tag_name}>'
-            tag_end = text.find(closing_tag, tag_start)
-            if tag_end == -1 or tag_end > position:
+        # Display math: $$...$$
+        if position >= 1 and text[position - 1:position + 1] == '$$':
+            return True
+        if position < len(text) - 1 and text[position:position + 2] == '$$':
+            return True
+
+        # LaTeX delimiters: \(...\) and \[...\]
+        if position >= 1 and text[position - 1:position + 1] in [r'\(', r'\[']:
+            return True
+        if position < len(text) - 1 and text[position:position + 2] in [r'\)', r'\]']:
+            return True
+
+        for tag, starts, ends, need_closed in self.spans:
+            # the last opening before position
+            i = bisect.bisect_right(starts, position - len(tag)) - 1
+            if i < 0:
+                continue
+            # the first closing after that opening
+            j = bisect.bisect_left(ends, starts[i])
+            if j == len(ends):
+                # an unclosed HTML element protects the rest of the text, an unclosed formula doesn't
+                if not need_closed:
+                    return True
+            elif ends[j] > position:
                 return True
 
-    return False
+        return False
+
+
+def is_in_protected_region(text, position):
+    """Check if a position is within a protected region (formulas, HTML tables, etc.)
+
+    Build a `ProtectedRegionIndex` instead when checking many positions of the same text.
+    """
+    return ProtectedRegionIndex(text).is_protected(position)
 
 
 # ==============================================
@@ -829,6 +864,8 @@ class ASTMarkdownChunker:
         """
         Process the document root node and generate chunks according to requirements.
         """
+        # token count of the content accumulated by _process_node, summed up node by node
+        self._current_tokens = 0
         if not hasattr(root_node, 'children') or not root_node.children:
             # Handle simple text without structure
             content = self._render_node(root_node)
@@ -877,6 +914,7 @@ class ASTMarkdownChunker:
             new_title_stack.append((heading_text, heading_level))
 
             # Return empty content since headings are boundaries, not content
+            self._current_tokens = 0
             return "", new_title_stack
 
         # Handle container nodes that should not be split
@@ -885,8 +923,8 @@ class ASTMarkdownChunker:
             new_content = current_chunk_content + node_content
 
             # Check if this container would make the chunk too large
-            potential_chunk = self._build_chunk_with_titles(new_content, current_title_stack)
-            token_count = num_tokens_from_string(potential_chunk)
+            node_tokens = num_tokens_from_string(node_content)
+            token_count = self._count_chunk_tokens(node_tokens, current_title_stack)
 
             if token_count > chunk_tokens_number * 1.5:  # If significantly larger than target
                 # Create chunk with current content first
@@ -900,8 +938,10 @@ class ASTMarkdownChunker:
                 if container_chunk.strip():
                     self.chunks.append(container_chunk)
 
+                self._current_tokens = 0
                 return "", current_title_stack
             else:
+                self._current_tokens += node_tokens
                 return new_content, current_title_stack
 
         # Handle paragraph nodes
@@ -910,8 +950,8 @@ class ASTMarkdownChunker:
             new_content = current_chunk_content + node_content
 
             # Check chunk size
-            potential_chunk = self._build_chunk_with_titles(new_content, current_title_stack)
-            token_count = num_tokens_from_string(potential_chunk)
+            node_tokens = num_tokens_from_string(node_content)
+            token_count = self._count_chunk_tokens(node_tokens, current_title_stack)
 
             if token_count > chunk_tokens_number:
                 # Create chunk with current content
@@ -920,8 +960,10 @@ class ASTMarkdownChunker:
                     if full_content.strip():
                         self.chunks.append(full_content)
 
+                self._current_tokens = node_tokens
                 return node_content, current_title_stack
             else:
+                self._current_tokens += node_tokens
                 return new_content, current_title_stack
 
         # Handle other block nodes with children
@@ -948,8 +990,8 @@ class ASTMarkdownChunker:
                 new_content = current_chunk_content + node_content
 
                 # Check chunk size
-                potential_chunk = self._build_chunk_with_titles(new_content, current_title_stack)
-                token_count = num_tokens_from_string(potential_chunk)
+                node_tokens = num_tokens_from_string(node_content)
+                token_count = self._count_chunk_tokens(node_tokens, current_title_stack)
 
                 if token_count > chunk_tokens_number:
                     # Create chunk with current content
@@ -958,12 +1000,24 @@ class ASTMarkdownChunker:
                         if full_content.strip():
                             self.chunks.append(full_content)
 
+                    self._current_tokens = node_tokens
                     return node_content, current_title_stack
                 else:
+                    self._current_tokens += node_tokens
                     return new_content, current_title_stack
 
             return current_chunk_content, current_title_stack
 
+    def _count_chunk_tokens(self, node_tokens: int, title_stack: List[Tuple[str, int]]) -> int:
+        """
+        Token count of the chunk built from the accumulated content plus a node of node_tokens tokens,
+        summed up from the parts instead of encoding the whole chunk again.
+        """
+        if not title_stack:
+            return self._current_tokens + node_tokens
+        all_titles = "\n".join([f"{'#' * level} {title}" for title, level in title_stack])
+        return num_tokens_from_string(f"{all_titles}\n\n") + self._current_tokens + node_tokens
+
     def _build_chunk_with_titles(self, content: str, title_stack: List[Tuple[str, int]]) -> str:
         """
         Build a chunk with all relevant parent titles.
@@ -1073,14 +1127,14 @@ class ASTMarkdownChunker:
 
         merged_chunks = []
         current_chunk = self.chunks[0]
+        current_chunk_tokens = num_tokens_from_string(current_chunk)
 
         for i in range(1, len(self.chunks)):
             next_chunk = self.chunks[i]
 
-            # 计算合并后的token数
-            combined_content = current_chunk + '\n' + next_chunk
-            combined_tokens = num_tokens_from_string(combined_content)
+            # 计算合并后的token数, 由各块的token数累加得到, 不重新编码合并后的文本
             next_chunk_tokens = num_tokens_from_string(next_chunk)
+            combined_tokens = current_chunk_tokens + 1 + next_chunk_tokens
 
             # If the next chunk is too small AND combining is reasonable, merge them
             # Only merge if the combined size is still within reasonable limits
@@ -1088,10 +1142,17 @@ class ASTMarkdownChunker:
                     combined_tokens <= chunk_tokens_number * 1.2):  # Reasonable combined size
                 # 只有在需要合并时，才去除重复的标题前缀
                 combined_content = self._merge_chunks_without_duplicate_prefix(current_chunk, next_chunk)
+                # 只累加实际追加部分的token数, 去除的重复标题前缀不计入
+                appended = combined_content[len(current_chunk):]
+                if appended == '\n' + next_chunk:
+                    current_chunk_tokens = combined_tokens
+                else:
+                    current_chunk_tokens += num_tokens_from_string(appended)
                 current_chunk = combined_content
             else:
                 merged_chunks.append(current_chunk)
                 current_chunk = next_chunk
+                current_chunk_tokens = next_chunk_tokens
 
         merged_chunks.append(current_chunk)
         self.chunks = merged_chunks
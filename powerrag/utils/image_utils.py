@@ -0,0 +1,106 @@
+#
+#  Copyright 2025 The OceanBase Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+import base64
+import logging
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict
+
+from rag.utils.storage_factory import STORAGE_IMPL
+
+IMAGE_UPLOAD_CONCURRENCY = int(os.environ.get("IMAGE_UPLOAD_CONCURRENCY", 8))
+
+# a markdown image, or an HTML img tag
+IMAGE_REF_PATTERN = re.compile(r"!\[[^\]]*\]\(([^)]*)\)|<img[^>]*>")
+IMG_SRC_PATTERN = re.compile(r"""src=(?:(["'])([^"']*)\1|([^\s"'>]+))""")
+
+
+def upload_images(images_data: Dict[str, str], output_dir: str, image_url: Callable[[str], str],
+                  concurrency: int = IMAGE_UPLOAD_CONCURRENCY) -> Dict[str, str]:
+    """
+    Decode the base64 images and put them to the storage under output_dir, `concurrency` at a time.
+
+    Returns:
+        The URL of each stored image by name, as given by image_url(name). Failed images are logged and left out.
+    """
+
+    def put(item):
+        img_name, img_base64 = item
+        try:
+            # Remove data URL prefix if present
+            if "," in img_base64:
+                img_base64 = img_base64.split(",", 1)[1]
+            STORAGE_IMPL.put(output_dir, img_name, base64.b64decode(img_base64))
+            return img_name, image_url(img_name)
+        except Exception as e:
+            logging.error(f"Failed to store image {img_name}: {str(e)}")
+            return img_name, None
+
+    if not images_data:
+        return {}
+    with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(images_data)))) as executor:
+        results = list(executor.map(put, images_data.items()))
+    return {img_name: url for img_name, url in results if url}
+
+
+def _find_image(ref: str, url_map: Dict[str, str], suffix_only: bool):
+    if ref in url_map:
+        return ref
+    # the reference may carry a directory prefix
+    i = ref.find("/")
+    while i != -1:
+        if ref[i + 1:] in url_map:
+            return ref[i + 1:]
+        i = ref.find("/", i + 1)
+    for img_name in url_map:
+        if ref.endswith(img_name) or (not suffix_only and img_name in ref):
+            return img_name
+    return None
+
+
+def rewrite_image_refs(md_content: str, url_map: Dict[str, str]) -> str:
+    """
+    Point the markdown images and HTML img tags referencing the stored images to their URLs, in one pass.
+    Markdown images become HTML img tags, as the chunkers expect.
+    """
+    if not url_map or not md_content:
+        return md_content
+
+    def replace(match):
+        if match.group(1) is not None:
+            img_name = _find_image(match.group(1), url_map, suffix_only=True)
+            if img_name is None:
+                return match.group(0)
+            return f'<img src="{url_map[img_name]}" alt="$$00$$" style="max-width: 60%; height: auto;">'
+
+        img_tag = match.group(0)
+        src = IMG_SRC_PATTERN.search(img_tag)
+        if not src:
+            return img_tag
+        group = 2 if src.group(2) is not None else 3
+        img_name = _find_image(src.group(group), url_map, suffix_only=False)
+        if img_name is None:
+            return img_tag
+        return img_tag[:src.start(group)] + url_map[img_name] + img_tag[src.end(group):]
+
+    return IMAGE_REF_PATTERN.sub(replace, md_content)
+
+
+def store_images(md_content: str, images_data: Dict[str, str], output_dir: str, image_url: Callable[[str], str]) -> str:
+    """Upload the images concurrently, then rewrite their references in md_content."""
+    return rewrite_image_refs(md_content, upload_images(images_data, output_dir, image_url))
@@ -1,10 +1,41 @@
+import os
+import threading
+from collections import OrderedDict
+
 import tiktoken
+import xxhash
 
 encoder = tiktoken.get_encoding("cl100k_base")
 
+# Token counts of recently seen texts, keyed by the 64-bit hash of the text so that the cache
+# doesn't keep the texts alive. Bounded to TOKEN_COUNT_CACHE_SIZE entries in LRU order.
+TOKEN_COUNT_CACHE_SIZE = int(os.environ.get("TOKEN_COUNT_CACHE_SIZE", "65536"))
+_token_count_cache = OrderedDict()
+_token_count_lock = threading.Lock()
+
+
 def num_tokens_from_string(string: str, model_name: str = "cl100k_base") -> int:
     """Returns the number of tokens in a text string."""
+    if not string:
+        return 0
+    try:
+        key = xxhash.xxh64_intdigest(string)
+    except Exception:
+        return 0
+
+    with _token_count_lock:
+        count = _token_count_cache.get(key)
+        if count is not None:
+            _token_count_cache.move_to_end(key)
+            return count
+
     try:
-        return len(encoder.encode(string))
+        count = len(encoder.encode(string))
     except Exception:
-        return 0
\ No newline at end of file
+        return 0
+
+    with _token_count_lock:
+        _token_count_cache[key] = count
+        if len(_token_count_cache) > TOKEN_COUNT_CACHE_SIZE:
+            _token_count_cache.popitem(last=False)
+    return count
@@ -16,6 +16,7 @@
 import datetime
 import json
 import logging
+import os
 import random
 from timeit import default_timer as timer
 import trio
@@ -25,6 +26,37 @@ from api.db.services.task_service import has_canceled, TaskService, CANVAS_DEBUG
 from rag.utils.redis_conn import REDIS_CONN
 
 
+# the trace of a run is bounded, beyond it only the failures and the end are kept
+PIPELINE_TRACE_MAX_LEN = int(os.environ.get("PIPELINE_TRACE_MAX_LEN", 5000))
+# seconds between two progress writes of the task, and between two looks at its cancel flag
+PIPELINE_PROGRESS_INTERVAL = float(os.environ.get("PIPELINE_PROGRESS_INTERVAL", 1))
+PIPELINE_CANCEL_CHECK_INTERVAL = float(os.environ.get("PIPELINE_CANCEL_CHECK_INTERVAL", 1))
+PIPELINE_TRACE_EXPIRE = 60 * 30
+
+
+def pipeline_trace_key(flow_id, task_id) -> str:
+    # a list, apart from the "-logs" JSON of the agent canvases
+    return f"{flow_id}-{task_id}-trace"
+
+
+def fetch_pipeline_logs(flow_id, task_id) -> list:
+    """
+    The trace of a run, the consecutive entries of a component grouped as [{"component_id", "trace": [...]}].
+    """
+    try:
+        entries = REDIS_CONN.lrange_obj(pipeline_trace_key(flow_id, task_id))
+    except Exception as e:
+        logging.exception(e)
+        return []
+    logs = []
+    for t in entries:
+        component_id = t.pop("component_id", None)
+        if not logs or logs[-1]["component_id"] != component_id:
+            logs.append({"component_id": component_id, "trace": []})
+        logs[-1]["trace"].append(t)
+    return logs
+
+
 class Pipeline(Graph):
     def __init__(self, dsl: str|dict, tenant_id=None, doc_id=None, task_id=None, flow_id=None):
         if isinstance(dsl, dict):
@@ -39,85 +71,98 @@ class Pipeline(Graph):
             self._kb_id = DocumentService.get_knowledgebase_id(doc_id)
             if not self._kb_id:
                 self._doc_id = None
+        self._reset_trace()
+
+    def _reset_trace(self):
+        # the trace is appended to the log, its progress is kept here instead of being read back
+        self._trace_len = 0
+        self._trace_component = None
+        self._trace_timestamp = None
+        self._trace_done = 0.0
+        self._trace_progress = 0.0
+        self._trace_failed = False
+        self._pending_msgs = []
+        self._progress_flushed_at = 0.0
+        self._canceled = False
+        self._cancel_checked_at = None
+
+    def _has_canceled(self) -> bool:
+        now = timer()
+        if not self._canceled and (self._cancel_checked_at is None or now - self._cancel_checked_at >= PIPELINE_CANCEL_CHECK_INTERVAL):
+            self._cancel_checked_at = now
+            self._canceled = has_canceled(self.task_id)
+        return self._canceled
+
+    def _flush_progress(self, force=False):
+        if not self._pending_msgs or not self._doc_id or not self.task_id:
+            return
+        now = timer()
+        if not force and now - self._progress_flushed_at < PIPELINE_PROGRESS_INTERVAL:
+            return
+        finished = -1 if self._trace_failed else self._trace_done + self._trace_progress / len(self.components.items())
+        TaskService.update_progress(self.task_id, {"progress": finished, "progress_msg": "".join(self._pending_msgs)})
+        self._pending_msgs = []
+        self._progress_flushed_at = now
 
     def callback(self, component_name: str, progress: float | int | None = None, message: str = "") -> None:
         from rag.svr.task_executor import TaskCanceledException
-        log_key = f"{self._flow_id}-{self.task_id}-logs"
+        log_key = pipeline_trace_key(self._flow_id, self.task_id)
         timestamp = timer()
-        if has_canceled(self.task_id):
+        if self._has_canceled():
             progress = -1
             message += "[CANCEL]"
         try:
-            bin = REDIS_CONN.get(log_key)
-            obj = json.loads(bin.encode("utf-8"))
-            if obj:
-                if obj[-1]["component_id"] == component_name:
-                    obj[-1]["trace"].append(
-                        {
-                            "progress": progress,
-                            "message": message,
-                            "datetime": datetime.datetime.now().strftime("%H:%M:%S"),
-                            "timestamp": timestamp,
-                            "elapsed_time": timestamp - obj[-1]["trace"][-1]["timestamp"],
-                        }
-                    )
-                else:
-                    obj.append(
-                        {
-                            "component_id": component_name,
-                            "trace": [{"progress": progress, "message": message, "datetime": datetime.datetime.now().strftime("%H:%M:%S"), "timestamp": timestamp, "elapsed_time": 0}],
-                        }
-                    )
-            else:
-                obj = [
-                    {
-                        "component_id": component_name,
-                        "trace": [{"progress": progress, "message": message, "datetime": datetime.datetime.now().strftime("%H:%M:%S"), "timestamp": timestamp, "elapsed_time": 0}],
-                    }
-                ]
-            if component_name != "END" and self._doc_id and self.task_id:
-                percentage = 1.0 / len(self.components.items())
-                finished = 0.0
-                for o in obj:
-                    for t in o["trace"]:
-                        if t["progress"] < 0:
-                            finished = -1
-                            break
-                    if finished < 0:
-                        break
-                    finished += o["trace"][-1]["progress"] * percentage
+            new_component = component_name != self._trace_component
+            t = {
+                "component_id": component_name,
+                "progress": progress,
+                "message": message,
+                "datetime": datetime.datetime.now().strftime("%H:%M:%S"),
+                "timestamp": timestamp,
+                "elapsed_time": 0 if new_component else timestamp - self._trace_timestamp,
+            }
+            final = component_name == "END" or (progress is not None and progress < 0)
+            if component_name == "END" and not self._doc_id:
+                t["dsl"] = json.loads(str(self))
+            if self._trace_len < PIPELINE_TRACE_MAX_LEN or final:
+                REDIS_CONN.rpush_obj(log_key, t, PIPELINE_TRACE_EXPIRE)
+                self._trace_len += 1
+
+            if component_name == "END":
+                # the messages of the last component, END doesn't count in the progress
+                self._flush_progress(force=True)
+            if new_component and self._trace_component is not None:
+                self._trace_done += self._trace_progress / len(self.components.items())
+                self._trace_progress = 0.0
+            self._trace_component = component_name
+            self._trace_timestamp = timestamp
+            if progress is not None:
+                self._trace_progress = progress
+                if progress < 0:
+                    self._trace_failed = True
 
+            if component_name != "END" and self._doc_id and self.task_id:
                 msg = ""
-                if len(obj[-1]["trace"]) == 1:
-                    msg += f"\n-------------------------------------\n[{self.get_component_name(o['component_id'])}]:\n"
-                t = obj[-1]["trace"][-1]
+                if new_component:
+                    msg += f"\n-------------------------------------\n[{self.get_component_name(component_name)}]:\n"
                 msg += "%s: %s\n" % (t["datetime"], t["message"])
-                TaskService.update_progress(self.task_id, {"progress": finished, "progress_msg": msg})
-            elif component_name == "END" and not self._doc_id:
-                obj[-1]["trace"][-1]["dsl"] = json.loads(str(self))
-            REDIS_CONN.set_obj(log_key, obj, 60 * 30)
+                self._pending_msgs.append(msg)
+            self._flush_progress(force=final or self._canceled)
 
         except Exception as e:
             logging.exception(e)
 
-        if has_canceled(self.task_id):
+        if self._canceled:
             raise TaskCanceledException(message)
 
     def fetch_logs(self):
-        log_key = f"{self._flow_id}-{self.task_id}-logs"
-        try:
-            bin = REDIS_CONN.get(log_key)
-            if bin:
-                return json.loads(bin.encode("utf-8"))
-        except Exception as e:
-            logging.exception(e)
-        return []
-
+        return fetch_pipeline_logs(self._flow_id, self.task_id)
 
     async def run(self, **kwargs):
-        log_key = f"{self._flow_id}-{self.task_id}-logs"
+        log_key = pipeline_trace_key(self._flow_id, self.task_id)
+        self._reset_trace()
         try:
-            REDIS_CONN.set_obj(log_key, [], 60 * 10)
+            REDIS_CONN.ldelete(log_key)
         except Exception as e:
             logging.exception(e)
         self.error = ""
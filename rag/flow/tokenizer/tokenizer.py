@@ -17,19 +17,16 @@ import random
 import re
 
 import numpy as np
-import trio
 
 from api.db import LLMType
 from api.db.services.knowledgebase_service import KnowledgebaseService
 from api.db.services.llm_service import LLMBundle
 from api.db.services.user_service import TenantService
-from api.utils.api_utils import timeout
 from rag.flow.base import ProcessBase, ProcessParamBase
 from rag.flow.tokenizer.schema import TokenizerFromUpstream
 from rag.nlp import rag_tokenizer
 from rag.settings import EMBEDDING_BATCH_SIZE
-from rag.svr.task_executor import embed_limiter
-from rag.utils import truncate
+from rag.svr.task_executor import EMBEDDING_BATCHER
 
 
 class TokenizerParam(ProcessParamBase):
@@ -74,15 +71,9 @@ class Tokenizer(ProcessBase):
         token_count += c
         tts = np.concatenate([vts[0] for _ in range(len(texts))], axis=0)
 
-        @timeout(60)
-        def batch_encode(txts):
-            nonlocal embedding_model
-            return embedding_model.encode([truncate(c, embedding_model.max_length - 10) for c in txts])
-
         cnts_ = np.array([])
         for i in range(0, len(texts), EMBEDDING_BATCH_SIZE):
-            async with embed_limiter:
-                vts, c = await trio.to_thread.run_sync(lambda: batch_encode(texts[i : i + EMBEDDING_BATCH_SIZE]))
+            vts, c = await EMBEDDING_BATCHER.encode(embedding_model, texts[i : i + EMBEDDING_BATCH_SIZE])
             if len(cnts_) == 0:
                 cnts_ = vts
             else:
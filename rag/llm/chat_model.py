@@ -28,13 +28,13 @@ from urllib.parse import urljoin
 import json_repair
 import litellm
 import openai
-import requests
 from openai import OpenAI
 from openai.lib.azure import AzureOpenAI
 from strenum import StrEnum
 from zhipuai import ZhipuAI
 
 from rag.llm import FACTORY_DEFAULT_BASE_URL, LITELLM_PROVIDER_PREFIX, SupportedLiteLLMProvider
+from rag.llm.http_client import http_session, pooled_client
 from rag.nlp import is_chinese, is_english
 from rag.utils import num_tokens_from_string, total_token_count_from_response
 
@@ -72,7 +72,7 @@ class ToolCallSession(Protocol):
 class Base(ABC):
     def __init__(self, key, model_name, base_url, **kwargs):
         timeout = int(os.environ.get("LM_TIMEOUT_SECONDS", 600))
-        self.client = OpenAI(api_key=key, base_url=base_url, timeout=timeout)
+        self.client = pooled_client(OpenAI, api_key=key, base_url=base_url, timeout=timeout)
         self.model_name = model_name
         # Configure retry parameters
         self.max_retries = kwargs.get("max_retries", int(os.environ.get("LLM_MAX_RETRIES", 5)))
@@ -555,7 +555,7 @@ class AzureChat(Base):
         api_key = json.loads(key).get("api_key", "")
         api_version = json.loads(key).get("api_version", "2024-02-01")
         super().__init__(key, model_name, base_url, **kwargs)
-        self.client = AzureOpenAI(api_key=api_key, azure_endpoint=base_url, api_version=api_version)
+        self.client = pooled_client(AzureOpenAI, api_key=api_key, azure_endpoint=base_url, api_version=api_version)
         self.model_name = model_name
 
     @property
@@ -711,7 +711,7 @@ class LocalAIChat(Base):
         if not base_url:
             raise ValueError("Local llm url cannot be None")
         base_url = urljoin(base_url, "v1")
-        self.client = OpenAI(api_key="empty", base_url=base_url)
+        self.client = pooled_client(OpenAI, api_key="empty", base_url=base_url)
         self.model_name = model_name.split("___")[0]
 
 
@@ -801,7 +801,7 @@ class MiniMaxChat(Base):
             "Content-Type": "application/json",
         }
         payload = json.dumps({"model": self.model_name, "messages": history, **gen_conf})
-        response = requests.request("POST", url=self.base_url, headers=headers, data=payload)
+        response = http_session().request("POST", url=self.base_url, headers=headers, data=payload)
         response = response.json()
         ans = response["choices"][0]["message"]["content"].strip()
         if response["choices"][0]["finish_reason"] == "length":
@@ -832,7 +832,7 @@ class MiniMaxChat(Base):
                     **gen_conf,
                 }
             )
-            response = requests.request(
+            response = http_session().request(
                 "POST",
                 url=self.base_url,
                 headers=headers,
@@ -919,7 +919,7 @@ class LmStudioChat(Base):
             raise ValueError("Local llm url cannot be None")
         base_url = urljoin(base_url, "v1")
         super().__init__(key, model_name, base_url, **kwargs)
-        self.client = OpenAI(api_key="lm-studio", base_url=base_url)
+        self.client = pooled_client(OpenAI, api_key="lm-studio", base_url=base_url)
         self.model_name = model_name
 
 
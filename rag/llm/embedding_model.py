@@ -24,7 +24,6 @@ from urllib.parse import urljoin
 import dashscope
 import google.generativeai as genai
 import numpy as np
-import requests
 from huggingface_hub import snapshot_download
 from ollama import Client
 from openai import OpenAI
@@ -33,6 +32,7 @@ from zhipuai import ZhipuAI
 from api import settings
 from api.utils.file_utils import get_home_cache_dir
 from api.utils.log_utils import log_exception
+from rag.llm.http_client import http_session, pooled_client
 from rag.utils import num_tokens_from_string, truncate
 
 
@@ -136,7 +136,7 @@ class OpenAIEmbed(Base):
     def __init__(self, key, model_name="text-embedding-ada-002", base_url="https://api.openai.com/v1"):
         if not base_url:
             base_url = "https://api.openai.com/v1"
-        self.client = OpenAI(api_key=key, base_url=base_url)
+        self.client = pooled_client(OpenAI, api_key=key, base_url=base_url)
         self.model_name = model_name
 
     def encode(self, texts: list):
@@ -166,7 +166,7 @@ class LocalAIEmbed(Base):
         if not base_url:
             raise ValueError("Local embedding model url cannot be None")
         base_url = urljoin(base_url, "v1")
-        self.client = OpenAI(api_key="empty", base_url=base_url)
+        self.client = pooled_client(OpenAI, api_key="empty", base_url=base_url)
         self.model_name = model_name.split("___")[0]
 
     def encode(self, texts: list):
@@ -194,7 +194,7 @@ class AzureEmbed(OpenAIEmbed):
 
         api_key = json.loads(key).get("api_key", "")
         api_version = json.loads(key).get("api_version", "2024-02-01")
-        self.client = AzureOpenAI(api_key=api_key, azure_endpoint=kwargs["base_url"], api_version=api_version)
+        self.client = pooled_client(AzureOpenAI, api_key=api_key, azure_endpoint=kwargs["base_url"], api_version=api_version)
         self.model_name = model_name
 
 
@@ -376,7 +376,7 @@ class XinferenceEmbed(Base):
 
     def __init__(self, key, model_name="", base_url=""):
         base_url = urljoin(base_url, "v1")
-        self.client = OpenAI(api_key=key, base_url=base_url)
+        self.client = pooled_client(OpenAI, api_key=key, base_url=base_url)
         self.model_name = model_name
 
     def encode(self, texts: list):
@@ -447,7 +447,7 @@ class JinaEmbed(Base):
         token_count = 0
         for i in range(0, len(texts), batch_size):
             data = {"model": self.model_name, "input": texts[i : i + batch_size], "encoding_type": "float"}
-            response = requests.post(self.base_url, headers=self.headers, json=data)
+            response = http_session().post(self.base_url, headers=self.headers, json=data)
             try:
                 res = response.json()
                 ress.extend([d["embedding"] for d in res["data"]])
@@ -630,7 +630,7 @@ class NvidiaEmbed(Base):
                 "encoding_format": "float",
                 "truncate": "END",
             }
-            response = requests.post(self.base_url, headers=self.headers, json=payload)
+            response = http_session().post(self.base_url, headers=self.headers, json=payload)
             try:
                 res = response.json()
             except Exception as _e:
@@ -651,7 +651,7 @@ class LmStudioEmbed(LocalAIEmbed):
         if not base_url:
             raise ValueError("Local llm url cannot be None")
         base_url = urljoin(base_url, "v1")
-        self.client = OpenAI(api_key="lm-studio", base_url=base_url)
+        self.client = pooled_client(OpenAI, api_key="lm-studio", base_url=base_url)
         self.model_name = model_name
 
 
@@ -662,7 +662,7 @@ class OpenAI_APIEmbed(OpenAIEmbed):
         if not base_url:
             raise ValueError("url cannot be None")
         base_url = urljoin(base_url, "v1")
-        self.client = OpenAI(api_key=key, base_url=base_url)
+        self.client = pooled_client(OpenAI, api_key=key, base_url=base_url)
         self.model_name = model_name.split("___")[0]
 
 
@@ -764,7 +764,7 @@ class SILICONFLOWEmbed(Base):
                 "input": texts_batch,
                 "encoding_format": "float",
             }
-            response = requests.post(self.base_url, json=payload, headers=self.headers)
+            response = http_session().post(self.base_url, json=payload, headers=self.headers)
             try:
                 res = response.json()
                 ress.extend([d["embedding"] for d in res["data"]])
@@ -780,7 +780,7 @@ class SILICONFLOWEmbed(Base):
             "input": text,
             "encoding_format": "float",
         }
-        response = requests.post(self.base_url, json=payload, headers=self.headers)
+        response = http_session().post(self.base_url, json=payload, headers=self.headers)
         try:
             res = response.json()
             return np.array(res["data"][0]["embedding"]), self.total_token_count(res)
@@ -887,7 +887,7 @@ class HuggingFaceEmbed(Base):
     def encode(self, texts: list):
         embeddings = []
         for text in texts:
-            response = requests.post(f"{self.base_url}/embed", json={"inputs": text}, headers={"Content-Type": "application/json"})
+            response = http_session().post(f"{self.base_url}/embed", json={"inputs": text}, headers={"Content-Type": "application/json"})
             if response.status_code == 200:
                 embedding = response.json()
                 embeddings.append(embedding[0])
@@ -896,7 +896,7 @@ class HuggingFaceEmbed(Base):
         return np.array(embeddings), sum([num_tokens_from_string(text) for text in texts])
 
     def encode_queries(self, text):
-        response = requests.post(f"{self.base_url}/embed", json={"inputs": text}, headers={"Content-Type": "application/json"})
+        response = http_session().post(f"{self.base_url}/embed", json={"inputs": text}, headers={"Content-Type": "application/json"})
         if response.status_code == 200:
             embedding = response.json()
             return np.array(embedding[0]), num_tokens_from_string(text)
@@ -923,7 +923,7 @@ class GPUStackEmbed(OpenAIEmbed):
             raise ValueError("url cannot be None")
         base_url = urljoin(base_url, "v1")
 
-        self.client = OpenAI(api_key=key, base_url=base_url)
+        self.client = pooled_client(OpenAI, api_key=key, base_url=base_url)
         self.model_name = model_name
 
 
@@ -0,0 +1,201 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+"""
+Process-wide HTTP connection pools of the model providers.
+
+The model objects are created for each request, the connections they use are not: the SDK clients are shared by
+(client class, base url, api key, options) and built on one keep-alive httpx pool, the plain HTTP calls go through
+one pooled requests session. A chat then reuses the connections of the previous ones instead of paying a TCP and
+TLS handshake to the model endpoint.
+"""
+
+import importlib.util
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+LLM_HTTP_MAX_CONNECTIONS = int(os.environ.get("LLM_HTTP_MAX_CONNECTIONS", 256))
+LLM_HTTP_MAX_KEEPALIVE = int(os.environ.get("LLM_HTTP_MAX_KEEPALIVE", 64))
+LLM_HTTP_KEEPALIVE_EXPIRY = float(os.environ.get("LLM_HTTP_KEEPALIVE_EXPIRY", 60))
+# HTTP/2 is only negotiated when the h2 package is installed
+LLM_HTTP2 = os.environ.get("LLM_HTTP2", "true").lower() in ["true", "1", "yes", "y"] and importlib.util.find_spec("h2") is not None
+LLM_CLIENT_CACHE_SIZE = int(os.environ.get("LLM_CLIENT_CACHE_SIZE", 256))
+
+
+class EndpointStats:
+    """Requests, errors, new connections and response latency (until the headers) by endpoint."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = defaultdict(lambda: {"requests": 0, "errors": 0, "connections": 0, "latency": 0.0})
+
+    def record_response(self, endpoint: str, status_code: int, elapsed: float):
+        with self._lock:
+            st = self._stats[endpoint]
+            st["requests"] += 1
+            st["latency"] += elapsed
+            if status_code >= 400:
+                st["errors"] += 1
+
+    def record_connection(self, endpoint: str):
+        with self._lock:
+            self._stats[endpoint]["connections"] += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                endpoint: {
+                    "requests": st["requests"],
+                    "errors": st["errors"],
+                    "connections": st["connections"],
+                    "avg_latency": round(st["latency"] / st["requests"], 3) if st["requests"] else 0,
+                }
+                for endpoint, st in self._stats.items()
+            }
+
+
+_lock = threading.Lock()
+_pid = None
+_httpx_client = None
+_session = None
+_clients = OrderedDict()
+_stats = EndpointStats()
+
+
+def _endpoint(url) -> str:
+    return f"{url.scheme}://{url.host}" + (f":{url.port}" if url.port else "")
+
+
+def _on_request(request: httpx.Request):
+    endpoint = _endpoint(request.url)
+
+    def trace(event_name, info):
+        if event_name == "connection.connect_tcp.complete":
+            _stats.record_connection(endpoint)
+
+    request.extensions["trace"] = trace
+    request.extensions["llm_request_start"] = time.perf_counter()
+
+
+def _on_response(response: httpx.Response):
+    start = response.request.extensions.get("llm_request_start")
+    elapsed = time.perf_counter() - start if start else 0.0
+    _stats.record_response(_endpoint(response.request.url), response.status_code, elapsed)
+
+
+def _on_session_response(response: requests.Response, *args, **kwargs):
+    endpoint = _endpoint(httpx.URL(response.url))
+    _stats.record_response(endpoint, response.status_code, response.elapsed.total_seconds())
+
+
+class _CountingAdapter(HTTPAdapter):
+    def get_connection_with_tls_context(self, request, verify, proxies=None, cert=None):
+        conn = super().get_connection_with_tls_context(request, verify, proxies=proxies, cert=cert)
+        _watch_pool(conn)
+        return conn
+
+
+def _watch_pool(pool):
+    # urllib3 counts the connections a pool opened, the difference since the last look are new ones
+    seen = getattr(pool, "_llm_seen_connections", 0)
+    if pool.num_connections > seen:
+        endpoint = f"{pool.scheme}://{pool.host}" + (f":{pool.port}" if pool.port else "")
+        for _ in range(pool.num_connections - seen):
+            _stats.record_connection(endpoint)
+        pool._llm_seen_connections = pool.num_connections
+
+
+def _check_fork():
+    # pools must not be shared with a forked child, whose sockets would be the parent's
+    global _pid, _httpx_client, _session
+    if _pid != os.getpid():
+        _pid = os.getpid()
+        _httpx_client = None
+        _session = None
+        _clients.clear()
+
+
+def get_httpx_client() -> httpx.Client:
+    """The pooled httpx client shared by the SDK clients of all the providers."""
+    global _httpx_client
+    with _lock:
+        _check_fork()
+        if _httpx_client is None:
+            _httpx_client = httpx.Client(
+                http2=LLM_HTTP2,
+                follow_redirects=True,
+                limits=httpx.Limits(
+                    max_connections=LLM_HTTP_MAX_CONNECTIONS,
+                    max_keepalive_connections=LLM_HTTP_MAX_KEEPALIVE,
+                    keepalive_expiry=LLM_HTTP_KEEPALIVE_EXPIRY,
+                ),
+                event_hooks={"request": [_on_request], "response": [_on_response]},
+            )
+            logging.info(f"LLM HTTP pool: max connections {LLM_HTTP_MAX_CONNECTIONS}, keep-alive {LLM_HTTP_MAX_KEEPALIVE}, http2 {LLM_HTTP2}")
+        return _httpx_client
+
+
+def http_session() -> requests.Session:
+    """The pooled requests session of the providers that are called over plain HTTP, used as `requests`."""
+    global _session
+    with _lock:
+        _check_fork()
+        if _session is None:
+            session = requests.Session()
+            adapter = _CountingAdapter(pool_connections=LLM_HTTP_MAX_KEEPALIVE, pool_maxsize=LLM_HTTP_MAX_CONNECTIONS)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            session.hooks["response"].append(_on_session_response)
+            _session = session
+        return _session
+
+
+def pooled_client(client_cls, **kwargs):
+    """
+    The shared `client_cls(**kwargs)`, e.g. OpenAI or AzureOpenAI, built on the pooled httpx client.
+    The clients are kept by their arguments, the least recently used ones are dropped beyond LLM_CLIENT_CACHE_SIZE.
+    """
+    key = (client_cls, tuple(sorted((k, repr(v)) for k, v in kwargs.items())))
+    http_client = get_httpx_client()
+    with _lock:
+        client = _clients.get(key)
+        if client is not None:
+            _clients.move_to_end(key)
+            return client
+    client = client_cls(http_client=http_client, **kwargs)
+    with _lock:
+        _clients[key] = client
+        while len(_clients) > LLM_CLIENT_CACHE_SIZE:
+            # not closed, that would close the shared pool
+            _clients.popitem(last=False)
+    return client
+
+
+def connection_stats() -> dict:
+    """Per endpoint requests, errors, new connections and average latency of the model providers since start."""
+    if _session is not None:
+        for adapter in set(_session.adapters.values()):
+            for pool_key in adapter.poolmanager.pools.keys():
+                pool = adapter.poolmanager.pools.get(pool_key)
+                if pool is not None:
+                    _watch_pool(pool)
+    return _stats.snapshot()
@@ -24,6 +24,7 @@ import requests
 from openai import OpenAI
 from openai.lib.azure import AzureOpenAI
 
+from rag.llm.http_client import http_session, pooled_client
 from rag.utils import num_tokens_from_string
 
 
@@ -54,7 +55,7 @@ class GPTSeq2txt(Base):
     def __init__(self, key, model_name="whisper-1", base_url="https://api.openai.com/v1", **kwargs):
         if not base_url:
             base_url = "https://api.openai.com/v1"
-        self.client = OpenAI(api_key=key, base_url=base_url)
+        self.client = pooled_client(OpenAI, api_key=key, base_url=base_url)
         self.model_name = model_name
 
 
@@ -99,7 +100,7 @@ class AzureSeq2txt(Base):
     _FACTORY_NAME = "Azure-OpenAI"
 
     def __init__(self, key, model_name, lang="Chinese", **kwargs):
-        self.client = AzureOpenAI(api_key=key, azure_endpoint=kwargs["base_url"], api_version="2024-02-01")
+        self.client = pooled_client(AzureOpenAI, api_key=key, azure_endpoint=kwargs["base_url"], api_version="2024-02-01")
         self.model_name = model_name
         self.lang = lang
 
@@ -126,7 +127,7 @@ class XinferenceSeq2txt(Base):
         files = {"file": (audio_file_name, audio_data, "audio/wav")}
 
         try:
-            response = requests.post(f"{self.base_url}/v1/audio/transcriptions", files=files, data=payload)
+            response = http_session().post(f"{self.base_url}/v1/audio/transcriptions", files=files, data=payload)
             response.raise_for_status()
             result = response.json()
 
@@ -221,7 +222,7 @@ class GiteeSeq2txt(Base):
     def __init__(self, key, model_name="whisper-1", base_url="https://ai.gitee.com/v1/", **kwargs):
         if not base_url:
             base_url = "https://ai.gitee.com/v1/"
-        self.client = OpenAI(api_key=key, base_url=base_url)
+        self.client = pooled_client(OpenAI, api_key=key, base_url=base_url)
         self.model_name = model_name
 
 
@@ -232,7 +233,7 @@ class DeepInfraSeq2txt(Base):
         if not base_url:
             base_url = "https://api.deepinfra.com/v1/openai"
 
-        self.client = OpenAI(api_key=key, base_url=base_url)
+        self.client = pooled_client(OpenAI, api_key=key, base_url=base_url)
         self.model_name = model_name
 
 
@@ -242,7 +243,7 @@ class CometAPISeq2txt(Base):
     def __init__(self, key, model_name="whisper-1", base_url="https://api.cometapi.com/v1", **kwargs):
         if not base_url:
             base_url = "https://api.cometapi.com/v1"
-        self.client = OpenAI(api_key=key, base_url=base_url)
+        self.client = pooled_client(OpenAI, api_key=key, base_url=base_url)
         self.model_name = model_name
 
 
@@ -252,7 +253,7 @@ class DeerAPISeq2txt(Base):
     def __init__(self, key, model_name="whisper-1", base_url="https://api.deerapi.com/v1", **kwargs):
         if not base_url:
             base_url = "https://api.deerapi.com/v1"
-        self.client = OpenAI(api_key=key, base_url=base_url)
+        self.client = pooled_client(OpenAI, api_key=key, base_url=base_url)
         self.model_name = model_name
 
 
@@ -280,7 +281,7 @@ class ZhipuSeq2txt(Base):
             files = {"file": audio_file}
 
             try:
-                response = requests.post(
+                response = http_session().post(
                     url=f"{self.base_url}/audio/transcriptions",
                     data=payload,
                     files=files,
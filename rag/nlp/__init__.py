@@ -271,8 +271,18 @@ def tokenize(d, t, eng):
     d["content_sm_ltks"] = rag_tokenizer.fine_grained_tokenize(d["content_ltks"])
 
 
+def tokenize_many(docs, texts, eng):
+    """Same as tokenize(d, t, eng) for each pair of docs and texts, tokenizing the texts as a batch."""
+    for d, t in zip(docs, texts):
+        d["content_with_weight"] = t
+    texts = [re.sub(r"</?(table|td|caption|tr|th)( [^<>]{0,12})?>", " ", t) for t in texts]
+    for d, ltks in zip(docs, rag_tokenizer.tokenize_many(texts)):
+        d["content_ltks"] = ltks
+        d["content_sm_ltks"] = rag_tokenizer.fine_grained_tokenize(ltks)
+
+
 def tokenize_chunks(chunks, doc, eng, pdf_parser=None):
-    res = []
+    res, texts = [], []
     # wrap up as es documents
     for ii, ck in enumerate(chunks):
         if len(ck.strip()) == 0:
@@ -288,13 +298,14 @@ def tokenize_chunks(chunks, doc, eng, pdf_parser=None):
                 pass
         else:
             add_positions(d, [[ii]*5])
-        tokenize(d, ck, eng)
         res.append(d)
+        texts.append(ck)
+    tokenize_many(res, texts, eng)
     return res
 
 
 def tokenize_chunks_with_images(chunks, doc, eng, images):
-    res = []
+    res, texts = [], []
     # wrap up as es documents
     for ii, (ck, image) in enumerate(zip(chunks, images)):
         if len(ck.strip()) == 0:
@@ -303,8 +314,9 @@ def tokenize_chunks_with_images(chunks, doc, eng, images):
         d = copy.deepcopy(doc)
         d["image"] = image
         add_positions(d, [[ii]*5])
-        tokenize(d, ck, eng)
         res.append(d)
+        texts.append(ck)
+    tokenize_many(res, texts, eng)
     return res
 
 
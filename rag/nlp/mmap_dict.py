@@ -0,0 +1,270 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+"""
+Precompiled, memory-mapped dictionaries for the tokenizer and the term weighting.
+
+A compiled dictionary is a read-only open addressing hash table: the 64-bit hashes of the keys,
+and parallel arrays of numbers, tag ids and flags. It is mapped rather than loaded, so opening it takes
+milliseconds and all the processes of a host share its pages through the page cache.
+
+Each file records the format version and a hash of the source it was compiled from. A file that doesn't
+match is ignored, the callers then load the source as before. Build them with:
+
+    python -m rag.nlp.mmap_dict
+
+The Docker image builds them, a source checkout has to run it once, and again once rag/res changes.
+"""
+
+import codecs
+import json
+import logging
+import mmap
+import os
+import struct
+import sys
+from array import array
+
+import xxhash
+
+FORMAT_VERSION = 1
+MAGIC = b"RAGDICT\0"
+# magic, version, value kind, capacity, number of keys, source hash, length of the tag table
+HEADER = struct.Struct("<8sIIQQQQ")
+
+VALUE_NUM = 0
+VALUE_TAG = 1
+VALUE_PAIR = 2
+
+FLAG_KEY = 1
+FLAG_PREFIX = 2
+FLAG_NUM_ONLY = 4
+
+
+def _hash(key: str) -> int:
+    # 0 marks an empty slot
+    return xxhash.xxh64_intdigest(key.encode("utf-8", "surrogatepass")) or 1
+
+
+def file_hash(path: str) -> int:
+    h = xxhash.xxh64()
+    with open(path, "rb") as f:
+        while True:
+            buf = f.read(1 << 20)
+            if not buf:
+                break
+            h.update(buf)
+    return h.intdigest()
+
+
+def _pad8(n: int) -> int:
+    return (n + 7) & ~7
+
+
+class MmapDict:
+    """
+    Read-only mapping over a compiled dictionary. Depending on the value kind of the file, a key maps to
+    its number, its tag, or the (number, tag) pair; `has_keys_with_prefix` follows datrie.Trie.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.version, self.value_kind, cap, self._n, self.source_hash, tags_len = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a compiled dictionary")
+        off = HEADER.size
+        self._tags = json.loads(bytes(self._mm[off: off + tags_len]).decode("utf-8"))
+        off = _pad8(off + tags_len)
+        mv = memoryview(self._mm)
+        self._hashes = mv[off: off + 8 * cap].cast("Q")
+        off += 8 * cap
+        self._nums = mv[off: off + 4 * cap].cast("i")
+        off += 4 * cap
+        self._tag_ids = mv[off: off + 2 * cap].cast("H")
+        off += _pad8(2 * cap)
+        self._flags = mv[off: off + cap].cast("B")
+        self._mask = cap - 1
+
+    @classmethod
+    def open(cls, path: str, source: str | None = None):
+        """
+        Open the compiled dictionary at path, or return None if it's missing, or stale regarding source.
+        """
+        if not os.path.exists(path):
+            return None
+        try:
+            d = cls(path)
+        except Exception:
+            logging.exception(f"Fail to open the compiled dictionary {path}")
+            return None
+        if d.version != FORMAT_VERSION:
+            logging.warning(f"Compiled dictionary {path} has version {d.version}, expected {FORMAT_VERSION}, run `python -m rag.nlp.mmap_dict` to rebuild it")
+            return None
+        if source and os.path.exists(source) and file_hash(source) != d.source_hash:
+            logging.warning(f"Compiled dictionary {path} is stale regarding {source}, run `python -m rag.nlp.mmap_dict` to rebuild it")
+            return None
+        return d
+
+    def _find(self, key: str) -> int:
+        h = _hash(key)
+        hashes, mask = self._hashes, self._mask
+        i = h & mask
+        while True:
+            v = hashes[i]
+            if v == h:
+                return i
+            if v == 0:
+                return -1
+            i = (i + 1) & mask
+
+    def _value(self, i: int):
+        if self._flags[i] & FLAG_NUM_ONLY or self.value_kind == VALUE_NUM:
+            return self._nums[i]
+        if self.value_kind == VALUE_TAG:
+            return self._tags[self._tag_ids[i]]
+        return self._nums[i], self._tags[self._tag_ids[i]]
+
+    def __contains__(self, key: str) -> bool:
+        i = self._find(key)
+        return i >= 0 and bool(self._flags[i] & FLAG_KEY)
+
+    def __getitem__(self, key: str):
+        i = self._find(key)
+        if i < 0 or not self._flags[i] & FLAG_KEY:
+            raise KeyError(key)
+        return self._value(i)
+
+    def get(self, key: str, default=None):
+        i = self._find(key)
+        if i < 0 or not self._flags[i] & FLAG_KEY:
+            return default
+        return self._value(i)
+
+    def has_keys_with_prefix(self, prefix: str) -> bool:
+        return self._find(prefix) >= 0
+
+    def __len__(self):
+        return self._n
+
+    def __setitem__(self, key, value):
+        raise TypeError("A compiled dictionary is read-only")
+
+
+def build(entries: dict, out_path: str, value_kind: int, source_hash: int = 0):
+    """
+    Write entries, {key: (number, tag, flags)}, as a compiled dictionary to out_path.
+    The file is replaced atomically, readers of the previous one keep their mapping.
+    """
+    tags = sorted({tag for _, tag, _ in entries.values()})
+    tag_ids = {t: i for i, t in enumerate(tags)}
+    n_keys = sum(1 for _, _, flags in entries.values() if flags & FLAG_KEY)
+    cap = 1
+    while cap < 2 * max(1, len(entries)):
+        cap <<= 1
+    mask = cap - 1
+
+    hashes = [0] * cap
+    nums = [0] * cap
+    tids = [0] * cap
+    flags_ = [0] * cap
+    for key, (num, tag, flags) in entries.items():
+        h = _hash(key)
+        i = h & mask
+        while hashes[i] != 0:
+            if hashes[i] == h:
+                raise ValueError(f"Hash collision on {key!r}")
+            i = (i + 1) & mask
+        hashes[i], nums[i], tids[i], flags_[i] = h, num, tag_ids[tag], flags
+
+    tags_bytes = json.dumps(tags, ensure_ascii=False).encode("utf-8")
+    tmp_path = f"{out_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, FORMAT_VERSION, value_kind, cap, n_keys, source_hash, len(tags_bytes)))
+        f.write(tags_bytes)
+        f.write(b"\0" * (_pad8(HEADER.size + len(tags_bytes)) - HEADER.size - len(tags_bytes)))
+        # native byte order, as read back by memoryview.cast
+        f.write(array("Q", hashes).tobytes())
+        f.write(array("i", nums).tobytes())
+        f.write(array("H", tids).tobytes())
+        f.write(b"\0" * (_pad8(2 * cap) - 2 * cap))
+        f.write(bytes(flags_))
+    os.replace(tmp_path, out_path)
+    logging.info(f"Built compiled dictionary {out_path}: {n_keys} keys, {len(entries)} entries")
+
+
+def _unescape_key(k: str) -> str:
+    # inverse of RagTokenizer.key_, str(s.encode("utf-8"))[2:-1]
+    try:
+        return codecs.escape_decode(k)[0].decode("utf-8")
+    except Exception:
+        return k
+
+
+def build_trie(trie, out_path: str, source_hash: int = 0):
+    """
+    Compile the datrie.Trie of RagTokenizer, along with the keys of all the char prefixes
+    of its keys, so that has_keys_with_prefix is a single lookup.
+    """
+    entries = {}
+    for k, v in trie.items():
+        if isinstance(v, tuple):
+            entries[k] = (int(v[0]), v[1], FLAG_KEY)
+        else:
+            entries[k] = (int(v), "", FLAG_KEY | FLAG_NUM_ONLY)
+    for k in list(entries.keys()):
+        # the keys are escaped lower cased words, or "DD" + the reversed word for the backward matching
+        word = _unescape_key(k)
+        for i in range(1, len(word)):
+            p = str(word[:i].encode("utf-8"))[2:-1]
+            if not k.startswith(p):
+                # quotes are escaped, or not, depending on the whole word
+                continue
+            if p not in entries:
+                entries[p] = (0, "", FLAG_PREFIX)
+            else:
+                num, tag, flags = entries[p]
+                entries[p] = (num, tag, flags | FLAG_PREFIX)
+    build(entries, out_path, VALUE_PAIR, source_hash)
+
+
+def main():
+    from api.utils.file_utils import get_project_base_directory
+    from rag.nlp.rag_tokenizer import RagTokenizer
+
+    res = os.path.join(get_project_base_directory(), "rag/res")
+
+    tokenizer = RagTokenizer(use_compiled_dict=False)
+    trie_file = tokenizer.DIR_ + ".txt.trie"
+    build_trie(tokenizer.trie_, tokenizer.DIR_ + ".txt.dict", file_hash(trie_file) if os.path.exists(trie_file) else 0)
+
+    fnm = os.path.join(res, "ner.json")
+    if os.path.exists(fnm):
+        with open(fnm, "r") as f:
+            ner = json.load(f)
+        build({k: (0, v, FLAG_KEY) for k, v in ner.items()}, fnm + ".dict", VALUE_TAG, file_hash(fnm))
+
+    fnm = os.path.join(res, "term.freq")
+    if os.path.exists(fnm):
+        from rag.nlp.term_weight import load_term_freq
+        df = load_term_freq(fnm)
+        items = df.items() if isinstance(df, dict) else ((k, 0) for k in df)
+        build({k: (v, "", FLAG_KEY) for k, v in items}, fnm + ".dict", VALUE_NUM, file_hash(fnm))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, stream=sys.stdout)
+    main()
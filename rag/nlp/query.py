@@ -19,10 +19,46 @@ import json
 import re
 from collections import defaultdict
 
+import numpy as np
+
 from rag.utils.doc_store_conn import MatchTextExpr
 from rag.nlp import rag_tokenizer, term_weight, synonym
 
 
+class CandidateTokens:
+    """
+    The tokens of a list of candidate chunks, with the terms interned to integer ids and stored as a sparse
+    chunk x term incidence (CSR like). Build it once to score several queries against the same candidates.
+    """
+
+    def __init__(self, btkss):
+        self.vocab = {}
+        indices, rows = [], []
+        for r, tks in enumerate(btkss):
+            if isinstance(tks, str):
+                tks = tks.split()
+            for t in set(tks):
+                indices.append(self.vocab.setdefault(t, len(self.vocab)))
+                rows.append(r)
+        self.n = len(btkss)
+        self.indices = np.array(indices, dtype=np.int64)
+        self.rows = np.array(rows, dtype=np.int64)
+
+    def __len__(self):
+        return self.n
+
+    def score(self, qtwt: dict) -> np.ndarray:
+        """For each candidate, the share of the query term weights that the candidate contains."""
+        q = np.zeros(len(self.vocab) + 1, dtype=np.float64)
+        total = 1e-9
+        for t, w in qtwt.items():
+            total += w
+            if t in self.vocab:
+                q[self.vocab[t]] += w
+        hit = np.bincount(self.rows, weights=q[self.indices], minlength=self.n)
+        return (hit + 1e-9) / total
+
+
 class FulltextQueryer:
     def __init__(self):
         self.tw = term_weight.Dealer()
@@ -217,29 +253,47 @@ class FulltextQueryer:
             ), keywords
         return None, keywords
 
-    def hybrid_similarity(self, avec, bvecs, atks, btkss, tkweight=0.3, vtweight=0.7):
-        from sklearn.metrics.pairwise import cosine_similarity as CosineSimilarity
-        import numpy as np
+    @staticmethod
+    def cosine_similarity(avec, bvecs) -> np.ndarray:
+        """
+        Cosine of avec with each row of bvecs, 0 for zero vectors. Computed in float32, returned as float64,
+        whose items are floats the JSON encoders take.
+        """
+        bvecs = np.asarray(bvecs, dtype=np.float32)
+        avec = np.asarray(avec, dtype=np.float32)
+        if bvecs.size == 0:
+            return np.zeros(len(bvecs), dtype=np.float64)
+        norms = np.linalg.norm(bvecs, axis=1) * np.linalg.norm(avec)
+        norms[norms == 0] = 1
+        return (bvecs @ avec / norms).astype(np.float64)
 
-        sims = CosineSimilarity([avec], bvecs)
+    def hybrid_similarity(self, avec, bvecs, atks, btkss, tkweight=0.3, vtweight=0.7, vtsim=None):
+        """
+        bvecs may be a float32 matrix and btkss a CandidateTokens, prepared once to score several queries.
+        vtsim, the vector similarities already computed by the doc store, replaces the cosine of avec and bvecs.
+        """
+        sims = self.cosine_similarity(avec, bvecs) if vtsim is None else np.asarray(vtsim, dtype=np.float64)
         tksim = self.token_similarity(atks, btkss)
-        if np.sum(sims[0]) == 0:
-            return np.array(tksim), tksim, sims[0]
-        return np.array(sims[0]) * vtweight + np.array(tksim) * tkweight, tksim, sims[0]
+        if np.sum(sims) == 0:
+            return np.array(tksim), tksim, sims
+        return sims * vtweight + np.array(tksim) * tkweight, tksim, sims
+
+    def _term_weights(self, tks):
+        if isinstance(tks, str):
+            tks = tks.split()
+        d = defaultdict(int)
+        for t, c in self.tw.weights(tks, preprocess=False):
+            d[t] += c
+        return d
 
     def token_similarity(self, atks, btkss):
-        def toDict(tks):
-            if isinstance(tks, str):
-                tks = tks.split()
-            d = defaultdict(int)
-            wts = self.tw.weights(tks, preprocess=False)
-            for i, (t, c) in enumerate(wts):
-                d[t] += c
-            return d
-
-        atks = toDict(atks)
-        btkss = [toDict(tks) for tks in btkss]
-        return [self.similarity(atks, btks) for btks in btkss]
+        # Only the query side is weighted: the score of a candidate is the share of the
+        # query term weights it contains, the weights of its own terms don't matter.
+        if not isinstance(btkss, CandidateTokens):
+            btkss = CandidateTokens(btkss)
+        if not len(btkss):
+            return []
+        return btkss.score(self._term_weights(atks)).tolist()
 
     def similarity(self, qtwt, dtwt):
         if isinstance(dtwt, type("")):
@@ -15,8 +15,8 @@
 #
 
 import logging
-import copy
 import datrie
+import functools
 import math
 import os
 import re
@@ -26,11 +26,31 @@ from hanziconv import HanziConv
 from nltk import word_tokenize
 from nltk.stem import PorterStemmer, WordNetLemmatizer
 from api.utils.file_utils import get_project_base_directory
+from rag.nlp.mmap_dict import MmapDict
+
+# bounded caches of the tokenizer: whole lines up to TOKENIZE_CACHE_MAX_LEN chars, and single words
+TOKENIZE_CACHE_SIZE = int(os.environ.get("TOKENIZE_CACHE_SIZE", 4096))
+TOKENIZE_CACHE_MAX_LEN = int(os.environ.get("TOKENIZE_CACHE_MAX_LEN", 1024))
+WORD_CACHE_SIZE = int(os.environ.get("TOKENIZE_WORD_CACHE_SIZE", 65536))
+
+
+@functools.lru_cache(maxsize=WORD_CACHE_SIZE)
+def _trie_key(line):
+    return str(line.lower().encode("utf-8"))[2:-1]
+
+
+def _path_tokens(path):
+    """Tokens of a path of the segmentation DFS, a linked list of (previous path, token, path length) nodes."""
+    tks = []
+    while path is not None:
+        path, tk, _ = path
+        tks.append(tk)
+    return tks[::-1]
 
 
 class RagTokenizer:
     def key_(self, line):
-        return str(line.lower().encode("utf-8"))[2:-1]
+        return _trie_key(line)
 
     def rkey_(self, line):
         return str(("DD" + (line[::-1].lower())).encode("utf-8"))[2:-1]
@@ -58,7 +78,7 @@ class RagTokenizer:
         except Exception:
             logging.exception(f"[HUQIE]:Build trie {fnm} failed")
 
-    def __init__(self, debug=False):
+    def __init__(self, debug=False, use_compiled_dict=True):
         self.DEBUG = debug
         self.DENOMINATOR = 1000000
         self.DIR_ = os.path.join(get_project_base_directory(), "rag/res", "huqie")
@@ -66,9 +86,20 @@ class RagTokenizer:
         self.stemmer = PorterStemmer()
         self.lemmatizer = WordNetLemmatizer()
 
+        self._tokenize_cached = functools.lru_cache(maxsize=TOKENIZE_CACHE_SIZE)(self._tokenize)
+        self._stem_lemma = functools.lru_cache(maxsize=WORD_CACHE_SIZE)(self._stem_lemma_)
+        self._fine_grained_tk = functools.lru_cache(maxsize=WORD_CACHE_SIZE)(self._fine_grained_tk_)
+
         self.SPLIT_CHAR = r"([ ,\.<>/?;:'\[\]\\`!@#$%^&*\(\)\{\}\|_+=《》，。？、；‘’：“”【】~！￥%……（）——-]+|[a-zA-Z0-9,\.-]+)"
 
         trie_file_name = self.DIR_ + ".txt.trie"
+        if use_compiled_dict:
+            # the memory-mapped dictionary compiled by `python -m rag.nlp.mmap_dict`, if it's up to date
+            self.trie_ = MmapDict.open(self.DIR_ + ".txt.dict", trie_file_name)
+            if self.trie_ is not None:
+                logging.info(f"[HUQIE]:Mapped compiled dictionary {self.trie_.path}")
+                return
+
         # check if trie file existence
         if os.path.exists(trie_file_name):
             try:
@@ -88,6 +119,7 @@ class RagTokenizer:
         self.loadDict_(self.DIR_ + ".txt")
 
     def loadUserDict(self, fnm):
+        self.clear_cache()
         try:
             self.trie_ = datrie.Trie.load(fnm + ".trie")
             return
@@ -96,8 +128,17 @@ class RagTokenizer:
         self.loadDict_(fnm)
 
     def addUserDict(self, fnm):
+        self.clear_cache()
+        if isinstance(self.trie_, MmapDict):
+            # the compiled dictionary is read-only, go back to the trie to extend it
+            self.trie_ = RagTokenizer(use_compiled_dict=False).trie_
         self.loadDict_(fnm)
 
+    def clear_cache(self):
+        """The cached results depend on the dictionary, drop them when it changes."""
+        self._tokenize_cached.cache_clear()
+        self._fine_grained_tk.cache_clear()
+
     def _strQ2B(self, ustring):
         """Convert full-width characters to half-width characters"""
         rstring = ""
@@ -117,85 +158,81 @@ class RagTokenizer:
         return HanziConv.toSimplified(line)
 
     def dfs_(self, chars, s, preTks, tkslist, _depth=0, _memo=None):
-        if _memo is None:
-            _memo = {}
+        """
+        Enumerate the segmentations of chars[s:] following preTks, appending them to tkslist.
+
+        The paths are shared linked lists rather than copied lists, a path only becomes a list of
+        (token, (freq, tag)) once it is complete. `_memo` is kept for compatibility: every path is
+        reached only once, so there is nothing to memoize across branches.
+        """
+        if not isinstance(chars, str):
+            chars = "".join(chars)
+        path = None
+        for tk in preTks:
+            path = self._extend(path, tk)
+        paths = []
+        res = self._dfs(chars, s, path, paths, _depth)
+        tkslist.extend(_path_tokens(p) for p in paths)
+        return res
+
+    def _entry(self, t):
+        k = self.key_(t)
+        if k in self.trie_:
+            return t, self.trie_[k]
+        return t, (-12, '')
+
+    def _dfs(self, chars, s, path, paths, depth):
         MAX_DEPTH = 10
-        if _depth > MAX_DEPTH:
-            if s < len(chars):
-                copy_pretks = copy.deepcopy(preTks)
-                remaining = "".join(chars[s:])
-                copy_pretks.append((remaining, (-12, '')))
-                tkslist.append(copy_pretks)
+        n = len(chars)
+        if depth > MAX_DEPTH:
+            if s < n:
+                paths.append(self._extend(path, (chars[s:], (-12, ''))))
             return s
-    
-        state_key = (s, tuple(tk[0] for tk in preTks)) if preTks else (s, None)
-        if state_key in _memo:
-            return _memo[state_key]
-        
-        res = s
-        if s >= len(chars):
-            tkslist.append(preTks)
-            _memo[state_key] = s
+
+        if s >= n:
+            paths.append(path)
             return s
-        if s < len(chars) - 4:
-            is_repetitive = True
-            char_to_check = chars[s]
-            for i in range(1, 5):
-                if s + i >= len(chars) or chars[s + i] != char_to_check:
-                    is_repetitive = False
-                    break
-            if is_repetitive:
+
+        if s < n - 4:
+            c = chars[s]
+            if chars[s + 1] == c and chars[s + 2] == c and chars[s + 3] == c and chars[s + 4] == c:
                 end = s
-                while end < len(chars) and chars[end] == char_to_check:
+                while end < n and chars[end] == c:
                     end += 1
                 mid = s + min(10, end - s)
-                t = "".join(chars[s:mid])
-                k = self.key_(t)
-                copy_pretks = copy.deepcopy(preTks)
-                if k in self.trie_:
-                    copy_pretks.append((t, self.trie_[k]))
-                else:
-                    copy_pretks.append((t, (-12, '')))
-                next_res = self.dfs_(chars, mid, copy_pretks, tkslist, _depth + 1, _memo)
-                res = max(res, next_res)
-                _memo[state_key] = res
-                return res
-    
+                return max(s, self._dfs(chars, mid, self._extend(path, self._entry(chars[s:mid])), paths, depth + 1))
+
+        trie = self.trie_
         S = s + 1
-        if s + 2 <= len(chars):
-            t1 = "".join(chars[s:s + 1])
-            t2 = "".join(chars[s:s + 2])
-            if self.trie_.has_keys_with_prefix(self.key_(t1)) and not self.trie_.has_keys_with_prefix(self.key_(t2)):
+        if s + 2 <= n:
+            if trie.has_keys_with_prefix(self.key_(chars[s:s + 1])) and not trie.has_keys_with_prefix(self.key_(chars[s:s + 2])):
                 S = s + 2
-        if len(preTks) > 2 and len(preTks[-1][0]) == 1 and len(preTks[-2][0]) == 1 and len(preTks[-3][0]) == 1:
-            t1 = preTks[-1][0] + "".join(chars[s:s + 1])
-            if self.trie_.has_keys_with_prefix(self.key_(t1)):
-                S = s + 2
-    
-        for e in range(S, len(chars) + 1):
-            t = "".join(chars[s:e])
+        if path is not None and path[2] > 2:
+            # the last three tokens are single chars
+            p1 = path
+            p2 = p1[0]
+            p3 = p2[0]
+            if len(p1[1][0]) == 1 and len(p2[1][0]) == 1 and len(p3[1][0]) == 1:
+                if trie.has_keys_with_prefix(self.key_(p1[1][0] + chars[s:s + 1])):
+                    S = s + 2
+
+        res = s
+        for e in range(S, n + 1):
+            t = chars[s:e]
             k = self.key_(t)
-            if e > s + 1 and not self.trie_.has_keys_with_prefix(k):
+            if e > s + 1 and not trie.has_keys_with_prefix(k):
                 break
-            if k in self.trie_:
-                pretks = copy.deepcopy(preTks)
-                pretks.append((t, self.trie_[k]))
-                res = max(res, self.dfs_(chars, e, pretks, tkslist, _depth + 1, _memo))
-        
+            if k in trie:
+                res = max(res, self._dfs(chars, e, self._extend(path, (t, trie[k])), paths, depth + 1))
+
         if res > s:
-            _memo[state_key] = res
             return res
-    
-        t = "".join(chars[s:s + 1])
-        k = self.key_(t)
-        copy_pretks = copy.deepcopy(preTks)
-        if k in self.trie_:
-            copy_pretks.append((t, self.trie_[k]))
-        else:
-            copy_pretks.append((t, (-12, '')))
-        result = self.dfs_(chars, s + 1, copy_pretks, tkslist, _depth + 1, _memo)
-        _memo[state_key] = result
-        return result
+
+        return self._dfs(chars, s + 1, self._extend(path, self._entry(chars[s:s + 1])), paths, depth + 1)
+
+    @staticmethod
+    def _extend(path, tk):
+        return path, tk, 1 if path is None else path[2] + 1
 
     def freq(self, tk):
         k = self.key_(tk)
@@ -293,8 +330,11 @@ class RagTokenizer:
 
         return self.score_(res[::-1])
 
+    def _stem_lemma_(self, t):
+        return self.stemmer.stem(self.lemmatizer.lemmatize(t))
+
     def english_normalize_(self, tks):
-        return [self.stemmer.stem(self.lemmatizer.lemmatize(t)) if re.match(r"[a-zA-Z_-]+$", t) else t for t in tks]
+        return [self._stem_lemma(t) if re.match(r"[a-zA-Z_-]+$", t) else t for t in tks]
 
     def _split_by_lang(self, line):
         txt_lang_pairs = []
@@ -320,6 +360,16 @@ class RagTokenizer:
         return txt_lang_pairs
 
     def tokenize(self, line):
+        if len(line) <= TOKENIZE_CACHE_MAX_LEN:
+            return self._tokenize_cached(line)
+        return self._tokenize(line)
+
+    def tokenize_many(self, lines):
+        """Tokenize a list of lines, e.g. the chunks of a document, tokenizing the repeated ones once."""
+        done = {}
+        return [done[line] if line in done else done.setdefault(line, self.tokenize(line)) for line in lines]
+
+    def _tokenize(self, line):
         line = re.sub(r"\W+", " ", line)
         line = self._strQ2B(line).lower()
         line = self._tradi2simp(line)
@@ -328,7 +378,7 @@ class RagTokenizer:
         res = []
         for L,lang in arr:
             if not lang:
-                res.extend([self.stemmer.stem(self.lemmatizer.lemmatize(t)) for t in word_tokenize(L)])
+                res.extend([self._stem_lemma(t) for t in word_tokenize(L)])
                 continue
             if len(L) < 2 or re.match(
                     r"[a-z\.-]+$", L) or re.match(r"[0-9\.-]+$", L):
@@ -400,37 +450,28 @@ class RagTokenizer:
                 res.extend(tk.split("/"))
             return " ".join(res)
 
-        res = []
-        for tk in tks:
-            if len(tk) < 3 or re.match(r"[0-9,\.-]+$", tk):
-                res.append(tk)
-                continue
-            tkslist = []
-            if len(tk) > 10:
-                tkslist.append(tk)
-            else:
-                self.dfs_(tk, 0, [], tkslist)
-            if len(tkslist) < 2:
-                res.append(tk)
-                continue
-            stk = self.sortTks_(tkslist)[1][0]
-            if len(stk) == len(tk):
-                stk = tk
-            else:
-                if re.match(r"[a-z\.-]+$", tk):
-                    for t in stk:
-                        if len(t) < 3:
-                            stk = tk
-                            break
-                    else:
-                        stk = " ".join(stk)
-                else:
-                    stk = " ".join(stk)
-
-            res.append(stk)
-
+        res = [self._fine_grained_tk(tk) for tk in tks]
         return " ".join(self.english_normalize_(res))
 
+    def _fine_grained_tk_(self, tk):
+        if len(tk) < 3 or re.match(r"[0-9,\.-]+$", tk):
+            return tk
+        tkslist = []
+        if len(tk) > 10:
+            tkslist.append(tk)
+        else:
+            self.dfs_(tk, 0, [], tkslist)
+        if len(tkslist) < 2:
+            return tk
+        stk = self.sortTks_(tkslist)[1][0]
+        if len(stk) == len(tk):
+            return tk
+        if re.match(r"[a-z\.-]+$", tk):
+            for t in stk:
+                if len(t) < 3:
+                    return tk
+        return " ".join(stk)
+
 
 def is_chinese(s):
     if s >= u'\u4e00' and s <= u'\u9fa5':
@@ -466,6 +507,7 @@ def naiveQie(txt):
 
 tokenizer = RagTokenizer()
 tokenize = tokenizer.tokenize
+tokenize_many = tokenizer.tokenize_many
 fine_grained_tokenize = tokenizer.fine_grained_tokenize
 tag = tokenizer.tag
 freq = tokenizer.freq
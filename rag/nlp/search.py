@@ -25,6 +25,7 @@ from rag.prompts.generator import relevant_chunks_with_toc
 from rag.settings import TAG_FLD, PAGERANK_FLD
 from rag.utils import rmSpace, get_float
 from rag.nlp import rag_tokenizer, query
+from rag.nlp.query import CandidateTokens
 import numpy as np
 from rag.utils.doc_store_conn import DocStoreConnection, MatchDenseExpr, FusionExpr, OrderByExpr
 
@@ -73,8 +74,14 @@ class Dealer:
                kb_ids: list[str],
                emb_mdl=None,
                highlight: bool | list = False,
-               rank_feature: dict | None = None
+               rank_feature: dict | None = None,
+               exact_total: bool = True,
+               vector_scores: bool = False
                ):
+        """
+        With vector_scores, a doc store that can compute the similarity of the chunks to the question vector
+        returns it as `_vector_similarity` instead of the chunk vectors.
+        """
         filters = self.get_filters(req)
         orderBy = OrderByExpr()
 
@@ -110,7 +117,7 @@ class Dealer:
             if emb_mdl is None:
                 matchExprs = [matchText]
                 res = self.dataStore.search(src, highlightFields, filters, matchExprs, orderBy, offset, limit,
-                                            idx_names, kb_ids, rank_feature=rank_feature)
+                                            idx_names, kb_ids, rank_feature=rank_feature, exact_total=exact_total)
                 total = self.dataStore.getTotal(res)
                 logging.debug("Dealer.search TOTAL: {}".format(total))
             else:
@@ -122,7 +129,8 @@ class Dealer:
                 matchExprs = [matchText, matchDense, fusionExpr]
 
                 res = self.dataStore.search(src, highlightFields, filters, matchExprs, orderBy, offset, limit,
-                                            idx_names, kb_ids, rank_feature=rank_feature)
+                                            idx_names, kb_ids, rank_feature=rank_feature, exact_total=exact_total,
+                                            vector_scores=vector_scores)
                 total = self.dataStore.getTotal(res)
                 logging.debug("Dealer.search TOTAL: {}".format(total))
 
@@ -135,7 +143,8 @@ class Dealer:
                         matchText, _ = self.qryr.question(qst, min_match=0.1)
                         matchDense.extra_options["similarity"] = 0.17
                         res = self.dataStore.search(src, highlightFields, filters, [matchText, matchDense, fusionExpr],
-                                                    orderBy, offset, limit, idx_names, kb_ids, rank_feature=rank_feature)
+                                                    orderBy, offset, limit, idx_names, kb_ids, rank_feature=rank_feature,
+                                                    exact_total=exact_total, vector_scores=vector_scores)
                         total = self.dataStore.getTotal(res)
                     logging.debug("Dealer.search 2 TOTAL: {}".format(total))
 
@@ -151,7 +160,7 @@ class Dealer:
         logging.debug(f"TOTAL: {total}")
         ids = self.dataStore.getChunkIds(res)
         keywords = list(kwds)
-        highlight = self.dataStore.getHighlight(res, keywords, "content_with_weight")
+        highlight = self.dataStore.getHighlight(res, keywords, "content_with_weight") if highlight else {}
         aggs = self.dataStore.getAggregation(res, "docnm_kwd")
         return self.SearchResult(
             total=total,
@@ -159,7 +168,7 @@ class Dealer:
             query_vector=q_vec,
             aggregation=aggs,
             highlight=highlight,
-            field=self.dataStore.getFields(res, src + ["_score"]),
+            field=self.dataStore.getFields(res, src + ["_score", "_vector_similarity"]),
             keywords=keywords
         )
 
@@ -167,6 +176,31 @@ class Dealer:
     def trans2floats(txt):
         return [get_float(t) for t in txt.split("\t")]
 
+    @staticmethod
+    def vector_matrix(vectors, dim):
+        """
+        Stack the chunk vectors, lists or tab separated strings, into a float32 matrix, zeros for the missing ones.
+        """
+        embd = np.zeros((len(vectors), dim), dtype=np.float32)
+        for i, vector in enumerate(vectors):
+            if vector is None:
+                continue
+            if isinstance(vector, str):
+                try:
+                    vector = np.array(vector.split("\t"), dtype=np.float32)
+                except ValueError:
+                    vector = [get_float(v) for v in vector.split("\t")]
+            embd[i] = vector
+        return embd
+
+    @staticmethod
+    def vector_similarities(sres):
+        """The `_vector_similarity` of each hit returned by the doc store, or None if it didn't compute them all."""
+        sims = [sres.field[chunk_id].get("_vector_similarity") for chunk_id in sres.ids]
+        if not sims or any(s is None for s in sims):
+            return None
+        return np.array(sims, dtype=np.float64)
+
     def insert_citations(self, answer, chunks, chunk_v,
                          embd_mdl, tkweight=0.1, vtweight=0.9):
         assert len(chunks) == len(chunk_v)
@@ -218,16 +252,18 @@ class Dealer:
         assert len(ans_v[0]) == len(chunk_v[0]), "The dimension of query and chunk do not match: {} vs. {}".format(
             len(ans_v[0]), len(chunk_v[0]))
 
-        chunks_tks = [rag_tokenizer.tokenize(self.qryr.rmWWW(ck)).split()
-                      for ck in chunks]
+        # the chunks side is prepared once for all the pieces
+        chunks_tks = CandidateTokens([rag_tokenizer.tokenize(self.qryr.rmWWW(ck)).split()
+                                      for ck in chunks])
+        chunk_v = np.asarray(chunk_v, dtype=np.float32)
+        pieces_tks = [rag_tokenizer.tokenize(self.qryr.rmWWW(p)).split() for p in pieces_]
         cites = {}
         thr = 0.63
-        while thr > 0.3 and len(cites.keys()) == 0 and pieces_ and chunks_tks:
+        while thr > 0.3 and len(cites.keys()) == 0 and pieces_ and len(chunks_tks):
             for i, a in enumerate(pieces_):
                 sim, tksim, vtsim = self.qryr.hybrid_similarity(ans_v[i],
                                                                 chunk_v,
-                                                                rag_tokenizer.tokenize(
-                                                                    self.qryr.rmWWW(pieces_[i])).split(),
+                                                                pieces_tks[i],
                                                                 chunks_tks,
                                                                 tkweight, vtweight)
                 mx = np.max(sim) * 0.99
@@ -288,17 +324,15 @@ class Dealer:
                rank_feature: dict | None = None
                ):
         _, keywords = self.qryr.question(query)
+        if not sres.ids:
+            return [], [], []
         vector_size = len(sres.query_vector)
         vector_column = f"q_{vector_size}_vec"
-        zero_vector = [0.0] * vector_size
-        ins_embd = []
-        for chunk_id in sres.ids:
-            vector = sres.field[chunk_id].get(vector_column, zero_vector)
-            if isinstance(vector, str):
-                vector = [get_float(v) for v in vector.split("\t")]
-            ins_embd.append(vector)
-        if not ins_embd:
-            return [], [], []
+        vtsim = self.vector_similarities(sres)
+        if vtsim is None:
+            ins_embd = self.vector_matrix([sres.field[chunk_id].get(vector_column) for chunk_id in sres.ids], vector_size)
+        else:
+            ins_embd = None
 
         for i in sres.ids:
             if isinstance(sres.field[i].get("important_kwd", []), str):
@@ -318,7 +352,8 @@ class Dealer:
         sim, tksim, vtsim = self.qryr.hybrid_similarity(sres.query_vector,
                                                         ins_embd,
                                                         keywords,
-                                                        ins_tw, tkweight, vtweight)
+                                                        CandidateTokens(ins_tw), tkweight, vtweight,
+                                                        vtsim=vtsim)
 
         return sim + rank_fea, tksim, vtsim
 
@@ -370,8 +405,11 @@ class Dealer:
         if isinstance(tenant_ids, str):
             tenant_ids = tenant_ids.split(",")
 
-        sres = self.search(req, [index_name(tid) for tid in tenant_ids],
-                           kb_ids, embd_mdl, highlight, rank_feature=rank_feature)
+        idx_names = [index_name(tid) for tid in tenant_ids]
+        # only the hits of the requested page matter here, so the engine may skip its exact count, and rank on the
+        # vector similarities it computes instead of returning the vectors of all the candidates
+        sres = self.search(req, idx_names, kb_ids, embd_mdl, highlight, rank_feature=rank_feature,
+                           exact_total=False, vector_scores=True)
 
         if rerank_mdl and sres.total > 0:
             sim, tsim, vsim = self.rerank_by_model(rerank_mdl,
@@ -390,7 +428,8 @@ class Dealer:
                 sim = [sres.field[id].get("_score", 0.0) for id in sres.ids]
                 sim = [s if s is not None else 0. for s in sim]
                 tsim = sim
-                vsim = sim
+                vsim = self.vector_similarities(sres)
+                vsim = sim if vsim is None else vsim.tolist()
         # Already paginated in search function
         begin = ((page % (RERANK_LIMIT//page_size)) - 1) * page_size
         sim = sim[begin : begin + page_size]
@@ -431,7 +470,7 @@ class Dealer:
                 "similarity": sim[i],
                 "vector_similarity": vsim[i],
                 "term_similarity": tsim[i],
-                "vector": chunk.get(vector_column, zero_vector),
+                "vector": chunk.get(vector_column),
                 "positions": position_int,
                 "doc_type_kwd": chunk.get("doc_type_kwd", "")
             }
@@ -450,9 +489,23 @@ class Dealer:
                                                        v in sorted(ranks["doc_aggs"].items(),
                                                                    key=lambda x: x[1]["count"] * -1)]
         ranks["chunks"] = ranks["chunks"][:page_size]
+        self._fill_vectors(ranks["chunks"], vector_column, zero_vector, idx_names, kb_ids)
 
         return ranks
 
+    def _fill_vectors(self, chunks, vector_column, zero_vector, idx_names, kb_ids):
+        # hits ranked on the similarities computed by the doc store come without their vectors,
+        # only the ones of the returned page are fetched
+        missing = [d["chunk_id"] for d in chunks if d["vector"] is None]
+        fields = {}
+        if missing and vector_column != "q_0_vec":
+            res = self.dataStore.search(["id", vector_column], [], {"id": missing}, [], OrderByExpr(), 0, len(missing),
+                                        idx_names, kb_ids)
+            fields = self.dataStore.getFields(res, [vector_column])
+        for d in chunks:
+            if d["vector"] is None:
+                d["vector"] = fields.get(d["chunk_id"], {}).get(vector_column, zero_vector)
+
     def sql_retrieval(self, sql, fetch_size=128, format="json"):
         tbl = self.dataStore.sql(sql, fetch_size, format)
         return tbl
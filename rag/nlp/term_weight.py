@@ -21,9 +21,31 @@ import re
 import os
 import numpy as np
 from rag.nlp import rag_tokenizer
+from rag.nlp.mmap_dict import MmapDict
 from api.utils.file_utils import get_project_base_directory
 
 
+def load_term_freq(fnm):
+    res = {}
+    f = open(fnm, "r")
+    while True:
+        line = f.readline()
+        if not line:
+            break
+        arr = line.replace("\n", "").split("\t")
+        if len(arr) < 2:
+            res[arr[0]] = 0
+        else:
+            res[arr[0]] = int(arr[1])
+
+    c = 0
+    for _, v in res.items():
+        c += v
+    if c == 0:
+        return set(res.keys())
+    return res
+
+
 class Dealer:
     def __init__(self):
         self.stop_words = set(["请问",
@@ -58,36 +80,25 @@ class Dealer:
                                "啥",
                                "相关"])
 
-        def load_dict(fnm):
-            res = {}
-            f = open(fnm, "r")
-            while True:
-                line = f.readline()
-                if not line:
-                    break
-                arr = line.replace("\n", "").split("\t")
-                if len(arr) < 2:
-                    res[arr[0]] = 0
-                else:
-                    res[arr[0]] = int(arr[1])
-
-            c = 0
-            for _, v in res.items():
-                c += v
-            if c == 0:
-                return set(res.keys())
-            return res
-
         fnm = os.path.join(get_project_base_directory(), "rag/res")
         self.ne, self.df = {}, {}
-        try:
-            self.ne = json.load(open(os.path.join(fnm, "ner.json"), "r"))
-        except Exception:
-            logging.warning("Load ner.json FAIL!")
-        try:
-            self.df = load_dict(os.path.join(fnm, "term.freq"))
-        except Exception:
-            logging.warning("Load term.freq FAIL!")
+        # the memory-mapped dictionaries compiled by `python -m rag.nlp.mmap_dict` are shared by the processes
+        ne = MmapDict.open(os.path.join(fnm, "ner.json.dict"), os.path.join(fnm, "ner.json"))
+        if ne is not None:
+            self.ne = ne
+        else:
+            try:
+                self.ne = json.load(open(os.path.join(fnm, "ner.json"), "r"))
+            except Exception:
+                logging.warning("Load ner.json FAIL!")
+        df = MmapDict.open(os.path.join(fnm, "term.freq.dict"), os.path.join(fnm, "term.freq"))
+        if df is not None:
+            self.df = df
+        else:
+            try:
+                self.df = load_term_freq(os.path.join(fnm, "term.freq"))
+            except Exception:
+                logging.warning("Load term.freq FAIL!")
 
     def pretoken(self, txt, num=False, stpwd=True):
         patt = [
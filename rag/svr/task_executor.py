@@ -16,6 +16,7 @@ import concurrent
 # from beartype import BeartypeConf
 # from beartype.claw import beartype_all  # <-- you didn't sign up for this
 # beartype_all(conf=BeartypeConf(violation_type=UserWarning))    # <-- emit warnings from all code
+import collections
 import random
 import sys
 import threading
@@ -65,9 +66,13 @@ from powerrag.app import title as powerrag_title
 from powerrag.app import regex as powerrag_regex
 from powerrag.app import smart as powerrag_smart
 from rag.nlp import search, rag_tokenizer, add_positions
+from rag.llm.http_client import connection_stats
 from rag.raptor import RecursiveAbstractiveProcessing4TreeOrganizedRetrieval as Raptor
 from rag.settings import DOC_MAXIMUM_SIZE, DOC_BULK_SIZE, EMBEDDING_BATCH_SIZE, SVR_CONSUMER_GROUP_NAME, get_svr_queue_name, get_svr_queue_names, print_rag_settings, TAG_FLD, PAGERANK_FLD
-from rag.utils import num_tokens_from_string, truncate
+from rag.utils import num_tokens_from_string
+from rag.utils.blob_cache import LocalBlobCache
+from rag.utils.embedding_batcher import EmbeddingBatcher
+from rag.utils.ob_redis_conn import LOCK_WAIT_STATS
 from rag.utils.redis_conn import REDIS_CONN, distributed_lock
 from rag.utils.storage_factory import STORAGE_IMPL
 from graphrag.utils import chat_limiter
@@ -104,6 +109,8 @@ TASK_TYPE_TO_PIPELINE_TASK_TYPE = {
 }
 
 UNACKED_ITERATOR = None
+# messages claimed in a batch but not handled yet
+PREFETCHED_MSGS = collections.deque()
 
 CONSUMER_NO = "0" if len(sys.argv) < 2 else sys.argv[1]
 CONSUMER_NAME = "task_executor_" + CONSUMER_NO
@@ -118,9 +125,14 @@ CURRENT_TASKS = {}
 MAX_CONCURRENT_TASKS = int(os.environ.get('MAX_CONCURRENT_TASKS', "5"))
 MAX_CONCURRENT_CHUNK_BUILDERS = int(os.environ.get('MAX_CONCURRENT_CHUNK_BUILDERS', "1"))
 MAX_CONCURRENT_MINIO = int(os.environ.get('MAX_CONCURRENT_MINIO', '10'))
+TASK_PREFETCH_COUNT = max(1, int(os.environ.get('TASK_PREFETCH_COUNT', "1")))
 task_limiter = trio.Semaphore(MAX_CONCURRENT_TASKS)
 chunk_limiter = trio.CapacityLimiter(MAX_CONCURRENT_CHUNK_BUILDERS)
 embed_limiter = trio.CapacityLimiter(MAX_CONCURRENT_CHUNK_BUILDERS)
+# coalesces the embedding requests of the concurrent tasks into full batches
+EMBEDDING_BATCHER = EmbeddingBatcher(embed_limiter)
+# local disk copies of the documents, shared by their page range tasks
+BLOB_CACHE = LocalBlobCache()
 minio_limiter = trio.CapacityLimiter(MAX_CONCURRENT_MINIO)
 kg_limiter = trio.CapacityLimiter(2)
 WORKER_HEARTBEAT_TIMEOUT = int(os.environ.get('WORKER_HEARTBEAT_TIMEOUT', '120'))
@@ -216,10 +228,15 @@ async def collect():
         try:
             redis_msg = next(UNACKED_ITERATOR)
         except StopIteration:
-            for svr_queue_name in svr_queue_names:
-                redis_msg = REDIS_CONN.queue_consumer(svr_queue_name, SVR_CONSUMER_GROUP_NAME, CONSUMER_NAME)
-                if redis_msg:
-                    break
+            redis_msg = PREFETCHED_MSGS.popleft() if PREFETCHED_MSGS else None
+            if not redis_msg:
+                for svr_queue_name in svr_queue_names:
+                    redis_msgs = REDIS_CONN.queue_consumer_batch(svr_queue_name, SVR_CONSUMER_GROUP_NAME,
+                                                                 CONSUMER_NAME, TASK_PREFETCH_COUNT)
+                    if redis_msgs:
+                        redis_msg = redis_msgs[0]
+                        PREFETCHED_MSGS.extend(redis_msgs[1:])
+                        break
     except Exception:
         logging.exception("collect got exception")
         return None, None
@@ -260,8 +277,11 @@ async def collect():
     return redis_msg, task
 
 
-async def get_storage_binary(bucket, name):
-    return await trio.to_thread.run_sync(lambda: STORAGE_IMPL.get(bucket, name))
+async def get_storage_binary(bucket, name, version=None):
+    if version is None:
+        return await trio.to_thread.run_sync(lambda: STORAGE_IMPL.get(bucket, name))
+    # the page range tasks of a document share one download
+    return await trio.to_thread.run_sync(lambda: BLOB_CACHE.get(bucket, name, version, lambda: STORAGE_IMPL.get(bucket, name)))
 
 
 @timeout(60*80, 1)
@@ -275,7 +295,8 @@ async def build_chunks(task, progress_callback):
     try:
         st = timer()
         bucket, name = File2DocumentService.get_storage_address(doc_id=task["doc_id"])
-        binary = await get_storage_binary(bucket, name)
+        # a document overwritten in the storage is parsed again, by a run that begins later
+        binary = await get_storage_binary(bucket, name, (task["size"], task.get("process_begin_at")))
         logging.info("From minio({}) {}/{}".format(timer() - st, task["location"], task["name"]))
     except TimeoutError:
         progress_callback(-1, "Internal server error: Fetch file from minio timeout. Could you try it again.")
@@ -481,19 +502,13 @@ async def embedding(docs, mdl, parser_config=None, callback=None):
 
     tk_count = 0
     if len(tts) == len(cnts):
-        vts, c = await trio.to_thread.run_sync(lambda: mdl.encode(tts[0: 1]))
+        vts, c = await EMBEDDING_BATCHER.encode(mdl, tts[0: 1])
         tts = np.concatenate([vts for _ in range(len(tts))], axis=0)
         tk_count += c
 
-    @timeout(60)
-    def batch_encode(txts):
-        nonlocal mdl
-        return mdl.encode([truncate(c, mdl.max_length-10) for c in txts])
-
     cnts_ = np.array([])
     for i in range(0, len(cnts), EMBEDDING_BATCH_SIZE):
-        async with embed_limiter:
-            vts, c = await trio.to_thread.run_sync(lambda: batch_encode(cnts[i: i + EMBEDDING_BATCH_SIZE]))
+        vts, c = await EMBEDDING_BATCHER.encode(mdl, cnts[i: i + EMBEDDING_BATCH_SIZE])
         if len(cnts_) == 0:
             cnts_ = vts
         else:
@@ -561,17 +576,12 @@ async def run_dataflow(task: dict):
             e, kb = KnowledgebaseService.get_by_id(task["kb_id"])
             embedding_id = kb.embd_id
             embedding_model = LLMBundle(task["tenant_id"], LLMType.EMBEDDING, llm_name=embedding_id)
-            @timeout(60)
-            def batch_encode(txts):
-                nonlocal embedding_model
-                return embedding_model.encode([truncate(c, embedding_model.max_length - 10) for c in txts])
             vects = np.array([])
             texts = [o.get("questions", o.get("summary", o["text"])) for o in chunks]
             delta = 0.20/(len(texts)//EMBEDDING_BATCH_SIZE+1)
             prog = 0.8
             for i in range(0, len(texts), EMBEDDING_BATCH_SIZE):
-                async with embed_limiter:
-                    vts, c = await trio.to_thread.run_sync(lambda: batch_encode(texts[i : i + EMBEDDING_BATCH_SIZE]))
+                vts, c = await EMBEDDING_BATCHER.encode(embedding_model, texts[i : i + EMBEDDING_BATCH_SIZE])
                 if len(vects) == 0:
                     vects = vts
                 else:
@@ -1077,6 +1087,10 @@ async def report_status():
                 "done": DONE_TASKS,
                 "failed": FAILED_TASKS,
                 "current": current,
+                "embedding_batcher": EMBEDDING_BATCHER.stats(),
+                "blob_cache": BLOB_CACHE.stats(),
+                "llm_connections": connection_stats(),
+                "lock_waits": LOCK_WAIT_STATS.snapshot(),
             })
             REDIS_CONN.zadd(CONSUMER_NAME, heartbeat, now.timestamp())
             logging.info(f"{CONSUMER_NAME} reported heartbeat: {heartbeat}")
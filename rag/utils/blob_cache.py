@@ -0,0 +1,183 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+
+BLOB_CACHE_DIR = os.environ.get("BLOB_CACHE_DIR", os.path.join(tempfile.gettempdir(), "ragflow_blob_cache"))
+BLOB_CACHE_MAX_BYTES = int(os.environ.get("BLOB_CACHE_MAX_BYTES", 2 * 1024 * 1024 * 1024))
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.data = None
+
+
+class LocalBlobCache:
+    """
+    Cache of the storage objects on the local disk, so that the page range tasks of a document don't download it
+    each. Objects are kept by (bucket, name, version), the least recently used ones are removed beyond `capacity`
+    bytes, and concurrent misses of the same object are served by one download.
+
+    The storage backends share no notion of etag, the caller passes a version that changes with the content,
+    e.g. the document size along with the start of its parsing. Each process has its own directory, which it
+    empties on start, along with the directories of the processes that are gone.
+    """
+
+    def __init__(self, directory: str = BLOB_CACHE_DIR, capacity: int = BLOB_CACHE_MAX_BYTES):
+        self.directory = os.path.join(directory, str(os.getpid()))
+        self.capacity = capacity
+        self._index = OrderedDict()
+        self._size = 0
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if self.capacity > 0:
+            shutil.rmtree(self.directory, ignore_errors=True)
+            self._remove_stale(directory)
+            os.makedirs(self.directory, exist_ok=True)
+
+    @staticmethod
+    def _remove_stale(directory: str):
+        # the directories of the previous runs of the task executors, left behind by a crash or a restart
+        try:
+            names = os.listdir(directory)
+        except OSError:
+            return
+        for name in names:
+            if not name.isdigit() or int(name) == os.getpid():
+                continue
+            try:
+                os.kill(int(name), 0)
+                continue
+            except ProcessLookupError:
+                pass
+            except OSError:
+                # alive, but not ours to signal
+                continue
+            logging.info(f"LocalBlobCache removes the cache of the stopped process {name}")
+            shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+
+    @staticmethod
+    def _key(bucket, name, version) -> str:
+        return hashlib.sha1(f"{bucket}/{name}@{version}".encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key)
+
+    def get(self, bucket, name, version, fetch) -> bytes:
+        """
+        The content of the object, fetch() is only called on a miss.
+        """
+        if self.capacity <= 0:
+            return fetch()
+        key = self._key(bucket, name, version)
+        while True:
+            with self._lock:
+                cached = key in self._index
+                if cached:
+                    self._index.move_to_end(key)
+                    self.hits += 1
+                else:
+                    flight = self._inflight.get(key)
+                    leader = flight is None
+                    if leader:
+                        flight = self._inflight[key] = _Flight()
+
+            if cached:
+                try:
+                    with open(self._path(key), "rb") as f:
+                        return f.read()
+                except FileNotFoundError:
+                    self._discard(key)
+                    continue
+
+            if not leader:
+                flight.done.wait()
+                if flight.data is not None:
+                    with self._lock:
+                        self.hits += 1
+                    return flight.data
+                # the download failed, try it again
+                continue
+
+            try:
+                with self._lock:
+                    self.misses += 1
+                data = fetch()
+                flight.data = data
+                self._store(key, data)
+                return data
+            finally:
+                with self._lock:
+                    self._inflight.pop(key, None)
+                flight.done.set()
+
+    def _store(self, key: str, data: bytes):
+        if data is None or len(data) > self.capacity:
+            return
+        path = self._path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError:
+            logging.exception(f"LocalBlobCache failed to write {path}")
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            return
+
+        evicted = []
+        with self._lock:
+            self._size += len(data) - self._index.pop(key, 0)
+            self._index[key] = len(data)
+            while self._size > self.capacity and len(self._index) > 1:
+                old_key, old_size = self._index.popitem(last=False)
+                self._size -= old_size
+                self.evictions += 1
+                evicted.append(old_key)
+        for old_key in evicted:
+            try:
+                os.remove(self._path(old_key))
+            except OSError:
+                pass
+
+    def _discard(self, key: str):
+        with self._lock:
+            size = self._index.pop(key, None)
+            if size is not None:
+                self._size -= size
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "objects": len(self._index),
+                "bytes": self._size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
@@ -201,10 +201,13 @@ class DocStoreConnection(ABC):
             indexNames: str|list[str],
             knowledgebaseIds: list[str],
             aggFields: list[str] = [],
-            rank_feature: dict | None = None
+            rank_feature: dict | None = None,
+            **kwargs,
     ):
         """
         Search with given conjunctive equivalent filtering condition and return all fields of matched documents
+        Engine specific options (e.g. `exact_total=False` to allow a lazily computed total) are passed by kwargs,
+        and ignored by the engines that don't support them.
         """
         raise NotImplementedError("Not implemented")
 
@@ -0,0 +1,176 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+import logging
+import os
+from collections import deque
+
+import numpy as np
+import trio
+
+from api.utils.api_utils import timeout
+from rag.settings import EMBEDDING_BATCH_SIZE
+from rag.utils import truncate
+
+EMBEDDING_BATCH_MAX_WAIT = float(os.environ.get("EMBEDDING_BATCH_MAX_WAIT", 0.1))
+
+
+class _EmbeddingRequest:
+    def __init__(self, texts: list[str]):
+        self.texts = texts
+        self.taken = 0
+        self.finished = 0
+        self.vectors = [None] * len(texts)
+        self.token_count = 0
+        self.error = None
+        self.enqueued_at = trio.current_time()
+        self.done = trio.Event()
+
+
+class _ModelQueue:
+    def __init__(self):
+        self.pending = deque()
+        self.pending_texts = 0
+
+
+class EmbeddingBatcher:
+    """
+    Coalesces the texts that concurrent tasks submit for the same embedding model into full batches.
+
+    A submitter whose texts complete a batch encodes it right away; texts left in an underfilled batch
+    wait at most `max_wait` seconds for other tasks to fill it up, then the submitter encodes what is there.
+    Vectors are scattered back to the submitters in order, the token count of a batch is shared among them
+    according to the length of their texts.
+    """
+
+    def __init__(self, limiter: trio.CapacityLimiter, batch_size: int = EMBEDDING_BATCH_SIZE, max_wait: float = EMBEDDING_BATCH_MAX_WAIT):
+        self.limiter = limiter
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self._queues = {}
+        self._batches = 0
+        self._batched_texts = 0
+        self._requests = 0
+        self._queue_latency = 0.0
+        self._max_queue_latency = 0.0
+
+    @staticmethod
+    def _model_key(mdl):
+        # bundles of the same tenant and model are interchangeable, the usage is billed to the same tenant
+        return mdl.tenant_id, mdl.llm_type, mdl.llm_name
+
+    @staticmethod
+    def _withdraw(q: _ModelQueue, req: _EmbeddingRequest):
+        if req in q.pending:
+            q.pending.remove(req)
+            q.pending_texts -= len(req.texts) - req.taken
+            req.taken = len(req.texts)
+
+    async def encode(self, mdl, texts: list[str]):
+        """
+        Same as `mdl.encode(texts)`, with the texts truncated to the model max length: returns (vectors, token_count).
+        """
+        if not texts:
+            return np.array([]), 0
+        q = self._queues.setdefault(self._model_key(mdl), _ModelQueue())
+        req = _EmbeddingRequest(texts)
+        q.pending.append(req)
+        q.pending_texts += len(texts)
+        deadline = req.enqueued_at + self.max_wait
+
+        try:
+            while not req.done.is_set():
+                if req.taken < len(req.texts):
+                    if q.pending_texts >= self.batch_size or trio.current_time() >= deadline:
+                        await self._flush(mdl, q)
+                        continue
+                    with trio.move_on_at(deadline):
+                        await req.done.wait()
+                else:
+                    # all the texts are being encoded by other submitters
+                    await req.done.wait()
+        except BaseException:
+            self._withdraw(q, req)
+            raise
+
+        if req.error:
+            raise req.error
+        return np.array(req.vectors), req.token_count
+
+    def _take_batch(self, q: _ModelQueue):
+        batch = []
+        size = 0
+        while q.pending and size < self.batch_size:
+            req = q.pending[0]
+            n = min(self.batch_size - size, len(req.texts) - req.taken)
+            batch.append((req, req.taken, req.taken + n))
+            req.taken += n
+            size += n
+            if req.taken == len(req.texts):
+                q.pending.popleft()
+        q.pending_texts -= size
+        return batch, size
+
+    async def _flush(self, mdl, q: _ModelQueue):
+        batch, size = self._take_batch(q)
+        if not batch:
+            return
+
+        @timeout(60)
+        def batch_encode(txts):
+            return mdl.encode([truncate(c, mdl.max_length - 10) for c in txts])
+
+        now = trio.current_time()
+        for req, start, _ in batch:
+            if start == 0:
+                self._requests += 1
+                self._queue_latency += now - req.enqueued_at
+                self._max_queue_latency = max(self._max_queue_latency, now - req.enqueued_at)
+        self._batches += 1
+        self._batched_texts += size
+
+        texts = [t for req, start, end in batch for t in req.texts[start:end]]
+        try:
+            # shielded: a cancelled submitter must not leave the others of the batch without their vectors
+            with trio.CancelScope(shield=True):
+                async with self.limiter:
+                    vts, c = await trio.to_thread.run_sync(lambda: batch_encode(texts))
+        except Exception as e:
+            logging.exception(f"EmbeddingBatcher failed to encode a batch of {size} texts")
+            for req, _, _ in batch:
+                self._withdraw(q, req)
+                req.error = e
+                req.done.set()
+            return
+
+        total_len = max(1, sum(len(t) for t in texts))
+        i = 0
+        for req, start, end in batch:
+            req.vectors[start:end] = list(vts[i: i + end - start])
+            req.token_count += int(round(c * sum(len(t) for t in req.texts[start:end]) / total_len))
+            i += end - start
+            req.finished += end - start
+            if req.finished == len(req.texts):
+                req.done.set()
+
+    def stats(self) -> dict:
+        return {
+            "batches": self._batches,
+            "texts": self._batched_texts,
+            "fill_ratio": round(self._batched_texts / (self._batches * self.batch_size), 3) if self._batches else 0,
+            "avg_queue_latency": round(self._queue_latency / self._requests, 3) if self._requests else 0,
+            "max_queue_latency": round(self._max_queue_latency, 3),
+        }
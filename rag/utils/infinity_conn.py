@@ -291,6 +291,7 @@ class InfinityConnection(DocStoreConnection):
         knowledgebaseIds: list[str],
         aggFields: list[str] = [],
         rank_feature: dict | None = None,
+        **kwargs,
     ) -> tuple[pd.DataFrame, int]:
         """
         BUG: Infinity returns empty for a highlight field if the query string doesn't use that field.
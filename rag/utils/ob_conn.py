@@ -13,11 +13,18 @@
 #  See the License for the specific language governing permissions and
 #  limitations under the License.
 #
+import functools
+import heapq
+import itertools
 import json
 import logging
 import os
 import re
+import threading
 import time
+from collections import OrderedDict
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor
 from typing import Any, Optional
 
 from elasticsearch_dsl import Q, Search
@@ -141,9 +148,22 @@ fulltext_search_template = "MATCH (%s) AGAINST ('%s' IN NATURAL LANGUAGE MODE)"
 vector_search_template = "cosine_distance(%s, %s)"
 
 
+def merge_ranked_chunks(chunk_lists: list[list[dict]], offset: int, limit: int) -> list[dict]:
+    """
+    The page [offset, offset + limit) of the hits of several tables, each list being the hits of a table in descending
+    `_score` order from its first one. All of them are returned when limit is 0.
+    """
+    merged = heapq.merge(*chunk_lists, key=lambda chunk: chunk.get("_score", 0.0), reverse=True)
+    if limit > 0:
+        return list(itertools.islice(merged, offset, offset + limit))
+    return list(merged)
+
+
 class SearchResult(BaseModel):
     total: int
     chunks: list[dict]
+    # elapsed seconds of searching each table
+    elapsed: dict[str, float] = {}
 
 
 def get_column_value(column_name: str, value: Any) -> Any:
@@ -173,7 +193,7 @@ def get_column_value(column_name: str, value: Any) -> Any:
                 return value
         else:
             return value
-    elif column_name == "_score":
+    elif column_name in ["_score", "_vector_similarity"]:
         return float(value)
     else:
         raise ValueError(f"Unknown column '{column_name}' with value '{value}'.")
@@ -349,6 +369,145 @@ def _try_with_lock(lock_name: str, process_func, check_func, timeout: int = None
             raise Exception(f"Timeout to wait for process complete for {lock_name}.")
 
 
+def is_schema_missing_error(e: Exception) -> bool:
+    """Whether e is the error of a statement on a missing table (1146) or column (1054)."""
+    e = getattr(e, "orig", None) or e
+    return bool(e.args) and e.args[0] in (1146, 1054)
+
+
+class SchemaMetadataCache:
+    """
+    In-process cache of the existence of tables, columns and indexes, to save the catalog round-trips on the
+    search/update/delete paths. A known schema object is kept for `ttl` seconds, a missing one for `missing_ttl`
+    seconds since it may be created by other processes soon, and only when the caller can afford to miss it.
+    As other processes may also drop and re-create tables, a statement failing on a missing table or column evicts
+    the entries of its table and is retried once.
+    """
+
+    def __init__(self, ttl: float, missing_ttl: float):
+        self.ttl = ttl
+        self.missing_ttl = missing_ttl
+        self._entries: dict[tuple[str, ...], tuple[bool, float]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def exists(self, key: tuple[str, ...], check_func, trust_missing: bool = True) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > now and (entry[0] or trust_missing):
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+        exists = check_func()
+        self.set(key, exists)
+        return exists
+
+    def set(self, key: tuple[str, ...], exists: bool):
+        expire_time = time.monotonic() + (self.ttl if exists else self.missing_ttl)
+        with self._lock:
+            self._entries[key] = (exists, expire_time)
+
+    def invalidate(self, table_name: str):
+        with self._lock:
+            for key in [k for k in self._entries if k[1] == table_name]:
+                del self._entries[key]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+@functools.lru_cache(maxsize=1024)
+def keyword_pattern(keywords: tuple[str, ...]) -> Optional[re.Pattern]:
+    """
+    One alternation of all the keywords, longest first, so that a text is scanned once whatever the number of
+    keywords, and a keyword within a longer matched one isn't highlighted again.
+    """
+    keywords = sorted({k for k in keywords if k}, key=len, reverse=True)
+    if not keywords:
+        return None
+    return re.compile(r"(?<!\w)(?:%s)(?!\w)" % "|".join(re.escape(k) for k in keywords), flags=re.IGNORECASE)
+
+
+class HighlightCache:
+    """
+    LRU cache of the highlighted texts by (chunk id, field, keywords), the same chunks come back for the follow-up
+    questions of a chat and the pages of a chunk search. An entry is only reused for the same text, so an updated
+    chunk is highlighted again.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._entries: OrderedDict[tuple, tuple[str, Optional[str]]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: tuple, txt: str) -> tuple[bool, Optional[str]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == txt:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return True, entry[1]
+            self.misses += 1
+            return False, None
+
+    def put(self, key: tuple, txt: str, value: Optional[str]):
+        if self.capacity <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (txt, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+
+
+class LazyHighlight(Mapping):
+    """
+    The highlights of the chunks of a search result by chunk id, each computed on its first access. Reranking
+    discards most of the candidates, only the chunks that are returned get highlighted.
+    """
+
+    def __init__(self, conn: "OBConnection", chunks: list[dict], keywords: list[str], fieldnm: str):
+        self._conn = conn
+        self._chunks = {d["id"]: d for d in chunks if d.get(fieldnm)}
+        self._keywords = keywords
+        self._fieldnm = fieldnm
+        self._highlights: dict[str, Optional[str]] = {}
+
+    def _get(self, chunk_id: str) -> Optional[str]:
+        if chunk_id not in self._highlights:
+            d = self._chunks.get(chunk_id)
+            self._highlights[chunk_id] = self._conn.highlight_chunk(d, self._keywords, self._fieldnm) if d else None
+        return self._highlights[chunk_id]
+
+    def __getitem__(self, chunk_id: str) -> str:
+        highlighted_txt = self._get(chunk_id)
+        if not highlighted_txt:
+            raise KeyError(chunk_id)
+        return highlighted_txt
+
+    def __contains__(self, chunk_id) -> bool:
+        return bool(self._get(chunk_id))
+
+    def __iter__(self):
+        return (chunk_id for chunk_id in self._chunks if self._get(chunk_id))
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def __bool__(self) -> bool:
+        # without highlighting everything
+        return len(self._chunks) > 0
+
+
 @singleton
 class OBConnection(DocStoreConnection):
     def __init__(self):
@@ -458,6 +617,15 @@ class OBConnection(DocStoreConnection):
         self.use_fulltext_hint = is_true('USE_FULLTEXT_HINT', 'true')
         self.search_original_content = is_true("SEARCH_ORIGINAL_CONTENT", 'true')
         self.enable_hybrid_search = is_true('ENABLE_HYBRID_SEARCH', 'false')
+        # max number of tables searched concurrently by one search request, 1 means searching tables one by one
+        self.search_parallelism = max(1, int(os.getenv('OB_SEARCH_PARALLELISM', '8')))
+        self._search_executor = ThreadPoolExecutor(max_workers=self.search_parallelism,
+                                                   thread_name_prefix="ob_search")
+        self._metadata_cache = SchemaMetadataCache(
+            ttl=float(os.getenv('OB_METADATA_CACHE_TTL', '600')),
+            missing_ttl=float(os.getenv('OB_METADATA_CACHE_MISSING_TTL', '10')),
+        )
+        self._highlight_cache = HighlightCache(int(os.getenv('OB_HIGHLIGHT_CACHE_SIZE', '4096')))
 
     """
     Database operations
@@ -469,7 +637,8 @@ class OBConnection(DocStoreConnection):
     def health(self) -> dict:
         return {
             "uri": self.uri,
-            "version_comment": self._get_variable_value("version_comment")
+            "version_comment": self._get_variable_value("version_comment"),
+            "metadata_cache": self._metadata_cache.stats(),
         }
 
     def _get_variable_value(self, var_name: str) -> Any:
@@ -533,6 +702,9 @@ class OBConnection(DocStoreConnection):
         finally:
             # always refresh metadata to make sure it contains the latest table structure
             self.client.refresh_metadata([indexName])
+            self._metadata_cache.invalidate(indexName)
+        self._metadata_cache.set(("table", indexName), True)
+        self._metadata_cache.set(("column", indexName, vector_field_name), True)
 
     def deleteIdx(self, indexName: str, knowledgebaseId: str):
         if len(knowledgebaseId) > 0:
@@ -544,21 +716,23 @@ class OBConnection(DocStoreConnection):
                 logger.info(f"Dropped table '{indexName}'.")
         except Exception as e:
             raise Exception(f"OBConnection.deleteIndex error: {str(e)}")
+        finally:
+            self._metadata_cache.invalidate(indexName)
 
     def indexExist(self, indexName: str, knowledgebaseId: str = None) -> bool:
         try:
-            if not self.client.check_table_exists(indexName):
+            if not self._table_exists_cached(indexName):
                 return False
             for column_name in index_columns:
-                if not self._index_exists(indexName, index_name_template % (indexName, column_name)):
+                if not self._index_exists_cached(indexName, index_name_template % (indexName, column_name)):
                     return False
             fts_columns = fts_columns_origin if self.search_original_content else fts_columns_tks
             for fts_column in fts_columns:
                 column_name = fts_column.split("^")[0]
-                if not self._index_exists(indexName, fulltext_index_name_template % column_name):
+                if not self._index_exists_cached(indexName, fulltext_index_name_template % column_name):
                     return False
             for column in [column_order_id, column_group_id]:
-                if not self._column_exist(indexName, column.name):
+                if not self._column_exist_cached(indexName, column.name):
                     return False
         except Exception as e:
             raise Exception(f"OBConnection.indexExist error: {str(e)}")
@@ -572,6 +746,23 @@ class OBConnection(DocStoreConnection):
         ).fetchone()
         return count
 
+    def _get_count_by_sql(self, count_sql: str) -> int:
+        logger.debug("OBConnection.search with count sql: %s", count_sql)
+        res = self.client.perform_raw_text_sql(count_sql)
+        row = res.fetchone() if res else None
+        return int(row[0]) if row else 0
+
+    def _get_total_from_rows(self, rows: list[Row], count_sql: str, offset: int, exact_total: bool) -> int:
+        """
+        Get the total hits of a ranked search whose last selected column is `COUNT(*) OVER ()`.
+        The count statement is only issued for an empty page after the first one.
+        """
+        if rows:
+            return int(rows[0][-1])
+        if offset == 0 or not exact_total:
+            return 0
+        return self._get_count_by_sql(count_sql)
+
     def _column_exist(self, table_name: str, column_name: str) -> bool:
         return self._get_count(
             table_name="INFORMATION_SCHEMA.COLUMNS",
@@ -590,6 +781,41 @@ class OBConnection(DocStoreConnection):
                 f"INDEX_NAME = '{index_name}'",
             ]) > 0
 
+    def _table_exists_cached(self, table_name: str, trust_missing: bool = True) -> bool:
+        return self._metadata_cache.exists(
+            ("table", table_name),
+            lambda: self.client.check_table_exists(table_name),
+            trust_missing,
+        )
+
+    def _column_exist_cached(self, table_name: str, column_name: str) -> bool:
+        return self._metadata_cache.exists(
+            ("column", table_name, column_name),
+            lambda: self._column_exist(table_name, column_name),
+        )
+
+    def _index_exists_cached(self, table_name: str, index_name: str) -> bool:
+        return self._metadata_cache.exists(
+            ("index", table_name, index_name),
+            lambda: self._index_exists(table_name, index_name),
+        )
+
+    def _retry_on_schema_change(self, table_name: str, func, default=None):
+        """
+        Run func on the table, once more if it fails on a missing table or column, after evicting the cached schema
+        of the table. The default is returned if the table is then found missing.
+        """
+        try:
+            return func()
+        except Exception as e:
+            if not is_schema_missing_error(e):
+                raise
+            logger.info(f"OBConnection evicts the cached schema of {table_name}: {str(e)}")
+            self._metadata_cache.invalidate(table_name)
+        if not self._table_exists_cached(table_name):
+            return default
+        return func()
+
     def _create_table(self, table_name: str):
         # remove outdated metadata for external changes
         if table_name in self.client.metadata_obj.tables:
@@ -823,8 +1049,6 @@ class OBConnection(DocStoreConnection):
                 if field not in output_fields:
                     output_fields.append(field)
 
-        fields_expr = ", ".join(output_fields)
-
         condition["kb_id"] = knowledgebaseIds
         filters: list[str] = get_filters(condition)
         filters_expr = " AND ".join(filters)
@@ -891,6 +1115,16 @@ class OBConnection(DocStoreConnection):
             vector_search_score_expr = f"(1 - {vector_search_expr})"
             vector_search_filter = f"{vector_search_score_expr} >= {vector_similarity_threshold}"
 
+        # with `vector_scores`, the similarity of each row to the query vector is returned as `_vector_similarity`
+        # in place of the vector itself, the caller ranks on the scores and skips moving and parsing the vectors
+        vector_scores = bool(kwargs.get("vector_scores", False)) and vector_data is not None
+        if vector_scores and vector_column_name in output_fields:
+            output_fields.remove(vector_column_name)
+        fields_expr = ", ".join(output_fields)
+        if vector_scores:
+            fields_expr += f", {vector_search_score_expr} AS _vector_similarity"
+            output_fields.append("_vector_similarity")
+
         pagerank_score_expr = f"(CAST(IFNULL({PAGERANK_FLD}, 0) AS DECIMAL(10, 2)) / 100)"
 
         # TODO use tag rank_feature in sorting
@@ -911,26 +1145,39 @@ class OBConnection(DocStoreConnection):
             output_fields.append("_score")
 
         group_results = kwargs.get("group_results", False)
+        # the ranked searches carry their total in a `COUNT(*) OVER ()` column, the separate count statement is only
+        # needed when the requested page is past the last hit and the caller relies on the exact total
+        exact_total = kwargs.get("exact_total", True)
 
-        for index_name in indexNames:
+        page_offset, page_limit = offset, limit
+        if len(indexNames) > 1 and search_type in ["fusion", "fulltext", "vector"] and limit > 0:
+            # the page is cut from the merged hits of all the tables, so each table is asked for the hits up to its end
+            offset, limit = 0, offset + limit
 
-            if not self.client.check_table_exists(index_name):
-                continue
+        def search_table(index_name: str) -> SearchResult:
+            result = SearchResult(total=0, chunks=[])
+
+            if not self._table_exists_cached(index_name):
+                return result
 
             fulltext_search_hint = f"/*+ UNION_MERGE({index_name} {' '.join(fulltext_search_idx_list)}) */" if self.use_fulltext_hint else ""
 
             if search_type == "fusion":
                 # fusion search, usually for chat
                 num_candidates = vector_topn + fulltext_topn
+                fulltext_cte = (
+                    f"WITH fulltext_results AS ("
+                    f"  SELECT {fulltext_search_hint} *, {fulltext_search_score_expr} AS relevance"
+                    f"      FROM {index_name}"
+                    f"      WHERE {filters_expr} AND {fulltext_search_filter}"
+                    f"      ORDER BY relevance DESC"
+                    f"      LIMIT {num_candidates}"
+                    f")"
+                )
+                score_expr = f"(relevance * {1 - vector_similarity_weight} + {vector_search_score_expr} * {vector_similarity_weight} + {pagerank_score_expr})"
                 if group_results:
                     count_sql = (
-                        f"WITH fulltext_results AS ("
-                        f"  SELECT {fulltext_search_hint} *, {fulltext_search_score_expr} AS relevance"
-                        f"      FROM {index_name}"
-                        f"      WHERE {filters_expr} AND {fulltext_search_filter}"
-                        f"      ORDER BY relevance DESC"
-                        f"      LIMIT {num_candidates}"
-                        f"),"
+                        f"{fulltext_cte},"
                         f" scored_results AS ("
                         f"  SELECT *"
                         f"      FROM fulltext_results"
@@ -944,48 +1191,8 @@ class OBConnection(DocStoreConnection):
                         f"      FROM group_results"
                         f"      WHERE rn = 1"
                     )
-                else:
-                    count_sql = (
-                        f"WITH fulltext_results AS ("
-                        f"  SELECT {fulltext_search_hint} *, {fulltext_search_score_expr} AS relevance"
-                        f"      FROM {index_name}"
-                        f"      WHERE {filters_expr} AND {fulltext_search_filter}"
-                        f"      ORDER BY relevance DESC"
-                        f"      LIMIT {num_candidates}"
-                        f")"
-                        f"  SELECT COUNT(*) FROM fulltext_results WHERE {vector_search_filter}"
-                    )
-                logger.debug("OBConnection.search with count sql: %s", count_sql)
-
-                start_time = time.time()
-
-                res = self.client.perform_raw_text_sql(count_sql)
-                total_count = res.fetchone()[0] if res else 0
-                result.total += total_count
-
-                elapsed_time = time.time() - start_time
-                logger.info(
-                    f"OBConnection.search table {index_name}, search type: fusion, step: 1-count, elapsed time: {elapsed_time:.3f} seconds,"
-                    f" vector column: '{vector_column_name}',"
-                    f" query text: '{fulltext_query}',"
-                    f" condition: '{condition}',"
-                    f" vector_similarity_threshold: {vector_similarity_threshold},"
-                    f" got count: {total_count}"
-                )
-
-                if total_count == 0:
-                    continue
-
-                score_expr = f"(relevance * {1 - vector_similarity_weight} + {vector_search_score_expr} * {vector_similarity_weight} + {pagerank_score_expr})"
-                if group_results:
                     fusion_sql = (
-                        f"WITH fulltext_results AS ("
-                        f"  SELECT {fulltext_search_hint} *, {fulltext_search_score_expr} AS relevance"
-                        f"      FROM {index_name}"
-                        f"      WHERE {filters_expr} AND {fulltext_search_filter}"
-                        f"      ORDER BY relevance DESC"
-                        f"      LIMIT {num_candidates}"
-                        f"),"
+                        f"{fulltext_cte},"
                         f" scored_results AS ("
                         f"  SELECT *, {score_expr} AS _score"
                         f"      FROM fulltext_results"
@@ -995,22 +1202,17 @@ class OBConnection(DocStoreConnection):
                         f"  SELECT *, ROW_NUMBER() OVER (PARTITION BY group_id ORDER BY _score DESC) as rn"
                         f"      FROM scored_results"
                         f")"
-                        f"  SELECT {fields_expr}, _score"
+                        f"  SELECT {fields_expr}, _score, COUNT(*) OVER () AS _total_count"
                         f"      FROM group_results"
                         f"      WHERE rn = 1"
                         f"      ORDER BY _score DESC"
                         f"      LIMIT {offset}, {limit}"
                     )
                 else:
+                    count_sql = f"{fulltext_cte}  SELECT COUNT(*) FROM fulltext_results WHERE {vector_search_filter}"
                     fusion_sql = (
-                        f"WITH fulltext_results AS ("
-                        f"  SELECT {fulltext_search_hint} *, {fulltext_search_score_expr} AS relevance"
-                        f"      FROM {index_name}"
-                        f"      WHERE {filters_expr} AND {fulltext_search_filter}"
-                        f"      ORDER BY relevance DESC"
-                        f"      LIMIT {num_candidates}"
-                        f")"
-                        f"  SELECT {fields_expr}, {score_expr} AS _score"
+                        f"{fulltext_cte}"
+                        f"  SELECT {fields_expr}, {score_expr} AS _score, COUNT(*) OVER () AS _total_count"
                         f"      FROM fulltext_results"
                         f"      WHERE {vector_search_filter}"
                         f"      ORDER BY _score DESC"
@@ -1022,16 +1224,19 @@ class OBConnection(DocStoreConnection):
 
                 res = self.client.perform_raw_text_sql(fusion_sql)
                 rows = res.fetchall()
+                total_count = self._get_total_from_rows(rows, count_sql, offset, exact_total)
+                result.total += total_count
 
                 elapsed_time = time.time() - start_time
                 logger.info(
-                    f"OBConnection.search table {index_name}, search type: fusion, step: 2-query, elapsed time: {elapsed_time:.3f} seconds,"
+                    f"OBConnection.search table {index_name}, search type: fusion, elapsed time: {elapsed_time:.3f} seconds,"
                     f" select fields: '{output_fields}',"
                     f" vector column: '{vector_column_name}',"
                     f" query text: '{fulltext_query}',"
                     f" condition: '{condition}',"
                     f" vector_similarity_threshold: {vector_similarity_threshold},"
                     f" vector_similarity_weight: {vector_similarity_weight},"
+                    f" got count: {total_count},"
                     f" return rows count: {len(rows)}"
                 )
 
@@ -1039,33 +1244,13 @@ class OBConnection(DocStoreConnection):
                     result.chunks.append(self._row_to_entity(row, output_fields))
             elif search_type == "vector":
                 # vector search, usually used for graph search
-                count_sql = f"SELECT COUNT(id) FROM {index_name} WHERE {filters_expr} AND {vector_search_filter}"
-                logger.debug("OBConnection.search with vector count sql: %s", count_sql)
-
-                start_time = time.time()
-
-                res = self.client.perform_raw_text_sql(count_sql)
-                total_count = res.fetchone()[0] if res else 0
-                result.total += total_count
-
-                elapsed_time = time.time() - start_time
-                logger.info(
-                    f"OBConnection.search table {index_name}, search type: vector, step: 1-count, elapsed time: {elapsed_time:.3f} seconds,"
-                    f" vector column: '{vector_column_name}',"
-                    f" condition: '{condition}',"
-                    f" vector_similarity_threshold: {vector_similarity_threshold},"
-                    f" got count: {total_count}"
-                )
-
-                if total_count == 0:
-                    continue
-
+                vector_limit = limit if limit != 0 else vector_topn
                 vector_sql = (
                     f"SELECT {fields_expr}, {vector_search_score_expr} AS _score"
                     f"  FROM {index_name}"
                     f"  WHERE {filters_expr} AND {vector_search_filter}"
                     f"  ORDER BY {vector_search_expr}"
-                    f"  APPROXIMATE LIMIT {limit if limit != 0 else vector_topn}"
+                    f"  APPROXIMATE LIMIT {vector_limit}"
                 )
                 if offset != 0:
                     vector_sql += f" OFFSET {offset}"
@@ -1076,13 +1261,25 @@ class OBConnection(DocStoreConnection):
                 res = self.client.perform_raw_text_sql(vector_sql)
                 rows = res.fetchall()
 
+                # a window count would defeat the approximate (ANN) plan, so the total is derived from the page
+                # itself, and the exact count is only issued for a full page when the caller asks for it
+                if len(rows) < vector_limit and (len(rows) > 0 or offset == 0):
+                    total_count = offset + len(rows)
+                elif exact_total:
+                    count_sql = f"SELECT COUNT(id) FROM {index_name} WHERE {filters_expr} AND {vector_search_filter}"
+                    total_count = self._get_count_by_sql(count_sql)
+                else:
+                    total_count = offset + len(rows)
+                result.total += total_count
+
                 elapsed_time = time.time() - start_time
                 logger.info(
-                    f"OBConnection.search table {index_name}, search type: vector, step: 2-query, elapsed time: {elapsed_time:.3f} seconds,"
+                    f"OBConnection.search table {index_name}, search type: vector, elapsed time: {elapsed_time:.3f} seconds,"
                     f" select fields: '{output_fields}',"
                     f" vector column: '{vector_column_name}',"
                     f" condition: '{condition}',"
                     f" vector_similarity_threshold: {vector_similarity_threshold},"
+                    f" got count: {total_count},"
                     f" return rows count: {len(rows)}"
                 )
 
@@ -1091,27 +1288,9 @@ class OBConnection(DocStoreConnection):
             elif search_type == "fulltext":
                 # fulltext search, usually used to search chunks in one dataset
                 count_sql = f"SELECT {fulltext_search_hint} COUNT(id) FROM {index_name} WHERE {filters_expr} AND {fulltext_search_filter}"
-                logger.debug("OBConnection.search with fulltext count sql: %s", count_sql)
-
-                start_time = time.time()
-
-                res = self.client.perform_raw_text_sql(count_sql)
-                total_count = res.fetchone()[0] if res else 0
-                result.total += total_count
-
-                elapsed_time = time.time() - start_time
-                logger.info(
-                    f"OBConnection.search table {index_name}, search type: fulltext, step: 1-count, elapsed time: {elapsed_time:.3f} seconds,"
-                    f" query text: '{fulltext_query}',"
-                    f" condition: '{condition}',"
-                    f" got count: {total_count}"
-                )
-
-                if total_count == 0:
-                    continue
-
                 fulltext_sql = (
-                    f"SELECT {fulltext_search_hint} {fields_expr}, {fulltext_search_score_expr} AS _score"
+                    f"SELECT {fulltext_search_hint} {fields_expr}, {fulltext_search_score_expr} AS _score,"
+                    f"  COUNT(*) OVER () AS _total_count"
                     f"  FROM {index_name}"
                     f"  WHERE {filters_expr} AND {fulltext_search_filter}"
                     f"  ORDER BY _score DESC"
@@ -1123,13 +1302,16 @@ class OBConnection(DocStoreConnection):
 
                 res = self.client.perform_raw_text_sql(fulltext_sql)
                 rows = res.fetchall()
+                total_count = self._get_total_from_rows(rows, count_sql, offset, exact_total)
+                result.total += total_count
 
                 elapsed_time = time.time() - start_time
                 logger.info(
-                    f"OBConnection.search table {index_name}, search type: fulltext, step: 2-query, elapsed time: {elapsed_time:.3f} seconds,"
+                    f"OBConnection.search table {index_name}, search type: fulltext, elapsed time: {elapsed_time:.3f} seconds,"
                     f" select fields: '{output_fields}',"
                     f" query text: '{fulltext_query}',"
                     f" condition: '{condition}',"
+                    f" got count: {total_count},"
                     f" return rows count: {len(rows)}"
                 )
 
@@ -1182,11 +1364,12 @@ class OBConnection(DocStoreConnection):
             else:
                 # only filter
                 orders: list[str] = []
+                select_expr = fields_expr
                 if orderBy:
                     for field, order in orderBy.fields:
                         if isinstance(column_types[field], ARRAY):
                             f = field + "_sort"
-                            fields_expr += f", array_to_string({field}, ',') AS {f}"
+                            select_expr += f", array_to_string({field}, ',') AS {f}"
                             field = f
                         order = "ASC" if order == 0 else "DESC"
                         orders.append(f"{field} {order}")
@@ -1207,12 +1390,12 @@ class OBConnection(DocStoreConnection):
                 )
 
                 if total_count == 0:
-                    continue
+                    return result
 
                 order_by_expr = ("ORDER BY " + ", ".join(orders)) if len(orders) > 0 else ""
                 limit_expr = f"LIMIT {offset}, {limit}" if limit != 0 else ""
                 filter_sql = (
-                    f"SELECT {fields_expr}"
+                    f"SELECT {select_expr}"
                     f"  FROM {index_name}"
                     f"  WHERE {filters_expr}"
                     f"  {order_by_expr} {limit_expr}"
@@ -1234,13 +1417,42 @@ class OBConnection(DocStoreConnection):
 
                 for row in rows:
                     result.chunks.append(self._row_to_entity(row, output_fields))
+            return result
+
+        def timed_search_table(index_name: str) -> tuple[str, SearchResult, float]:
+            start_time = time.time()
+            table_result = self._retry_on_schema_change(index_name, lambda: search_table(index_name),
+                                                        SearchResult(total=0, chunks=[]))
+            return index_name, table_result, time.time() - start_time
+
+        if len(indexNames) > 1 and self.search_parallelism > 1:
+            # fan out to all the tables at once, so the latency follows the slowest table instead of the sum of them
+            table_results = list(self._search_executor.map(timed_search_table, indexNames))
+        else:
+            table_results = [timed_search_table(index_name) for index_name in indexNames]
+
+        for index_name, table_result, elapsed_time in table_results:
+            result.total += table_result.total
+            result.elapsed[index_name] = elapsed_time
+
+        if len(table_results) > 1 and search_type in ["fusion", "fulltext", "vector"]:
+            result.chunks = merge_ranked_chunks([table_result.chunks for _, table_result, _ in table_results],
+                                                page_offset, page_limit)
+            logger.info(
+                f"OBConnection.search tables {indexNames}, search type: {search_type},"
+                f" elapsed time: {json.dumps({k: round(v, 3) for k, v in result.elapsed.items()})},"
+                f" merged rows count: {len(result.chunks)}"
+            )
+        else:
+            for _, table_result, _ in table_results:
+                result.chunks.extend(table_result.chunks)
         return result
 
     def get(self, chunkId: str, indexName: str, knowledgebaseIds: list[str]) -> dict | None:
-        if not self.client.check_table_exists(indexName):
+        if not self._table_exists_cached(indexName):
             return None
 
-        try:
+        def get_chunk():
             res = self.client.get(
                 table_name=indexName,
                 ids=[chunkId],
@@ -1250,6 +1462,9 @@ class OBConnection(DocStoreConnection):
                 raise Exception(f"ChunkId {chunkId} not found in index {indexName}.")
 
             return self._row_to_entity(row, fields=list(res.keys()))
+
+        try:
+            return self._retry_on_schema_change(indexName, get_chunk)
         except json.JSONDecodeError as e:
             logger.error(f"JSON decode error when getting chunk {chunkId}: {str(e)}")
             return {
@@ -1336,7 +1551,8 @@ class OBConnection(DocStoreConnection):
         return res
 
     def update(self, condition: dict, newValue: dict, indexName: str, knowledgebaseId: str) -> bool:
-        if not self.client.check_table_exists(indexName):
+        # a table missing a moment ago may have been created since, the update would be lost
+        if not self._table_exists_cached(indexName, trust_missing=False):
             return True
 
         condition["kb_id"] = knowledgebaseId
@@ -1380,18 +1596,20 @@ class OBConnection(DocStoreConnection):
         logger.debug("OBConnection.update sql: %s", update_sql)
 
         try:
-            self.client.perform_raw_text_sql(update_sql)
+            self._retry_on_schema_change(indexName, lambda: self.client.perform_raw_text_sql(update_sql))
             return True
         except Exception as e:
             logger.error(f"OBConnection.update error: {str(e)}")
         return False
 
     def delete(self, condition: dict, indexName: str, knowledgebaseId: str) -> int:
-        if not self.client.check_table_exists(indexName):
+        # a table missing a moment ago may have been created since, its chunks would be left behind
+        if not self._table_exists_cached(indexName, trust_missing=False):
             return 0
 
         condition["kb_id"] = knowledgebaseId
-        try:
+
+        def delete_chunks():
             res = self.client.get(
                 table_name=indexName,
                 ids=None,
@@ -1408,6 +1626,9 @@ class OBConnection(DocStoreConnection):
                 ids=ids,
             )
             return len(ids)
+
+        try:
+            return self._retry_on_schema_change(indexName, delete_chunks, 0)
         except Exception as e:
             logger.error(f"OBConnection.delete error: {str(e)}")
         return 0
@@ -1467,25 +1688,18 @@ class OBConnection(DocStoreConnection):
         if not txt or not keywords:
             return None
 
-        highlighted_txt = txt
-
         if question and not self.is_chinese(question):
-            highlighted_txt = re.sub(
-                r"(^|\W)(%s)(\W|$)" % re.escape(question),
-                r"\1<em>\2</em>\3", highlighted_txt,
-                flags=re.IGNORECASE | re.MULTILINE,
-            )
-            if re.search(r"<em>[^<>]+</em>", highlighted_txt, flags=re.IGNORECASE | re.MULTILINE):
-                return highlighted_txt
-
-            for keyword in keywords:
-                highlighted_txt = re.sub(
-                    r"(^|\W)(%s)(\W|$)" % re.escape(keyword),
-                    r"\1<em>\2</em>\3", highlighted_txt,
-                    flags=re.IGNORECASE | re.MULTILINE,
-                )
-            if len(re.findall(r'</em><em>', highlighted_txt)) > 0 or len(
-                re.findall(r'</em>\s*<em>', highlighted_txt)) > 0:
+            pattern = keyword_pattern((question,))
+            if pattern:
+                highlighted_txt, n = pattern.subn(r"<em>\g<0></em>", txt)
+                if n > 0:
+                    return highlighted_txt
+
+            pattern = keyword_pattern(tuple(keywords))
+            if not pattern:
+                return None
+            highlighted_txt = pattern.sub(r"<em>\g<0></em>", txt)
+            if re.search(r'</em>\s*<em>', highlighted_txt):
                 return highlighted_txt
             else:
                 return None
@@ -1496,36 +1710,47 @@ class OBConnection(DocStoreConnection):
         if not tokens:
             return None
 
+        # locate the tokens from the end of the text, and keep the spans of the keywords, merging the adjacent ones
+        keyword_set = set(keywords)
+        spans: list[list[int]] = []
         last_pos = len(txt)
-
-        for i in range(len(tokens) - 1, -1, -1):
-            token = tokens[i]
-            token_pos = highlighted_txt.rfind(token, 0, last_pos)
+        for token in reversed(tokens):
+            token_pos = txt.rfind(token, 0, last_pos)
             if token_pos != -1:
-                if token in keywords:
-                    highlighted_txt = (
-                        highlighted_txt[:token_pos] +
-                        f'<em>{token}</em>' +
-                        highlighted_txt[token_pos + len(token):]
-                    )
+                if token in keyword_set:
+                    if spans and spans[-1][0] == token_pos + len(token):
+                        spans[-1][0] = token_pos
+                    else:
+                        spans.append([token_pos, token_pos + len(token)])
                 last_pos = token_pos
-        return re.sub(r'</em><em>', '', highlighted_txt)
 
-    def getHighlight(self, res, keywords: list[str], fieldnm: str):
-        ans = {}
-        if len(res.chunks) == 0 or len(keywords) == 0:
-            return ans
+        parts = []
+        pos = 0
+        for start, end in reversed(spans):
+            parts.append(txt[pos:start])
+            parts.append(f"<em>{txt[start:end]}</em>")
+            pos = end
+        parts.append(txt[pos:])
+        return "".join(parts)
+
+    def highlight_chunk(self, d: dict, keywords: list[str], fieldnm: str) -> Optional[str]:
+        txt = d.get(fieldnm)
+        if not txt:
+            return None
+        key = (d["id"], fieldnm, tuple(keywords))
+        hit, highlighted_txt = self._highlight_cache.get(key, txt)
+        if hit:
+            return highlighted_txt
 
-        for d in res.chunks:
-            txt = d.get(fieldnm)
-            if not txt:
-                continue
+        tks = d.get("content_ltks") if fieldnm == "content_with_weight" else ""
+        highlighted_txt = self.highlight(txt, tks, " ".join(keywords), keywords)
+        self._highlight_cache.put(key, txt, highlighted_txt)
+        return highlighted_txt
 
-            tks = d.get("content_ltks") if fieldnm == "content_with_weight" else ""
-            highlighted_txt = self.highlight(txt, tks, " ".join(keywords), keywords)
-            if highlighted_txt:
-                ans[d["id"]] = highlighted_txt
-        return ans
+    def getHighlight(self, res, keywords: list[str], fieldnm: str):
+        if len(res.chunks) == 0 or len(keywords) == 0:
+            return {}
+        return LazyHighlight(self, res.chunks, keywords, fieldnm)
 
     def getAggregation(self, res, fieldnm: str):
         if len(res.chunks) == 0:
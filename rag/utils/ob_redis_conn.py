@@ -1,6 +1,9 @@
 import collections
 import json
 import logging
+import os
+import random
+import threading
 import time
 import uuid
 from datetime import datetime, timedelta
@@ -15,6 +18,12 @@ from rag.utils.redis_able import RedisAble
 
 DATABASE = None
 
+# 列表的各行按此间隔(秒)跟随列表整体的过期时间
+CACHE_LIST_REFRESH_INTERVAL = int(os.environ.get("CACHE_LIST_REFRESH_INTERVAL", "60"))
+# 每个进程按此间隔(秒)清理一次 cache 表中已过期的行, 每条语句最多删除 CACHE_SWEEP_BATCH 行
+CACHE_SWEEP_INTERVAL = int(os.environ.get("CACHE_SWEEP_INTERVAL", "300"))
+CACHE_SWEEP_BATCH = int(os.environ.get("CACHE_SWEEP_BATCH", "10000"))
+
 
 def get_db():
     global DATABASE
@@ -72,6 +81,9 @@ class OceanBaseRedisDb(RedisAble):
 
     def __init__(self, db=None):
         self.db = db if db else get_db()
+        self._list_lock = threading.Lock()
+        self._list_refreshed_at = {}
+        self._swept_at = None
 
     def register_scripts(self) -> None:
         raise NotImplementedError("Not implemented")
@@ -150,6 +162,42 @@ class OceanBaseRedisDb(RedisAble):
             else:
                 logging.warning("RedisDB.get " + str(k) + " got exception: " + str(e))
 
+    def mget(self, keys: list) -> list:
+        if not self.db or not keys:
+            return [None] * len(keys)
+        values = {}
+        try:
+            for i in range(0, len(keys), 500):
+                batch = keys[i: i + 500]
+                cursor = self.db.execute_sql('select cache_key, cache_value from cache where cache_key in (%s) '
+                                             'and expire_time > now()' % ", ".join(["%s"] * len(batch)), batch)
+                values.update(cursor.fetchall())
+        except Exception as e:
+            if is_table_missing_exception(e):
+                pass
+            else:
+                logging.warning("RedisDB.mget " + str(len(keys)) + " keys got exception: " + str(e))
+        return [values.get(k) for k in keys]
+
+    def mset(self, mapping: dict, exp=3600) -> bool:
+        if not mapping:
+            return True
+        try:
+            expire_time = datetime.now() + timedelta(seconds=exp)
+            items = list(mapping.items())
+            for i in range(0, len(items), 500):
+                batch = items[i: i + 500]
+                params = [p for k, v in batch for p in (k, v, expire_time)]
+                self.db.execute_sql('replace into cache (cache_key, cache_value, expire_time) values %s'
+                                    % ", ".join(["(%s, %s, %s)"] * len(batch)), params)
+            return True
+        except Exception as e:
+            if is_table_missing_exception(e):
+                pass
+            else:
+                logging.warning("RedisDB.mset " + str(len(mapping)) + " keys got exception: " + str(e))
+        return False
+
     def set_obj(self, k, obj, exp=3600):
         try:
             self.set_object(k, obj, exp)
@@ -201,6 +249,92 @@ class OceanBaseRedisDb(RedisAble):
     def transaction(self, key, value, exp=3600):
         return self.setNx(key, value, exp)
 
+    # list, one row per element, keyed by the list key and the insertion time. The list lives as long as its last row,
+    # the earlier ones follow its expiration every CACHE_LIST_REFRESH_INTERVAL seconds rather than on each push, so
+    # they may expire up to two intervals before it. The expired rows, e.g. of the lists no one reads or deletes
+    # anymore, are swept by the pushes.
+    @staticmethod
+    def _list_range(key: str):
+        # all the "key#..." element keys, '$' follows '#'
+        return f"{key}#", f"{key}$"
+
+    def rpush_obj(self, key: str, obj, exp=3600) -> bool:
+        expire_time = datetime.now() + timedelta(seconds=exp)
+        value = json.dumps(obj, ensure_ascii=False)
+        seq = time.time_ns()
+        try:
+            for _ in range(8):
+                try:
+                    self.db.execute_sql('insert into cache (cache_key, cache_value, expire_time) values (%s, %s, %s)',
+                                        (f"{key}#{seq:020d}", value, expire_time))
+                    break
+                except IntegrityError:
+                    seq += 1
+            else:
+                return False
+            self._refresh_list(key, expire_time)
+            self._sweep_expired()
+            return True
+        except Exception as e:
+            if is_table_missing_exception(e):
+                pass
+            else:
+                logging.warning("RedisDB.rpush_obj " + str(key) + " got exception: " + str(e))
+        return False
+
+    def _refresh_list(self, key: str, expire_time: datetime):
+        now = time.monotonic()
+        with self._list_lock:
+            refreshed_at = self._list_refreshed_at.get(key)
+            if refreshed_at is not None and now - refreshed_at < CACHE_LIST_REFRESH_INTERVAL:
+                return
+            if len(self._list_refreshed_at) >= 1024:
+                self._list_refreshed_at = {k: t for k, t in self._list_refreshed_at.items()
+                                           if now - t < CACHE_LIST_REFRESH_INTERVAL}
+            self._list_refreshed_at[key] = now
+        self.db.execute_sql('update cache set expire_time = %s where cache_key >= %s and cache_key < %s '
+                            'and expire_time < %s',
+                            (expire_time, *self._list_range(key),
+                             expire_time - timedelta(seconds=CACHE_LIST_REFRESH_INTERVAL)))
+
+    def _sweep_expired(self):
+        now = time.monotonic()
+        with self._list_lock:
+            if self._swept_at is not None and now - self._swept_at < CACHE_SWEEP_INTERVAL:
+                return
+            self._swept_at = now
+        # past the two refresh intervals the rows of a list may expire before it, the list is gone
+        threshold = datetime.now() - timedelta(seconds=3 * CACHE_LIST_REFRESH_INTERVAL)
+        while True:
+            cursor = self.db.execute_sql('delete from cache where expire_time < %s limit %s',
+                                         (threshold, CACHE_SWEEP_BATCH))
+            if cursor.rowcount < CACHE_SWEEP_BATCH:
+                break
+
+    def lrange_obj(self, key: str) -> list:
+        try:
+            cursor = self.db.execute_sql('select cache_value from cache where cache_key >= %s and cache_key < %s '
+                                         'and (select max(expire_time) from cache where cache_key >= %s '
+                                         'and cache_key < %s) > now() order by cache_key', self._list_range(key) * 2)
+            return [json.loads(row[0]) for row in cursor.fetchall()]
+        except Exception as e:
+            if is_table_missing_exception(e):
+                pass
+            else:
+                logging.warning("RedisDB.lrange_obj " + str(key) + " got exception: " + str(e))
+        return []
+
+    def ldelete(self, key: str) -> bool:
+        try:
+            self.db.execute_sql('delete from cache where cache_key >= %s and cache_key < %s', self._list_range(key))
+            return True
+        except Exception as e:
+            if is_table_missing_exception(e):
+                pass
+            else:
+                logging.warning("RedisDB.ldelete " + str(key) + " got exception: " + str(e))
+        return False
+
     # zset
     def zadd(self, key: str, member: str, score: float):
         try:
@@ -379,60 +513,16 @@ class OceanBaseRedisDb(RedisAble):
             具体参考：https://redis.io/docs/latest/commands/xreadgroup/
         """
         try:
-            try:
-                cursor = self.db.execute_sql("select id from message where stream = %s limit 1", queue_name)
-                ret = cursor.fetchone()
-                if ret is None:
-                    logging.debug(f"RedisDB.queue_consumer queue {queue_name} doesn't exist")
-                    return None
-                cursor = self.db.execute_sql("select id from message_subscribe where stream = %s"
-                                             " and group_name = %s limit 1", (queue_name, group_name))
-                ret = cursor.fetchone()
-                if ret is None:
-                    logging.warning(
-                        f"RedisDB.queue_consumer queue-consumer_group {queue_name}{group_name} doesn't exist")
-                    # 如果该消费者组没有订阅该消息，则新生成订阅关系
-                    with self.db.atomic():
-                        self.db.execute_sql("replace into message_subscribe (stream, group_name, consumer_name) "
-                                            "values (%s, %s, %s)", (queue_name, group_name, consumer_name))
-                        # 生成订阅关系时生成一条 message_id 为 -1 的消费历史，以便后续查询
-                        self.db.execute_sql("replace into message_consumption "
-                                            "(stream, group_name, consumer_name, message_id, ack) "
-                                            "values (%s, %s, %s, %s, %s)",
-                                            (queue_name, group_name, consumer_name, -1, True))
-            except Exception as e:
-                if is_table_missing_exception(e):
-                    pass
-                else:
-                    logging.warning(f"RedisDB.get_unacked_iterator queue {queue_name}-{group_name} failed " + str(e))
+            if not self._ensure_subscription(queue_name, group_name, consumer_name):
+                return None
 
             # 最大取一条记录
             if msg_id == b">":
-                # 锁记录，防止重复消费
                 # 获取没有被任何消费者消费的消息
-                with self.db.atomic():
-                    self.db.execute_sql("select id from message_subscribe where stream = %s for update wait 3"
-                                        , queue_name)
-                    cursor = self.db.execute_sql("select id,message from message where stream = %s "
-                                                 "and consumed = false order by id asc limit %s", (queue_name, 1))
-                    ret = cursor.fetchone()
-                    if ret is None:
-                        return None
-                    else:
-                        message_id = ret[0]
-                        self.db.execute_sql("update message set consumed = true where id = %s", message_id)
-                        self.db.execute_sql("insert into message_consumption "
-                                            "(stream, group_name, consumer_name, message_id)"
-                                            "values (%s, %s, %s, %s)",
-                                            (queue_name, group_name, consumer_name, message_id))
-                        message = ret[1]
-                        logging.debug(
-                            f'*** xreadgroup {queue_name}-{group_name}-{consumer_name}-{msg_id}-{message}-{type(message)}')
-                        res = RedisMsg(self, queue_name, group_name, message_id, message)
-                        return res
+                messages = self._claim_messages(queue_name, group_name, consumer_name, 1)
+                return messages[0] if messages else None
             else:
-                # 获取没有ack的消息
-                self.db.execute_sql("select id from message_subscribe where stream = %s for update wait 3", queue_name)
+                # 获取没有ack的消息, 只读取本消费者自己认领的消息, 无需加锁
                 with self.db.atomic():
                     cursor = self.db.execute_sql(
                         "select H.message_id, M.message from "
@@ -463,6 +553,87 @@ class OceanBaseRedisDb(RedisAble):
                 )
         return None
 
+    def queue_consumer_batch(self, queue_name, group_name, consumer_name, count: int) -> list[RedisMsg]:
+        """
+            消费者一次认领至多 {count} 条没有被任何消费者消费的消息, 语义同 queue_consumer 的 ">"
+        """
+        try:
+            if not self._ensure_subscription(queue_name, group_name, consumer_name):
+                return []
+            return self._claim_messages(queue_name, group_name, consumer_name, count)
+        except Exception as e:
+            if is_table_missing_exception(e):
+                pass
+            else:
+                logging.exception(
+                    "RedisDB.queue_consumer_batch "
+                    + str(queue_name)
+                    + " got exception: "
+                    + str(e)
+                )
+        return []
+
+    def _ensure_subscription(self, queue_name, group_name, consumer_name) -> bool:
+        """
+            队列不存在时返回 False; 若不存在消费者组，则创建订阅关系
+        """
+        try:
+            cursor = self.db.execute_sql("select id from message where stream = %s limit 1", queue_name)
+            ret = cursor.fetchone()
+            if ret is None:
+                logging.debug(f"RedisDB.queue_consumer queue {queue_name} doesn't exist")
+                return False
+            cursor = self.db.execute_sql("select id from message_subscribe where stream = %s"
+                                         " and group_name = %s limit 1", (queue_name, group_name))
+            ret = cursor.fetchone()
+            if ret is None:
+                logging.warning(
+                    f"RedisDB.queue_consumer queue-consumer_group {queue_name}{group_name} doesn't exist")
+                # 如果该消费者组没有订阅该消息，则新生成订阅关系
+                with self.db.atomic():
+                    self.db.execute_sql("replace into message_subscribe (stream, group_name, consumer_name) "
+                                        "values (%s, %s, %s)", (queue_name, group_name, consumer_name))
+                    # 生成订阅关系时生成一条 message_id 为 -1 的消费历史，以便后续查询
+                    self.db.execute_sql("replace into message_consumption "
+                                        "(stream, group_name, consumer_name, message_id, ack) "
+                                        "values (%s, %s, %s, %s, %s)",
+                                        (queue_name, group_name, consumer_name, -1, True))
+        except Exception as e:
+            if is_table_missing_exception(e):
+                pass
+            else:
+                logging.warning(f"RedisDB.get_unacked_iterator queue {queue_name}-{group_name} failed " + str(e))
+        return True
+
+    def _claim_messages(self, queue_name, group_name, consumer_name, count: int) -> list[RedisMsg]:
+        """
+            原子地认领至多 {count} 条未消费的消息。
+            只对认领到的消息行加锁 (skip locked)，被其他消费者锁住的消息直接跳过，
+            不再对 message_subscribe 加全局锁，多个消费者可以并行认领不同的消息
+        """
+        with self.db.atomic():
+            cursor = self.db.execute_sql("select id, message from message where stream = %s "
+                                         "and consumed = false order by id asc limit %s "
+                                         "for update skip locked", (queue_name, count))
+            rows = cursor.fetchall()
+            if not rows:
+                return []
+            message_ids = [row[0] for row in rows]
+            placeholders = ", ".join(["%s"] * len(message_ids))
+            self.db.execute_sql(f"update message set consumed = true where id in ({placeholders})", message_ids)
+            values = []
+            for message_id in message_ids:
+                values.extend([queue_name, group_name, consumer_name, message_id])
+            self.db.execute_sql("insert into message_consumption "
+                                "(stream, group_name, consumer_name, message_id) values "
+                                + ", ".join(["(%s, %s, %s, %s)"] * len(message_ids)), values)
+        res = []
+        for message_id, message in rows:
+            logging.debug(
+                f'*** xreadgroup {queue_name}-{group_name}-{consumer_name}->-{message}-{type(message)}')
+            res.append(RedisMsg(self, queue_name, group_name, message_id, message))
+        return res
+
     def get_pending_msg(self, queue, group_name):
         """
             获取消费者组 {group_name} 对消息队列 {queue} 已经读取，但是没有 ACK 的消息。
@@ -619,6 +790,77 @@ class OceanBaseRedisDb(RedisAble):
         return None
 
 
+# 等锁时的重试间隔: 从毫秒级开始指数退避, 最大不超过 LOCK_WAIT_MAX_INTERVAL 秒
+LOCK_WAIT_INITIAL_INTERVAL = float(os.environ.get("LOCK_WAIT_INITIAL_INTERVAL", "0.05"))
+LOCK_WAIT_MAX_INTERVAL = float(os.environ.get("LOCK_WAIT_MAX_INTERVAL", "2"))
+
+
+class LockWaitStats:
+    """
+        按锁的 key 统计等锁情况: 获取次数、发生竞争的次数、重试次数、累计和最大等待时间
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def record(self, lock_key, wait_seconds, attempts):
+        with self._lock:
+            stat = self._stats.setdefault(lock_key, {
+                "acquired": 0,
+                "contended": 0,
+                "attempts": 0,
+                "total_wait": 0.0,
+                "max_wait": 0.0,
+            })
+            stat["acquired"] += 1
+            stat["attempts"] += attempts
+            if attempts > 1:
+                stat["contended"] += 1
+            stat["total_wait"] += wait_seconds
+            stat["max_wait"] = max(stat["max_wait"], wait_seconds)
+
+    def get(self, lock_key=None):
+        with self._lock:
+            if lock_key is not None:
+                return dict(self._stats.get(lock_key, {}))
+            return {k: dict(v) for k, v in self._stats.items()}
+
+    def snapshot(self, top=20):
+        """
+            用于心跳上报: 累计等待时间最长的 top 个锁的统计, 锁的 key 随知识库增多, 不全部上报
+        """
+        with self._lock:
+            keys = sorted(self._stats, key=lambda k: self._stats[k]["total_wait"], reverse=True)[:top]
+            return {k: {**self._stats[k],
+                        "total_wait": round(self._stats[k]["total_wait"], 3),
+                        "max_wait": round(self._stats[k]["max_wait"], 3)} for k in keys}
+
+
+LOCK_WAIT_STATS = LockWaitStats()
+
+
+async def wait_acquire(lock_key, try_acquire):
+    """
+        反复调用 try_acquire 直到获取到锁。
+        重试间隔从 LOCK_WAIT_INITIAL_INTERVAL 开始指数增长, 并加入随机抖动 (full jitter),
+        避免多个等待者同时重试, 同时持有者释放后等待者能在毫秒级内拿到锁
+    """
+    start = time.monotonic()
+    attempts = 0
+    interval = LOCK_WAIT_INITIAL_INTERVAL
+    while True:
+        attempts += 1
+        if try_acquire():
+            break
+        await trio.sleep(random.uniform(0, interval))
+        interval = min(interval * 2, LOCK_WAIT_MAX_INTERVAL)
+    wait_seconds = time.monotonic() - start
+    LOCK_WAIT_STATS.record(lock_key, wait_seconds, attempts)
+    if attempts > 1:
+        logging.info(f"acquired lock {lock_key} after waiting {wait_seconds:.3f}s, attempts: {attempts}")
+
+
 class MysqlDistributedLock:
     """
         基于关系数据库提供的分布式锁
@@ -649,10 +891,7 @@ class MysqlDistributedLock:
         """
         logging.debug(f"spin_acquire:{self.lock_key}-{self.lock_value}")
         self.delete_if_equal()
-        while True:
-            if self.doAcquire():
-                break
-            await trio.sleep(10)
+        await wait_acquire(self.lock_key, self.doAcquire)
 
     def doAcquire(self):
         """
@@ -26,6 +26,17 @@ class RedisAble:
     def get(self, k):
         raise NotImplementedError("Not implemented")
 
+    @abstractmethod
+    def mget(self, keys: list) -> list:
+        """
+            the values of keys, None for the missing ones
+        """
+        raise NotImplementedError("Not implemented")
+
+    @abstractmethod
+    def mset(self, mapping: dict, exp=3600) -> bool:
+        raise NotImplementedError("Not implemented")
+
     @abstractmethod
     def set_obj(self, k, obj, exp=3600):
         raise NotImplementedError("Not implemented")
@@ -62,6 +73,21 @@ class RedisAble:
     def zrangebyscore(self, key: str, min: float, max: float):
         raise NotImplementedError("Not implemented")
 
+    @abstractmethod
+    def rpush_obj(self, key: str, obj, exp=3600) -> bool:
+        """
+            append obj to the list at key, and (re)set the expiration of the list
+        """
+        raise NotImplementedError("Not implemented")
+
+    @abstractmethod
+    def lrange_obj(self, key: str) -> list:
+        raise NotImplementedError("Not implemented")
+
+    @abstractmethod
+    def ldelete(self, key: str) -> bool:
+        raise NotImplementedError("Not implemented")
+
     @abstractmethod
     def transaction(self, key, value, exp=3600):
         raise NotImplementedError("Not implemented")
@@ -74,6 +100,10 @@ class RedisAble:
     def queue_consumer(self, queue_name, group_name, consumer_name, msg_id=b">") -> Any:
         raise NotImplementedError("Not implemented")
 
+    @abstractmethod
+    def queue_consumer_batch(self, queue_name, group_name, consumer_name, count: int) -> list[Any]:
+        raise NotImplementedError("Not implemented")
+
     @abstractmethod
     def get_unacked_iterator(self, queue_names: list[str], group_name, consumer_name):
         raise NotImplementedError("Not implemented")
@@ -23,9 +23,8 @@ import valkey as redis
 from rag import settings
 from rag.utils import singleton
 from valkey.lock import Lock
-import trio
 
-from rag.utils.ob_redis_conn import MysqlDistributedLock, OceanBaseRedisDb
+from rag.utils.ob_redis_conn import MysqlDistributedLock, OceanBaseRedisDb, wait_acquire
 from rag.utils.redis_able import RedisAble
 
 
@@ -131,6 +130,30 @@ class RedisDB(RedisAble):
             logging.warning("RedisDB.get " + str(k) + " got exception: " + str(e))
             self.__open__()
 
+    def mget(self, keys: list) -> list:
+        if not self.REDIS or not keys:
+            return [None] * len(keys)
+        try:
+            return self.REDIS.mget(keys)
+        except Exception as e:
+            logging.warning("RedisDB.mget " + str(len(keys)) + " keys got exception: " + str(e))
+            self.__open__()
+        return [None] * len(keys)
+
+    def mset(self, mapping: dict, exp=3600) -> bool:
+        if not mapping:
+            return True
+        try:
+            pipeline = self.REDIS.pipeline(transaction=False)
+            for k, v in mapping.items():
+                pipeline.set(k, v, exp)
+            pipeline.execute()
+            return True
+        except Exception as e:
+            logging.warning("RedisDB.mset " + str(len(mapping)) + " keys got exception: " + str(e))
+            self.__open__()
+        return False
+
     def set_obj(self, k, obj, exp=3600):
         try:
             self.REDIS.set(k, json.dumps(obj, ensure_ascii=False), exp)
@@ -216,6 +239,29 @@ class RedisDB(RedisAble):
             self.__open__()
         return None
 
+    def rpush_obj(self, key: str, obj, exp=3600) -> bool:
+        try:
+            pipeline = self.REDIS.pipeline(transaction=False)
+            pipeline.rpush(key, json.dumps(obj, ensure_ascii=False))
+            pipeline.expire(key, exp)
+            pipeline.execute()
+            return True
+        except Exception as e:
+            logging.warning("RedisDB.rpush_obj " + str(key) + " got exception: " + str(e))
+            self.__open__()
+        return False
+
+    def lrange_obj(self, key: str) -> list:
+        try:
+            return [json.loads(v) for v in self.REDIS.lrange(key, 0, -1)]
+        except Exception as e:
+            logging.warning("RedisDB.lrange_obj " + str(key) + " got exception: " + str(e))
+            self.__open__()
+        return []
+
+    def ldelete(self, key: str) -> bool:
+        return self.delete(key)
+
     def transaction(self, key, value, exp=3600):
         try:
             pipeline = self.REDIS.pipeline(transaction=True)
@@ -244,6 +290,14 @@ class RedisDB(RedisAble):
 
     def queue_consumer(self, queue_name, group_name, consumer_name, msg_id=b">") -> RedisMsg:
         """https://redis.io/docs/latest/commands/xreadgroup/"""
+        messages = self._read_group(queue_name, group_name, consumer_name, msg_id, 1)
+        return messages[0] if messages else None
+
+    def queue_consumer_batch(self, queue_name, group_name, consumer_name, count: int) -> list[RedisMsg]:
+        """Claim at most `count` new messages of the queue for the consumer at once."""
+        return self._read_group(queue_name, group_name, consumer_name, b">", count)
+
+    def _read_group(self, queue_name, group_name, consumer_name, msg_id, count: int) -> list[RedisMsg]:
         for _ in range(3):
             try:
 
@@ -263,19 +317,16 @@ class RedisDB(RedisAble):
                 args = {
                     "groupname": group_name,
                     "consumername": consumer_name,
-                    "count": 1,
+                    "count": count,
                     "block": 5,
                     "streams": {queue_name: msg_id},
                 }
                 messages = self.REDIS.xreadgroup(**args)
                 if not messages:
-                    return None
+                    return []
                 stream, element_list = messages[0]
-                if not element_list:
-                    return None
-                msg_id, payload = element_list[0]
-                res = RedisMsg(self.REDIS, queue_name, group_name, msg_id, payload)
-                return res
+                return [RedisMsg(self.REDIS, queue_name, group_name, msg_id, payload)
+                        for msg_id, payload in element_list]
             except Exception as e:
                 if str(e) == 'no such key':
                     pass
@@ -287,7 +338,7 @@ class RedisDB(RedisAble):
                         + str(e)
                     )
                     self.__open__()
-        return None
+        return []
 
     def get_unacked_iterator(self, queue_names: list[str], group_name, consumer_name):
         try:
@@ -404,10 +455,7 @@ class RedisDistributedLock:
 
     async def spin_acquire(self):
         REDIS_CONN.delete_if_equal(self.lock_key, self.lock_value)
-        while True:
-            if self.lock.acquire(token=self.lock_value):
-                break
-            await trio.sleep(10)
+        await wait_acquire(self.lock_key, lambda: self.lock.acquire(token=self.lock_value))
 
     def release(self):
         REDIS_CONN.delete_if_equal(self.lock_key, self.lock_value)
@@ -0,0 +1,150 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+import re
+
+import pytest
+
+pytest.importorskip("pyobvector")
+
+from rag.utils.doc_store_conn import MatchDenseExpr, OrderByExpr  # noqa: E402
+from rag.utils.ob_conn import OBConnection, SchemaMetadataCache, merge_ranked_chunks  # noqa: E402
+
+# the class behind the @singleton factory, to be instantiated without connecting
+_OBConnection = next(c.cell_contents for c in OBConnection.__closure__ if isinstance(c.cell_contents, type))
+
+# the hits of each table, in descending score order; the scores of the two tables interleave
+TABLE_SCORES = {
+    "ragflow_a": [0.95, 0.9, 0.7, 0.5, 0.3, 0.1],
+    "ragflow_b": [0.85, 0.8, 0.6, 0.4, 0.2],
+}
+
+
+class _Rows:
+    def __init__(self, rows):
+        self._rows = rows
+
+    def fetchall(self):
+        return self._rows
+
+    def fetchone(self):
+        return self._rows[0] if self._rows else None
+
+
+class _FakeClient:
+    """Answers the vector search statements of OBConnection from TABLE_SCORES."""
+
+    def __init__(self):
+        self.sqls = []
+
+    def perform_raw_text_sql(self, sql):
+        table = re.search(r"FROM (\w+)", sql).group(1)
+        if sql.startswith("SELECT COUNT("):
+            return _Rows([(len(TABLE_SCORES[table]),)])
+        self.sqls.append(sql)
+        limit = int(re.search(r"APPROXIMATE LIMIT (\d+)", sql).group(1))
+        offset = re.search(r"OFFSET (\d+)", sql)
+        offset = int(offset.group(1)) if offset else 0
+        hits = [(f"{table}-{i}", score) for i, score in enumerate(TABLE_SCORES[table])]
+        return _Rows(hits[offset: offset + limit])
+
+
+def _connection(search_parallelism=1):
+    conn = _OBConnection.__new__(_OBConnection)
+    conn.client = _FakeClient()
+    conn.es = None
+    conn.enable_fulltext_search = True
+    conn.search_original_content = False
+    conn.use_fulltext_hint = False
+    conn.search_parallelism = search_parallelism
+    conn._table_exists_cached = lambda index_name: True
+    conn._metadata_cache = SchemaMetadataCache(ttl=600.0, missing_ttl=10.0)
+    return conn
+
+
+def _expected_page(offset, limit):
+    hits = sorted(
+        ((f"{table}-{i}", score) for table, scores in TABLE_SCORES.items() for i, score in enumerate(scores)),
+        key=lambda hit: hit[1], reverse=True)
+    return [chunk_id for chunk_id, _ in hits[offset: offset + limit]]
+
+
+@pytest.mark.parametrize("offset,limit", [(0, 3), (2, 3), (3, 4), (8, 5), (10, 5)])
+def test_search_multi_table_page(offset, limit):
+    conn = _connection()
+    match = MatchDenseExpr("q_3_vec", [0.1, 0.2, 0.3], "float", "cosine", 100, {"similarity": 0.0})
+    res = conn.search(["id"], [], {}, [match], OrderByExpr(), offset, limit,
+                      sorted(TABLE_SCORES), ["kb"])
+    assert [chunk["id"] for chunk in res.chunks] == _expected_page(offset, limit)
+    # each table is asked for the hits up to the end of the page, from its first one
+    for sql in conn.client.sqls:
+        assert f"APPROXIMATE LIMIT {offset + limit}" in sql
+        assert "OFFSET" not in sql
+
+
+def test_merge_ranked_chunks():
+    a = [{"id": "a0", "_score": 0.9}, {"id": "a1", "_score": 0.5}, {"id": "a2", "_score": 0.1}]
+    b = [{"id": "b0", "_score": 0.7}, {"id": "b1", "_score": 0.3}]
+    assert [c["id"] for c in merge_ranked_chunks([a, b], 1, 3)] == ["b0", "a1", "b1"]
+    assert [c["id"] for c in merge_ranked_chunks([a, b], 4, 3)] == ["a2"]
+    assert [c["id"] for c in merge_ranked_chunks([a, b], 0, 0)] == ["a0", "b0", "a1", "b1", "a2"]
+
+
+class _TableMissingError(Exception):
+    """The error of pymysql on a missing table, as wrapped by sqlalchemy."""
+
+    def __init__(self):
+        super().__init__("(pymysql.err.ProgrammingError) (1146, \"Table 'ragflow_a' doesn't exist\")")
+        self.orig = Exception(1146, "Table 'ragflow_a' doesn't exist")
+
+
+def test_search_retries_on_schema_change():
+    conn = _connection()
+    perform_raw_text_sql = conn.client.perform_raw_text_sql
+    failures = []
+
+    def fail_once(sql):
+        if not failures:
+            failures.append(sql)
+            raise _TableMissingError()
+        return perform_raw_text_sql(sql)
+
+    conn.client.perform_raw_text_sql = fail_once
+    conn._metadata_cache.set(("table", "ragflow_a"), True)
+    match = MatchDenseExpr("q_3_vec", [0.1, 0.2, 0.3], "float", "cosine", 100, {"similarity": 0.0})
+    res = conn.search(["id"], [], {}, [match], OrderByExpr(), 0, 3, ["ragflow_a"], ["kb"])
+    assert [chunk["id"] for chunk in res.chunks] == ["ragflow_a-0", "ragflow_a-1", "ragflow_a-2"]
+    assert len(failures) == 1
+    # the cached schema of the table is evicted
+    assert conn._metadata_cache.stats()["size"] == 0
+
+
+def test_schema_metadata_cache_missing():
+    cache = SchemaMetadataCache(ttl=600.0, missing_ttl=10.0)
+    checks = []
+
+    def check(exists):
+        def check_func():
+            checks.append(exists)
+            return exists
+        return check_func
+
+    assert not cache.exists(("table", "t"), check(False))
+    assert not cache.exists(("table", "t"), check(False))
+    assert checks == [False]
+    # a cached miss is checked again when it can't be trusted
+    assert cache.exists(("table", "t"), check(True), trust_missing=False)
+    assert cache.exists(("table", "t"), check(False), trust_missing=False)
+    assert checks == [False, True]